@@ -0,0 +1,242 @@
+"""
+Profilowanie żądań w działającym serwisie (opcjonalne, API_PROFILING = True).
+
+Dla każdego żądania mierzone są: liczba i czas zapytań SQL, czas zapytań do OpenWeather,
+czas serializacji oraz czas całego żądania. Wyniki trafiają do nagłówka Server-Timing
+i do statystyk procesu (p50/p95 dla każdego widoku) dostępnych w /api/profiling/.
+Część żądań (API_PROFILING_SAMPLE_RATE) jest dodatkowo profilowana cProfile - zachowywane
+są profile żądań wolniejszych niż API_PROFILING_SLOW_MS.
+"""
+import cProfile
+import io
+import os
+import pstats
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+
+# profil bieżącego żądania; wątki pul i sync_to_async dziedziczą go razem z kontekstem
+current_profile = ContextVar("current_profile", default=None)
+
+SECTIONS = ("db", "upstream", "serializer")
+
+
+class RequestProfile:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.durations = dict.fromkeys(SECTIONS, 0.0)
+        self.counts = dict.fromkeys(SECTIONS, 0)
+
+    def add(self, section, elapsed):
+        # zapytania do OpenWeather mogą być mierzone równolegle w wątkach puli
+        with self._lock:
+            self.durations[section] += elapsed
+            self.counts[section] += 1
+
+    def server_timing(self, total):
+        entries = [
+            f'{section};desc="{self.counts[section]} calls";dur={self.durations[section] * 1000:.1f}'
+            for section in SECTIONS
+        ]
+        entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+
+def record(section, elapsed):
+    """Dolicza czas do profilu bieżącego żądania (jeśli jest profilowane)."""
+    profile = current_profile.get()
+    if profile is not None:
+        profile.add(section, elapsed)
+
+
+def record_query(execute, sql, params, many, context):
+    profile = current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.add("db", time.perf_counter() - started)
+
+
+@contextmanager
+def query_wrappers():
+    """
+    Mierzy zapytania żądania na wszystkich bazach. Wrappery są zakładane na czas żądania
+    i zdejmowane w odwrotnej kolejności, więc nie psują stosu execute_wrappers innego kodu.
+    """
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(record_query))
+        yield
+
+
+_serializing = ContextVar("serializing", default=False)
+
+
+class ProfiledSerializerMixin:
+    """Dolicza czas serializacji i walidacji do profilu żądania (zagnieżdżone serializatory tylko raz)."""
+
+    def _profiled(self, method, data):
+        if _serializing.get() or current_profile.get() is None:
+            return method(data)
+        token = _serializing.set(True)
+        started = time.perf_counter()
+        try:
+            return method(data)
+        finally:
+            record("serializer", time.perf_counter() - started)
+            _serializing.reset(token)
+
+    def to_representation(self, instance):
+        return self._profiled(super().to_representation, instance)
+
+    def to_internal_value(self, data):
+        return self._profiled(super().to_internal_value, data)
+
+
+class RequestStats:
+    """Statystyki profilowanych żądań w tym procesie: ostatnie próbki dla każdego widoku i profile wolnych żądań."""
+
+    def __init__(self, max_samples=1000, max_slow_profiles=20):
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=max_samples))
+        self._counts = defaultdict(int)
+        self.slow_profiles = deque(maxlen=max_slow_profiles)
+
+    def record(self, key, profile, total):
+        with self._lock:
+            self._counts[key] += 1
+            self._samples[key].append((total, profile.counts["db"], profile.durations))
+
+    def record_slow_profile(self, key, total, report, path=None):
+        with self._lock:
+            self.slow_profiles.append({
+                "route": key,
+                "at": timezone.now().isoformat(),
+                "total_ms": round(total * 1000, 2),
+                "file": path,
+                "profile": report,
+            })
+
+    def snapshot(self):
+        with self._lock:
+            samples = {key: list(values) for key, values in self._samples.items()}
+            counts = dict(self._counts)
+            slow_profiles = list(self.slow_profiles)
+
+        def percentile(values, p):
+            return round(values[min(len(values) - 1, int(p / 100 * len(values)))] * 1000, 2)
+
+        routes = {}
+        for key, values in sorted(samples.items()):
+            totals = sorted(total for total, _, _ in values)
+            routes[key] = {
+                "count": counts[key],
+                "p50_ms": percentile(totals, 50),
+                "p95_ms": percentile(totals, 95),
+                "max_ms": round(totals[-1] * 1000, 2),
+                "avg_db_queries": round(sum(queries for _, queries, _ in values) / len(values), 1),
+                **{
+                    f"avg_{section}_ms": round(sum(durations[section] for _, _, durations in values) / len(values) * 1000, 2)
+                    for section in SECTIONS
+                },
+            }
+        return {"routes": routes, "slow_requests": slow_profiles}
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+            self.slow_profiles.clear()
+
+
+request_stats = RequestStats()
+
+
+def route_key(request):
+    match = getattr(request, "resolver_match", None)
+    return f"{request.method} {match.view_name if match else '<unresolved>'}"
+
+
+class ProfilingMiddleware:
+    """Profiluje żądania, gdy API_PROFILING = True; w przeciwnym razie Django pomija middleware."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.API_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        profile, token, started = self.start()
+        profiler = self.start_sampling()
+        try:
+            with query_wrappers():
+                response = self.get_response(request)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            current_profile.reset(token)
+        return self.finish(request, response, profile, started, profiler)
+
+    async def __acall__(self, request):
+        # cProfile obejmuje tylko bieżący wątek, więc żądania asynchroniczne nie są próbkowane
+        profile, token, started = self.start()
+        try:
+            # połączenia są lokalne dla kontekstu, więc wrapper widzą też wątki sync_to_async tego żądania
+            with query_wrappers():
+                response = await self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        return self.finish(request, response, profile, started)
+
+    def start(self):
+        profile = RequestProfile()
+        return profile, current_profile.set(profile), time.perf_counter()
+
+    def start_sampling(self):
+        if random.random() >= settings.API_PROFILING_SAMPLE_RATE:
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # inny profiler jest już aktywny
+            return None
+        return profiler
+
+    def finish(self, request, response, profile, started, profiler=None):
+        total = time.perf_counter() - started
+        key = route_key(request)
+        response["Server-Timing"] = profile.server_timing(total)
+        request_stats.record(key, profile, total)
+        if profiler is not None and total * 1000 >= settings.API_PROFILING_SLOW_MS:
+            self.save_profile(key, total, profiler)
+        return response
+
+    def save_profile(self, key, total, profiler):
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(30)
+        path = None
+        if settings.API_PROFILING_DUMP_DIR:
+            os.makedirs(settings.API_PROFILING_DUMP_DIR, exist_ok=True)
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{key.replace(' ', '-').replace(':', '-')}-{int(total * 1000)}ms.prof"
+            path = os.path.join(settings.API_PROFILING_DUMP_DIR, name)
+            profiler.dump_stats(path)
+        request_stats.record_slow_profile(key, total, output.getvalue(), path)
@@ -25,6 +25,86 @@ SECRET_KEY = 'django-insecure-f*gv1dajbk@r%@h27en94^hjv2e&ue-r4$e#a0#4s+q^o3=_7h
 # Api key for OpenWeather Api
 OPENWEATHER_API_KEY = 'api key'
 
+# Maksymalna liczba równoległych zapytań do OpenWeather przy odświeżaniu trasy
+OPENWEATHER_MAX_WORKERS = 8
+
+# Adres dziennej prognozy OpenWeather (np. lokalny serwer testowy w benchmarkach)
+OPENWEATHER_BASE_URL = "https://api.openweathermap.org/data/2.5/forecast/daily"
+
+# Połączenia z OpenWeather: rozmiar puli keep-alive, timeout (połączenie, odczyt) w sekundach
+# oraz ponawianie zapytań po 429/5xx z wykładniczym odstępem (z uwzględnieniem Retry-After)
+OPENWEATHER_POOL_SIZE = 16
+OPENWEATHER_TIMEOUT = (3.05, 10)
+OPENWEATHER_RETRIES = 3
+OPENWEATHER_RETRY_BACKOFF = 0.5
+# Górna granica odstępu przed ponowieniem (w sekundach), nawet jeśli Retry-After każe czekać dłużej
+OPENWEATHER_MAX_RETRY_AFTER = 30
+# Limit równoczesnych połączeń klienta asynchronicznego (ASGI) - oczekujące zapytania nie zajmują wątków,
+# więc może być znacznie większy niż pula wątków wersji synchronicznej
+OPENWEATHER_ASYNC_MAX_CONNECTIONS = 100
+
+# Wspólny dla wszystkich procesów limit zapytań do OpenWeather (kubełek tokenów w bazie danych):
+# zapytań na minutę (0 wyłącza limit) i liczba zapytań, które można wysłać naraz po przestoju -
+# razem nie więcej niż 60 na minutę dozwolonych w darmowym planie. MAX_WAIT to maksymalny czas
+# oczekiwania na token (w sekundach) dla klas priorytetu; interaktywne zapytania mają pierwszeństwo
+OPENWEATHER_RATE_LIMIT = 50
+OPENWEATHER_RATE_LIMIT_BURST = 10
+OPENWEATHER_RATE_LIMIT_MAX_WAIT = {"interactive": 10, "background": 120, "prewarm": 600}
+
+# Cache odpowiedzi OpenWeather (w sekundach); po upływie TTL przez STALE_TTL
+# zwracane są stare dane, a odświeżenie odbywa się w tle
+OPENWEATHER_CACHE_TTL = 600
+OPENWEATHER_CACHE_STALE_TTL = 3600
+OPENWEATHER_CACHE_MAX_SIZE = 1024
+# Liczba wątków odświeżających w tle nieaktualne wpisy (wspólna pula procesu)
+OPENWEATHER_CACHE_REFRESH_WORKERS = 4
+# True - użyj cache Django (CACHES['default']) zamiast pamięci procesu
+OPENWEATHER_CACHE_USE_DJANGO = False
+
+# Liczba tras odświeżanych równolegle przez worker kolejki (manage.py run_refresh_worker)
+FORECAST_REFRESH_WORKERS = 4
+# Zadanie przetwarzane dłużej niż tyle sekund uznaje się za porzucone (np. zabity worker):
+# wraca do kolejki, a po MAX_ATTEMPTS podjęciach jest oznaczane jako nieudane
+FORECAST_REFRESH_JOB_TIMEOUT = 600
+FORECAST_REFRESH_JOB_MAX_ATTEMPTS = 3
+
+# Miasta oddalone od siebie o nie więcej niż tyle km dzielą jedno zapytanie
+# do OpenWeather (po współrzędnych); 0 wyłącza współdzielenie
+FORECAST_SHARING_RADIUS_KM = 10
+
+# Miasto pobrane w ciągu tylu sekund nie jest pobierane ponownie (o ile ma już wszystkie dni z okna)
+FORECAST_FRESHNESS_SECONDS = 900
+
+# Wstępne pobieranie prognoz dla nadchodzących tras (manage.py prewarm_forecasts):
+# liczba miast w porcji i limit zapytań do OpenWeather na minutę
+FORECAST_PREWARM_BATCH_SIZE = 20
+FORECAST_PREWARM_RATE_LIMIT = 60
+
+# Archiwum prognoz (ForecastHistory, partycje miesięczne): liczba miesięcy zachowywanych przez
+# manage.py prune_forecast_history oraz wiek (w dniach) przeszłych dni usuwanych z tabeli bieżących prognoz
+FORECAST_HISTORY_RETENTION_MONTHS = 12
+FORECAST_LIVE_RETENTION_DAYS = 30
+
+# Czas (w sekundach) przechowywania wyrenderowanych odpowiedzi API (klucz zawiera ETag,
+# więc zmiana danych od razu powoduje nowe renderowanie)
+API_RESPONSE_CACHE_TTL = 300
+
+# Maksymalna liczba tras w jednym żądaniu importu (/api/route/import/)
+ROUTE_IMPORT_MAX_ROUTES = 10000
+
+# Maksymalna liczba okien (miasto, od, do) w jednym zapytaniu /api/forecast_data/query/
+FORECAST_QUERY_MAX_WINDOWS = 1000
+
+# Profilowanie żądań (PUS.profiling.ProfilingMiddleware): liczba i czas zapytań SQL, czas zapytań
+# do OpenWeather, serializacji i całego żądania w nagłówku Server-Timing oraz statystyki p50/p95
+# dla widoków w /api/profiling/. Przy False middleware jest pomijane i nie dodaje narzutu
+API_PROFILING = False
+# Odsetek żądań (0-1) profilowanych cProfile; zachowywane są profile żądań wolniejszych niż SLOW_MS
+# (ostatnie w /api/profiling/, a jeśli ustawiono DUMP_DIR - także jako pliki .prof)
+API_PROFILING_SAMPLE_RATE = 0.0
+API_PROFILING_SLOW_MS = 500
+API_PROFILING_DUMP_DIR = None
+
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
@@ -48,6 +128,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # pierwsze, żeby czas całego żądania obejmował pozostałe middleware
+    'PUS.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -0,0 +1,132 @@
+import hashlib
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.db.models.signals import post_delete, post_save
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from PUS import settings
+from database_manager.models import Route, RouteCity, ForecastData, Recommendation, ScopeLastWrite
+
+FORECAST_SCOPE = ScopeLastWrite.FORECAST_SCOPE
+
+
+def route_owner_id(instance):
+    if isinstance(instance, Route):
+        return instance.user_id
+    if type(instance).route.is_cached(instance):
+        return instance.route.user_id
+    return Route.objects.filter(pk=instance.route_id).values_list("user_id", flat=True).first()
+
+
+def touch(sender, instance, **kwargs):
+    """
+    Zapamiętuje czas zapisu - zmienia ETag i Last-Modified.
+    Czas trafia do bazy (jedno INSERT ... ON CONFLICT), więc widzą go wszystkie procesy serwera.
+    """
+    scope = FORECAST_SCOPE if sender is ForecastData else route_owner_id(instance)
+    if scope is not None:
+        ScopeLastWrite.objects.touch([scope])
+
+
+def last_writes(scopes):
+    """Czasy ostatnich zapisów w podanych zakresach - jedno zapytanie."""
+    written = dict(ScopeLastWrite.objects.filter(scope__in=[str(scope) for scope in scopes])
+                   .values_list("scope", "written_at"))
+    return [written.get(str(scope)) for scope in scopes]
+
+
+def connect_signals():
+    for model in (Route, RouteCity, ForecastData, Recommendation):
+        post_save.connect(touch, sender=model, dispatch_uid=f"api_cache_touch_save_{model.__name__}")
+    # post_delete tylko dla tras: odbiornik na postojach, rekomendacjach czy prognozach wyłącza szybkie
+    # kasowanie Django (każdy wiersz jest ładowany i odnotowywany osobno) - usunięcie trasy z kaskadą
+    # odnotowuje jeden zapis właściciela, a usunięcia masowe i przez API wywołują ScopeLastWrite.objects.touch
+    post_delete.connect(touch, sender=Route, dispatch_uid="api_cache_touch_delete_Route")
+
+
+class TouchOnDestroyMixin:
+    """Odnotowuje usunięcie pojedynczego obiektu przez API (bez odbiorników post_delete na tych modelach)."""
+    def perform_destroy(self, instance):
+        scope = FORECAST_SCOPE if isinstance(instance, ForecastData) else route_owner_id(instance)
+        super().perform_destroy(instance)
+        if scope is not None:
+            ScopeLastWrite.objects.touch([scope])
+
+
+class ConditionalGetMixin:
+    """
+    ETag i Last-Modified dla list i szczegółów, liczone z tanich agregatów
+    (liczba wierszy, max id, max updated_at) zamiast z wyrenderowanej odpowiedzi.
+    Zgodny If-None-Match / If-Modified-Since daje 304 bez serializacji, a wyrenderowane
+    odpowiedzi są trzymane w cache pod kluczem zawierającym ETag (cache procesu wystarcza - ETag
+    liczony jest z bazy, więc nieaktualna odpowiedź nigdy nie zostanie trafiona).
+    Operacje masowe (bulk_create/bulk_update) nie wysyłają sygnałów, ale ustawiają updated_at.
+    """
+    def get_validator_querysets(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.action == 'retrieve':
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        return [queryset]
+
+    def get_validator_scopes(self):
+        return [self.request.user.pk]
+
+    def get_validators(self, request):
+        """Zwraca (etag, last_modified, exists) - exists jest fałszywe dla szczegółów nieistniejącego obiektu."""
+        parts = [request.user.pk, request.get_full_path(), request.accepted_renderer.media_type]
+        modified = []
+        counts = []
+        for queryset in self.get_validator_querysets():
+            stats = queryset.order_by().aggregate(count=Count('id'), max_id=Max('id'), updated=Max('updated_at'))
+            parts.extend(stats.values())
+            modified.append(stats['updated'])
+            counts.append(stats['count'])
+        for last_write in last_writes(self.get_validator_scopes()):
+            parts.append(last_write)
+            modified.append(last_write)
+
+        modified = [value for value in modified if value is not None]
+        etag = hashlib.md5(repr(parts).encode()).hexdigest()
+        exists = self.action != 'retrieve' or bool(counts and counts[0])
+        return etag, max(modified) if modified else None, exists
+
+    @staticmethod
+    def not_modified(request, etag, last_modified):
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            etags = [value.removeprefix('W/') for value in parse_etags(if_none_match)]
+            return etag in etags or '*' in etags
+        since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        return since is not None and last_modified is not None and int(last_modified.timestamp()) <= since
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        etag, last_modified, exists = self.get_validators(request)
+        quoted_etag = quote_etag(etag)
+        cache_key = f"api:response:{request.user.pk}:{etag}"
+
+        #nieistniejący obiekt nie jest "niezmieniony" (także dla If-None-Match: *) - handler zwróci 404
+        if exists and self.not_modified(request, quoted_etag, last_modified):
+            response = HttpResponseNotModified()
+        elif (cached := cache.get(cache_key)) is not None:
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+        else:
+            response = handler(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                response.add_post_render_callback(
+                    lambda rendered: cache.set(cache_key, (rendered.content, rendered['Content-Type']),
+                                               settings.API_RESPONSE_CACHE_TTL)
+                )
+
+        response['ETag'] = quoted_etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(super().retrieve, request, *args, **kwargs)
@@ -0,0 +1,171 @@
+import io
+import json
+import tempfile
+from rest_framework.exceptions import NotAcceptable, ValidationError
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# kolumny eksportu i ich typy w NumPy
+EXPORT_COLUMNS = {
+    "city_id": "int64",
+    "date": "datetime64[D]",
+    "temp": "float64",
+    "feels_like": "float64",
+    "pressure": "int32",
+    "humidity": "int32",
+    "min_temp": "float64",
+    "max_temp": "float64",
+    "clouds": "int32",
+    "wind_speed": "float64",
+    "rain": "float64",
+    "precipitation_probability": "float64",
+    "description": "str",
+    "main_weather": "str",
+}
+EXPORT_CHUNK_SIZE = 2000
+
+# typy kolumn w Parquet - jawny schemat, bo porcja z samymi NULL-ami nie pozwala wywnioskować typu
+PARQUET_TYPES = {
+    "int64": "int64",
+    "int32": "int32",
+    "float64": "float64",
+    "datetime64[D]": "date32",
+    "str": "string",
+}
+
+CONTENT_TYPES = {
+    "npz": "application/octet-stream",
+    "parquet": "application/vnd.apache.parquet",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def available_formats():
+    formats = []
+    if np is not None:
+        formats.append("npz")
+    if pa is not None:
+        formats.append("parquet")
+    formats.append("ndjson")
+    return formats
+
+
+def resolve_format(requested=None):
+    """
+    Żądany format albo - gdy go nie podano - najlepszy dostępny (NDJSON zawsze działa).
+    Nieznany format to błąd 400, a znany, ale bez zainstalowanej biblioteki - 406.
+    """
+    formats = available_formats()
+    if not requested:
+        return formats[0]
+    if requested not in CONTENT_TYPES:
+        raise ValidationError({"output": [f"Nieznany format eksportu: {requested}. Dostępne: {', '.join(formats)}."]})
+    if requested not in formats:
+        raise NotAcceptable(f"Format {requested} jest niedostępny na tym serwerze. Dostępne: {', '.join(formats)}.")
+    return requested
+
+
+def iter_column_chunks(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Porcje {kolumna: [wartości]} prosto z values_list - bez obiektów modelu i serializerów."""
+    names = list(EXPORT_COLUMNS)
+    rows = queryset.order_by("city_id", "date").values_list(*names).iterator(chunk_size=chunk_size)
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield dict(zip(names, map(list, zip(*chunk))))
+            chunk = []
+    if chunk:
+        yield dict(zip(names, map(list, zip(*chunk))))
+
+
+def collect_columns(queryset):
+    columns = {name: [] for name in EXPORT_COLUMNS}
+    for chunk in iter_column_chunks(queryset):
+        for name, values in chunk.items():
+            columns[name].extend(values)
+    return columns
+
+
+def export_npz(queryset, file):
+    columns = collect_columns(queryset)
+    arrays = {
+        name: np.array([value or "" for value in values] if dtype == "str" else values, dtype=dtype)
+        for (name, dtype), values in zip(EXPORT_COLUMNS.items(), columns.values())
+    }
+    np.savez_compressed(file, **arrays)
+
+
+def export_npz_file(queryset):
+    """Archiwum npz w pliku tymczasowym (usuwanym po zamknięciu) - gotowe do wysłania przez FileResponse."""
+    file = tempfile.TemporaryFile()
+    try:
+        export_npz(queryset, file)
+    except BaseException:
+        file.close()
+        raise
+    file.seek(0)
+    return file
+
+
+def parquet_schema():
+    return pa.schema([(name, getattr(pa, PARQUET_TYPES[dtype])()) for name, dtype in EXPORT_COLUMNS.items()])
+
+
+class StreamSink(io.RawIOBase):
+    """Plik tylko do zapisu, z którego na bieżąco odbieramy zapisane bajty (tell liczy całość)."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_parquet(queryset):
+    """Plik Parquet wysyłany po jednej grupie wierszy na porcję - w pamięci jest tylko bieżąca porcja."""
+    schema = parquet_schema()
+    sink = StreamSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for chunk in iter_column_chunks(queryset):
+            writer.write_table(pa.table(chunk, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def export_parquet(queryset, file):
+    for data in iter_parquet(queryset):
+        file.write(data)
+
+
+def iter_ndjson(queryset):
+    """Każda linia to porcja danych w układzie kolumnowym: {"city_id": [...], "date": [...], ...}."""
+    for chunk in iter_column_chunks(queryset):
+        yield json.dumps(chunk, default=str) + "\n"
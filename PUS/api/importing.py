@@ -0,0 +1,62 @@
+from django.db import transaction
+from rest_framework import serializers
+from database_manager.models import City, Route, RouteCity
+from .serializers import RouteImportSerializer
+
+IMPORT_BATCH_SIZE = 1000
+
+
+def validate_routes(items):
+    """
+    Waliduje trasy z importu. Zwraca (poprawne trasy [(indeks, dane)], błędy {indeks: szczegóły}).
+    Istnienie wszystkich miast jest sprawdzane jednym zapytaniem.
+    """
+    serializer = RouteImportSerializer()
+    valid = []
+    errors = {}
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, serializer.run_validation(item)))
+        except serializers.ValidationError as e:
+            errors[index] = e.detail
+
+    city_ids = {route_city['city'] for _, route in valid for route_city in route['route_cities']}
+    existing = set(City.objects.filter(id__in=city_ids).values_list('id', flat=True)) if city_ids else set()
+    for index, route in valid:
+        stops = route['route_cities']
+        if any(route_city['city'] not in existing for route_city in stops):
+            errors[index] = {"route_cities": [
+                {} if route_city['city'] in existing else {"city": [f"Nie ma miasta o id {route_city['city']}"]}
+                for route_city in stops
+            ]}
+
+    return [(index, route) for index, route in valid if index not in errors], errors
+
+
+def create_routes(user, routes):
+    """Zapisuje trasy i ich postoje dwoma wsadowymi INSERT-ami w jednej transakcji."""
+    with transaction.atomic():
+        created = Route.objects.bulk_create(
+            [Route(user=user, name=route['name'], starts_at=route['starts_at'], ends_at=route['ends_at'])
+             for route in routes],
+            batch_size=IMPORT_BATCH_SIZE,
+        )
+        RouteCity.objects.bulk_create(
+            [RouteCity(route=route, city_id=route_city['city'], position=route_city['position'],
+                       arrival_date=route_city['arrival_date'], departure_date=route_city['departure_date'])
+             for route, data in zip(created, routes) for route_city in data['route_cities']],
+            batch_size=IMPORT_BATCH_SIZE,
+        )
+    return created
+
+
+def import_routes(user, items, skip_invalid=False):
+    """
+    Import wielu tras naraz. Przy błędach w którejkolwiek trasie nic nie jest zapisywane,
+    chyba że skip_invalid=True - wtedy zapisywane są poprawne trasy.
+    Zwraca (utworzone trasy, błędy {indeks trasy: szczegóły}).
+    """
+    valid, errors = validate_routes(items)
+    if errors and not skip_invalid:
+        return [], errors
+    return create_routes(user, [route for _, route in valid]), errors
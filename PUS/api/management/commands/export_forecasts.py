@@ -0,0 +1,50 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from database_manager.models import ForecastData
+from api.export import available_formats, iter_ndjson, export_npz, export_parquet
+
+
+class Command(BaseCommand):
+    help = "Eksportuje prognozy w układzie kolumnowym (npz, parquet lub ndjson)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", "-o", default="-",
+                            help="Plik wynikowy; '-' oznacza standardowe wyjście (tylko ndjson).")
+        parser.add_argument("--export-format", choices=["npz", "parquet", "ndjson"], default=None,
+                            help="Format eksportu (domyślnie wg rozszerzenia pliku albo ndjson).")
+        parser.add_argument("--city", type=int, action="append", default=[],
+                            help="Id miasta; można podać wielokrotnie.")
+        parser.add_argument("--date-from", default=None)
+        parser.add_argument("--date-to", default=None)
+
+    def handle(self, *args, **options):
+        output = options["output"]
+        export_format = options["export_format"] or next(
+            (name for name in ("npz", "parquet") if output.endswith(f".{name}")), "ndjson"
+        )
+        if export_format not in available_formats():
+            raise CommandError(f"Format {export_format} wymaga pakietu, który nie jest zainstalowany.")
+        if export_format != "ndjson" and output == "-":
+            raise CommandError("Format binarny wymaga podania pliku (--output).")
+
+        queryset = ForecastData.objects.all()
+        if options["city"]:
+            queryset = queryset.filter(city_id__in=options["city"])
+        if options["date_from"]:
+            queryset = queryset.filter(date__gte=options["date_from"])
+        if options["date_to"]:
+            queryset = queryset.filter(date__lte=options["date_to"])
+
+        if export_format == "ndjson":
+            file = sys.stdout if output == "-" else open(output, "w", encoding="utf-8")
+            try:
+                for line in iter_ndjson(queryset):
+                    file.write(line)
+            finally:
+                if file is not sys.stdout:
+                    file.close()
+        else:
+            exporter = export_npz if export_format == "npz" else export_parquet
+            with open(output, "wb") as file:
+                exporter(queryset, file)
+            self.stderr.write(f"Zapisano {output}")
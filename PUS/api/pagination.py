@@ -0,0 +1,107 @@
+import base64
+import json
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetCursorPagination(BasePagination):
+    """
+    Stronicowanie kursorem po kilku kolumnach naraz (np. (city, -date)).
+    CursorPagination z DRF wyznacza pozycję tylko z pierwszego pola sortowania
+    i dokłada OFFSET, co przy wielu wierszach z tą samą wartością robi się wolne.
+    Tutaj kolejna strona to zawsze WHERE (a, b) > (x, y) ORDER BY a, b LIMIT n
+    na indeksie zgodnym z `ordering`. Ostatnie pole (lub cały zestaw) musi być unikalne.
+    """
+    ordering = ('pk',)
+    page_size = 100
+    max_page_size = 1000
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Niepoprawny kursor.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            try:
+                queryset = queryset.filter(self.get_position_filter(position))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+
+        results = list(queryset[:page_size + 1])
+        self.has_next = len(results) > page_size
+        results = results[:page_size]
+        self.next_position = self.get_position(results[-1]) if self.has_next else None
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_position(self, instance):
+        return [getattr(instance, field.lstrip('-')) for field in self.ordering]
+
+    def get_position_filter(self, position):
+        condition = Q()
+        for i, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            step = Q(**{f'{name}__{lookup}': position[i]})
+            for previous, value in zip(self.ordering[:i], position[:i]):
+                step &= Q(**{previous.lstrip('-'): value})
+            condition |= step
+        return condition
+
+    def encode_cursor(self, position):
+        payload = json.dumps([value if isinstance(value, (int, float)) else str(value) for value in position])
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+
+class ForecastDataPagination(KeysetCursorPagination):
+    # zgodne z indeksem forecast_city_date_desc_idx
+    ordering = ('city_id', '-date')
+
+
+class CityPagination(KeysetCursorPagination):
+    ordering = ('city_name',)
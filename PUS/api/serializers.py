@@ -1,12 +1,38 @@
 import requests
+from datetime import date
 from rest_framework import serializers
 from PUS import settings
-from database_manager.models import City, Route, RouteCity, ForecastData, Recommendation
+from PUS.profiling import ProfiledSerializerMixin
+from database_manager.models import City, Route, RouteCity, ForecastData, Recommendation, ForecastRefreshJob, GeoName, ForecastHistory
 from django.contrib.auth import get_user_model
+from weather_api.openweather_client import OpenWeatherClient
+from weather_api.geocoding import geocode
 
 User = get_user_model()
 
-class CitySerializer(serializers.ModelSerializer):
+class DynamicFieldsMixin:
+    """Pozwala ograniczyć zwracane pola parametrem ?fields=id,date,temp."""
+    fields_query_param = 'fields'
+
+    def get_requested_fields(self):
+        request = self.context.get('request')
+        if request is None or request.method != 'GET':
+            return None
+        requested = request.query_params.get(self.fields_query_param)
+        if not requested:
+            return None
+        return {name.strip() for name in requested.split(',') if name.strip()}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested = self.get_requested_fields()
+        if requested:
+            for name in set(fields) - requested:
+                fields.pop(name)
+        return fields
+
+
+class CitySerializer(ProfiledSerializerMixin, DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = City
         fields = ['id', 'city_name', 'latitude', 'longitude']
@@ -14,17 +40,18 @@ class CitySerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         city_name = validated_data['city_name']
 
-        api_key = settings.OPENWEATHER_API_KEY
-        #lepiej wykorzystać Geocoding Api, ale wymagana jest tam subskrypcja i podanie karty
-        url = f"https://api.openweathermap.org/data/2.5/forecast/daily?q={city_name},&cnt=1&appid={api_key}"
-        response = requests.get(url)
-        data = response.json()
+        coordinates = geocode(city_name)
+        if coordinates is None:
+            weather_client = OpenWeatherClient(api_key=settings.OPENWEATHER_API_KEY, use_cache=False)
+            try:
+                coordinates = weather_client.get_city_coordinates(city_name)
+            except requests.RequestException:
+                raise serializers.ValidationError("Nie udało się pobrać współrzędnych miasta, spróbuj ponownie później")
 
-        if 'city' not in data:
+        if coordinates is None:
             raise serializers.ValidationError("Wprowadzono niepoprawną nazwę miasta")
 
-        latitude = data["city"]["coord"]["lat"]
-        longitude = data["city"]["coord"]["lon"]
+        latitude, longitude = coordinates
 
         city = City.objects.create(
             city_name=city_name,
@@ -34,7 +61,13 @@ class CitySerializer(serializers.ModelSerializer):
         return city
 
 
-class ForecastDataSerializer(serializers.ModelSerializer):
+class GeoNameSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = GeoName
+        fields = ['name', 'country_code', 'latitude', 'longitude', 'population']
+
+
+class ForecastDataSerializer(ProfiledSerializerMixin, DynamicFieldsMixin, serializers.ModelSerializer):
     city = serializers.PrimaryKeyRelatedField(queryset=City.objects.all())
 
     class Meta:
@@ -46,7 +79,57 @@ class ForecastDataSerializer(serializers.ModelSerializer):
         ]
 
 
-class RouteCitySerializer(serializers.ModelSerializer):
+class ForecastWindowField(serializers.Field):
+    """
+    Okno zapytania o prognozy: {"city": 1, "date_from": "2025-05-01", "date_to": "2025-05-03"}
+    albo [1, "2025-05-01", "2025-05-03"]. Zwraca krotkę (city_id, date_from, date_to);
+    przy setkach okien jest znacznie tańsze niż zagnieżdżony serializator.
+    """
+    default_error_messages = {
+        'invalid': 'Oczekiwano {"city": id, "date_from": data, "date_to": data} albo [id, data, data].',
+        'invalid_range': 'date_from nie może być późniejsza niż date_to.',
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, dict):
+            data = (data.get('city'), data.get('date_from'), data.get('date_to'))
+        if not isinstance(data, (list, tuple)) or len(data) != 3:
+            self.fail('invalid')
+        city, date_from, date_to = data
+        try:
+            if isinstance(city, bool) or int(city) != city or city < 1:
+                self.fail('invalid')
+            date_from, date_to = date.fromisoformat(date_from), date.fromisoformat(date_to)
+        except (TypeError, ValueError):
+            self.fail('invalid')
+        if date_from > date_to:
+            self.fail('invalid_range')
+        return int(city), date_from, date_to
+
+    def to_representation(self, value):
+        city, date_from, date_to = value
+        return {'city': city, 'date_from': date_from.isoformat(), 'date_to': date_to.isoformat()}
+
+
+class ForecastQuerySerializer(ProfiledSerializerMixin, serializers.Serializer):
+    windows = serializers.ListField(child=ForecastWindowField(), allow_empty=False,
+                                    max_length=settings.FORECAST_QUERY_MAX_WINDOWS)
+    fields = serializers.ListField(
+        child=serializers.ChoiceField(choices=ForecastDataSerializer.Meta.fields), required=False, allow_empty=False
+    )
+
+
+class ForecastHistorySerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = ForecastHistory
+        fields = [
+            'city', 'date', 'fetched_at', 'temp', 'feels_like', 'pressure',
+            'humidity', 'min_temp', 'max_temp', 'clouds', 'wind_speed',
+            'rain', 'precipitation_probability', 'description', 'main_weather'
+        ]
+
+
+class RouteCitySerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     city = serializers.PrimaryKeyRelatedField(queryset=City.objects.all())
     route = serializers.PrimaryKeyRelatedField(read_only=True)
 
@@ -55,14 +138,26 @@ class RouteCitySerializer(serializers.ModelSerializer):
         fields = ['id', 'route', 'city', 'position', 'arrival_date', 'departure_date']
 
 
-class RecommendationSerializer(serializers.ModelSerializer):
-    route = serializers.PrimaryKeyRelatedField(queryset=Route.objects.all())
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
+class UserRouteField(serializers.PrimaryKeyRelatedField):
+    # queryset zawężany do tras użytkownika dopiero przy walidacji zapisu,
+    # a nie przy każdym tworzeniu serializera (np. zagnieżdżonego w RouteSerializer)
+    def get_queryset(self):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            self.fields['route'].queryset = Route.objects.filter(user=request.user)
+            return Route.objects.filter(user=request.user)
+        return Route.objects.all()
+
+
+class RouteCityForecastSerializer(RouteCitySerializer):
+    city_name = serializers.CharField(source='city.city_name', read_only=True)
+    forecasts = ForecastDataSerializer(many=True, read_only=True, source='window_forecasts')
+
+    class Meta(RouteCitySerializer.Meta):
+        fields = RouteCitySerializer.Meta.fields + ['city_name', 'forecasts']
+
+
+class RecommendationSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
+    route = UserRouteField(queryset=Route.objects.all())
 
     def validate_route(self, value):
         request = self.context.get('request')
@@ -75,7 +170,7 @@ class RecommendationSerializer(serializers.ModelSerializer):
         fields = ['id', 'route', 'recommendation']
 
 
-class RouteSerializer(serializers.ModelSerializer):
+class RouteSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     user = serializers.StringRelatedField(read_only=True)
     route_cities = RouteCitySerializer(many=True)
     recommendations = RecommendationSerializer(many=True, read_only=True)
@@ -93,3 +188,74 @@ class RouteSerializer(serializers.ModelSerializer):
         for route_city_data in route_cities_data:
             RouteCity.objects.create(route=route, **route_city_data)
         return route
+
+
+class RouteCityImportSerializer(serializers.Serializer):
+    # samo id - istnienie miast jest sprawdzane jednym zapytaniem dla całego importu
+    city = serializers.IntegerField(min_value=1)
+    position = serializers.IntegerField(min_value=0)
+    arrival_date = serializers.DateField()
+    departure_date = serializers.DateField()
+
+    def validate(self, data):
+        if data['arrival_date'] > data['departure_date']:
+            raise serializers.ValidationError("Data przyjazdu nie może być późniejsza niż data wyjazdu")
+        return data
+
+
+class RouteImportSerializer(serializers.Serializer):
+    """Walidacja trasy z importu masowego - bez zapytań do bazy."""
+    name = serializers.CharField(max_length=Route._meta.get_field('name').max_length)
+    starts_at = serializers.DateField()
+    ends_at = serializers.DateField()
+    route_cities = RouteCityImportSerializer(many=True)
+
+    def validate_route_cities(self, value):
+        positions = [route_city['position'] for route_city in value]
+        if len(positions) != len(set(positions)):
+            raise serializers.ValidationError("Pozycje postojów na trasie muszą być unikalne")
+        return value
+
+    def validate(self, data):
+        if data['starts_at'] > data['ends_at']:
+            raise serializers.ValidationError("Data rozpoczęcia trasy nie może być późniejsza niż data zakończenia")
+        return data
+
+
+class ForecastRefreshJobSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
+    route = serializers.PrimaryKeyRelatedField(read_only=True)
+
+    class Meta:
+        model = ForecastRefreshJob
+        fields = ['id', 'route', 'status', 'attempts', 'created_at', 'started_at', 'finished_at', 'result', 'error']
+
+
+class StopStaySerializer(serializers.Serializer):
+    # brakujące limity są uzupełniane wartościami dla całej trasy w RouteDateOptimizationSerializer
+    id = serializers.IntegerField()
+    min_stay = serializers.IntegerField(min_value=1, required=False)
+    max_stay = serializers.IntegerField(min_value=1, required=False)
+
+
+class RouteDateOptimizationSerializer(ProfiledSerializerMixin, serializers.Serializer):
+    min_stay = serializers.IntegerField(min_value=1, default=1)
+    max_stay = serializers.IntegerField(min_value=1, required=False)
+    stops = StopStaySerializer(many=True, required=False, default=list)
+    apply = serializers.BooleanField(default=False)
+
+    def validate(self, data):
+        if data.get('max_stay') is not None and data['max_stay'] < data['min_stay']:
+            raise serializers.ValidationError("max_stay nie może być mniejsze niż min_stay")
+
+        errors = []
+        for stop in data['stops']:
+            stop.setdefault('min_stay', data['min_stay'])
+            stop.setdefault('max_stay', data.get('max_stay'))
+            if stop['max_stay'] is not None and stop['max_stay'] < stop['min_stay']:
+                errors.append({"max_stay": [f"max_stay ({stop['max_stay']}) nie może być mniejsze "
+                                            f"niż min_stay ({stop['min_stay']}) postoju"]})
+            else:
+                errors.append({})
+        if any(errors):
+            raise serializers.ValidationError({"stops": errors})
+        return data
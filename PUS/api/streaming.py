@@ -0,0 +1,99 @@
+import csv
+import json
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class StreamingRenderer(BaseRenderer):
+    charset = 'utf-8'
+
+    def stream(self, rows):
+        raise NotImplementedError
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # odpowiedzi niestrumieniowane (np. błędy, pojedynczy obiekt)
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        return ''.join(self.stream(iter(rows))).encode(self.charset)
+
+
+class NDJSONRenderer(StreamingRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def stream(self, rows):
+        for row in rows:
+            yield json.dumps(row, cls=JSONEncoder, ensure_ascii=False) + '\n'
+
+
+class NDJSONParser(BaseParser):
+    """Treść application/x-ndjson (jeden obiekt JSON w każdej linii) czytana linia po linii jako lista obiektów."""
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', 'utf-8')
+        rows = []
+        for number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rows.append(json.loads(line.decode(encoding)))
+            except ValueError as e:
+                raise ParseError(f"Niepoprawny JSON w linii {number}: {e}")
+        return rows
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+class CSVRenderer(StreamingRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, rows):
+        writer = csv.writer(_Echo())
+        header = None
+        for row in rows:
+            if header is None:
+                header = list(row)
+                yield writer.writerow(header)
+            yield writer.writerow([self.format_value(row.get(name)) for name in header])
+
+    @staticmethod
+    def format_value(value):
+        if isinstance(value, (list, dict)):
+            return json.dumps(value, cls=JSONEncoder, ensure_ascii=False)
+        return value
+
+
+class StreamingListMixin:
+    """
+    Lista w formacie ?format=ndjson lub ?format=csv jest wysyłana strumieniowo:
+    wiersze są czytane z queryset.iterator() i serializowane po jednym,
+    więc pamięć serwera nie rośnie z rozmiarem wyniku (bez stronicowania).
+    """
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer, CSVRenderer]
+    streaming_chunk_size = 2000
+
+    def list(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        if not isinstance(renderer, StreamingRenderer):
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        serializer = self.get_serializer()
+        rows = (
+            serializer.to_representation(instance)
+            for instance in queryset.iterator(chunk_size=self.streaming_chunk_size)
+        )
+        response = StreamingHttpResponse(renderer.stream(rows), content_type=f'{renderer.media_type}; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{self.basename}.{renderer.format}"'
+        return response
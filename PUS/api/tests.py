@@ -1,3 +1,573 @@
-from django.test import TestCase
+import asyncio
+import base64
+import io
+import json
+import re
+from datetime import date, datetime, time, timedelta
+from unittest import mock, skipUnless
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.http import FileResponse
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from database_manager.models import (City, Route, RouteCity, Recommendation, ForecastData, ForecastRefreshJob,
+                                     ScopeLastWrite)
+from PUS.profiling import request_stats
+from weather_api.cache import get_forecast_cache
+from weather_api.http import httpx
+from . import export, views
+
+User = get_user_model()
+
+
+def create_forecasts(cities, days, **extra):
+    """Prognozy na podane dni maja 2025 dla każdego z miast; temperatura równa numerowi dnia."""
+    return ForecastData.objects.bulk_create([
+        ForecastData(city=city, date=date(2025, 5, day), temp=day, feels_like=day, pressure=1000, humidity=50,
+                     min_temp=day, max_temp=day, clouds=0, wind_speed=1, rain=0, precipitation_probability=0,
+                     main_weather='Clear', **extra)
+        for city in cities for day in days
+    ])
+
+
+class RouteViewSetQueryCountTests(TestCase):
+    # 3 agregaty walidatorów ETag (trasy, postoje, rekomendacje), czas ostatniego zapisu + 3 zapytania listy/szczegółów
+    EXPECTED_QUERIES = 7
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='traveller', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.cities = [City.objects.create(city_name=f'City {i}') for i in range(3)]
+
+    def create_routes(self, count):
+        for i in range(count):
+            route = Route.objects.create(
+                name=f'Route {i}', user=self.user,
+                starts_at=date(2025, 5, 1), ends_at=date(2025, 5, 10)
+            )
+            for position, city in enumerate(self.cities):
+                RouteCity.objects.create(
+                    route=route, city=city, position=position,
+                    arrival_date=date(2025, 5, 1 + position), departure_date=date(2025, 5, 2 + position)
+                )
+            Recommendation.objects.create(route=route, recommendation='Weź parasol')
+
+    def test_list_query_count_does_not_depend_on_number_of_routes(self):
+        self.create_routes(2)
+        with self.assertNumQueries(self.EXPECTED_QUERIES):
+            response = self.client.get('/api/route/')
+        self.assertEqual(len(response.json()), 2)
+
+        self.create_routes(10)
+        with self.assertNumQueries(self.EXPECTED_QUERIES):
+            response = self.client.get('/api/route/')
+        self.assertEqual(len(response.json()), 12)
+
+    def test_retrieve_query_count(self):
+        self.create_routes(1)
+        route = Route.objects.get()
+        with self.assertNumQueries(self.EXPECTED_QUERIES):
+            response = self.client.get(f'/api/route/{route.id}/')
+        self.assertEqual(len(response.json()['route_cities']), 3)
+        self.assertEqual(len(response.json()['recommendations']), 1)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='traveller', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.city = City.objects.create(city_name='Kraków')
+        self.route = Route.objects.create(name='Route', user=self.user,
+                                          starts_at=date(2025, 5, 1), ends_at=date(2025, 5, 3))
+        RouteCity.objects.create(route=self.route, city=self.city, position=0,
+                                 arrival_date=date(2025, 5, 1), departure_date=date(2025, 5, 3))
+
+    def test_matching_etag_returns_304_without_list_queries(self):
+        etag = self.client.get('/api/route/')['ETag']
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/route/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_missing_route_is_never_not_modified(self):
+        url = f'/api/route/{self.route.id}/'
+        last_modified = self.client.get(url)['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='*').status_code, 304)
+
+        self.route.delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='*').status_code, 404)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 404)
+
+    def test_last_write_is_shared_through_database(self):
+        # odpowiada proces z własnym cache, a zapisy wykonuje inny - o zapisach wie tylko z bazy
+        cache.clear()
+        etag = self.client.get('/api/route/')['ETag']
+        Recommendation.objects.create(route=self.route, recommendation='Weź parasol').delete()
+        cache.clear()
+        self.assertEqual(self.client.get('/api/route/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_writes_change_etag(self):
+        etag = self.client.get('/api/route/')['ETag']
+        Recommendation.objects.create(route=self.route, recommendation='Weź parasol')
+        response = self.client.get('/api/route/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()[0]['recommendations']), 1)
+
+        etag = response['ETag']
+        self.route.route_cities.get().delete()
+        response = self.client.get('/api/route/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['route_cities'], [])
+
+    def test_route_delete_cascades_without_loading_rows_and_touches_owner_once(self):
+        for i in range(1, 4):
+            Recommendation.objects.create(route=self.route, recommendation=f'Rada {i}')
+        with CaptureQueriesContext(connection) as queries:
+            self.route.delete()
+        sql = [query['sql'] for query in queries]
+        self.assertEqual(len([statement for statement in sql if 'scopelastwrite' in statement]), 1)
+        self.assertFalse([statement for statement in sql if statement.startswith('SELECT') and 'recommendation' in statement])
+
+    def test_api_destroy_changes_last_write(self):
+        ScopeLastWrite.objects.all().delete()
+        route_city = self.route.route_cities.get()
+        self.assertEqual(self.client.delete(f'/api/route_city/{route_city.id}/').status_code, 204)
+        self.assertTrue(ScopeLastWrite.objects.filter(scope=str(self.user.pk)).exists())
+
+    def test_forecast_etag_changes_after_bulk_update(self):
+        forecast, = create_forecasts([self.city], [1])
+        etag = self.client.get('/api/forecast_data/')['ETag']
+        forecast.temp = 10
+        ForecastData.objects.bulk_create([forecast], update_conflicts=True, unique_fields=['city', 'date'],
+                                         update_fields=['temp', 'updated_at'])
+        response = self.client.get('/api/forecast_data/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['temp'], 10)
+
+
+class ViewSetQueryPlanTests(TestCase):
+    """
+    Sprawdza plany zapytań (EXPLAIN) list wszystkich viewsetów na wypełnionej bazie.
+    Na PostgreSQL skanowanie sekwencyjne jest wyłączane, więc "Seq Scan" w planie
+    oznacza, że dla danego zapytania nie ma żadnego użytecznego indeksu.
+    """
+    LARGE_TABLES = {
+        ForecastData._meta.db_table, RouteCity._meta.db_table, Route._meta.db_table,
+        Recommendation._meta.db_table, ForecastRefreshJob._meta.db_table,
+    }
+    viewsets = [
+        views.CityViewSet, views.RouteViewSet, views.RouteCityViewSet,
+        views.ForecastDataViewSet, views.RecommendationViewSet, views.ForecastRefreshJobViewSet,
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        users = [User.objects.create_user(username=f'user{i}', password='password') for i in range(5)]
+        cities = City.objects.bulk_create([City(city_name=f'City {i}') for i in range(50)])
+        start = date(2025, 5, 1)
+        for user in users:
+            for i in range(20):
+                route = Route.objects.create(name=f'Route {i}', user=user, starts_at=start, ends_at=start + timedelta(days=10))
+                RouteCity.objects.bulk_create([
+                    RouteCity(route=route, city=cities[(i + position) % len(cities)], position=position,
+                              arrival_date=start + timedelta(days=position), departure_date=start + timedelta(days=position + 1))
+                    for position in range(5)
+                ])
+                Recommendation.objects.create(route=route, recommendation='Weź parasol')
+                ForecastRefreshJob.objects.create(route=route)
+        ForecastData.objects.bulk_create([
+            ForecastData(city=city, date=start + timedelta(days=day), temp=15, feels_like=14, pressure=1013,
+                         humidity=60, min_temp=10, max_temp=20, clouds=40, wind_speed=3, rain=0,
+                         precipitation_probability=0.2, description='clouds', main_weather='Clouds')
+            for city in cities for day in range(16)
+        ])
+        cls.user = users[0]
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def get_list_queryset(self, viewset_class):
+        request = Request(APIRequestFactory().get('/'))
+        request.user = self.user
+        viewset = viewset_class(request=request, action='list', format_kwarg=None, kwargs={})
+        queryset = viewset.filter_queryset(viewset.get_queryset())
+        pagination_class = viewset_class.pagination_class
+        if pagination_class is not None and hasattr(pagination_class, 'ordering'):
+            queryset = queryset.order_by(*pagination_class.ordering)[:pagination_class.page_size + 1]
+        return queryset
+
+    def get_sequential_scans(self, plan):
+        if connection.vendor == 'postgresql':
+            return set(re.findall(r'Seq Scan on (\w+)', plan))
+        # SQLite: wyszukiwanie po indeksie to "SEARCH", a "SCAN" (także "SCAN ... USING INDEX")
+        # oznacza przegląd całej tabeli lub całego indeksu
+        return set(re.findall(r'\bSCAN (\w+)', plan))
+
+    def explain(self, queryset):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def test_list_querysets_do_not_scan_large_tables(self):
+        for viewset_class in self.viewsets:
+            with self.subTest(viewset=viewset_class.__name__):
+                plan = self.explain(self.get_list_queryset(viewset_class))
+                self.assertFalse(self.get_sequential_scans(plan) & self.LARGE_TABLES, plan)
+
+
+@override_settings(API_PROFILING=True)
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        request_stats.reset()
+        self.user = User.objects.create_user(username='traveller', password='password')
+        self.admin = User.objects.create_user(username='admin', password='password', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        Route.objects.create(name='Route', user=self.user, starts_at=date(2025, 5, 1), ends_at=date(2025, 5, 3))
+
+    def test_server_timing_reports_queries_and_stats_are_aggregated_per_view(self):
+        response = self.client.get('/api/route/')
+        timing = response['Server-Timing']
+        self.assertIn(f'db;desc="{RouteViewSetQueryCountTests.EXPECTED_QUERIES} calls"', timing)
+        self.assertIn('serializer;desc="1 calls"', timing)
+        self.assertRegex(timing, r'total;dur=\d+\.\d$')
+        # bez cache wyrenderowanych odpowiedzi drugie żądanie wykonuje te same zapytania
+        cache.clear()
+        self.client.get('/api/route/')
+
+        self.client.force_authenticate(self.admin)
+        stats = self.client.get('/api/profiling/').json()
+        route_list = stats['routes']['GET api:route-list']
+        self.assertEqual(route_list['count'], 2)
+        self.assertEqual(route_list['avg_db_queries'], RouteViewSetQueryCountTests.EXPECTED_QUERIES)
+        self.assertEqual(stats['slow_requests'], [])
+
+    def test_query_wrapper_is_installed_only_for_the_request(self):
+        def outer(execute, sql, params, many, context):
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(outer):
+            response = self.client.get('/api/route/')
+            self.assertEqual(connection.execute_wrappers, [outer])
+        self.assertIn(f'db;desc="{RouteViewSetQueryCountTests.EXPECTED_QUERIES} calls"', response['Server-Timing'])
+        self.assertEqual(connection.execute_wrappers, [])
+
+    @override_settings(API_PROFILING_SAMPLE_RATE=1, API_PROFILING_SLOW_MS=0)
+    def test_sampled_slow_requests_keep_cprofile_report(self):
+        self.client.get('/api/route/')
+
+        slow = request_stats.snapshot()['slow_requests']
+        self.assertEqual(len(slow), 1)
+        self.assertEqual(slow[0]['route'], 'GET api:route-list')
+        self.assertIn('cumulative', slow[0]['profile'])
+
+
+
+class StreamingListTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='traveller', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for i in range(5):
+            City.objects.create(city_name=f'City {i}')
+
+    def test_ndjson_list_is_streamed_without_pagination(self):
+        response = self.client.get('/api/city/?format=ndjson&page_size=2')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(sorted(row['city_name'] for row in rows), [f'City {i}' for i in range(5)])
+
+    def test_csv_list_has_header_and_one_line_per_row(self):
+        response = self.client.get('/api/city/?format=csv')
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertIn('city_name', lines[0].split(','))
+        self.assertEqual(len(lines), 6)
+
+
+class AsyncUpdateForecastTests(TestCase):
+    def setUp(self):
+        get_forecast_cache().clear()
+        self.addCleanup(get_forecast_cache().clear)
+        self.user = User.objects.create_user(username='traveller', password='password')
+        today = timezone.localdate()
+        self.route = Route.objects.create(name='Route', user=self.user, starts_at=today, ends_at=today + timedelta(days=2))
+        for position, name in enumerate(['Kraków', 'Gdańsk', 'Nowhere']):
+            RouteCity.objects.create(route=self.route, city=City.objects.create(city_name=name), position=position,
+                                     arrival_date=today, departure_date=today + timedelta(days=2))
+        self.url = f'/api/async/route/{self.route.id}/update_forecast/'
+        self.auth = 'Basic ' + base64.b64encode(b'traveller:password').decode()
+        self.active = self.peak = 0
+
+    async def fake_upstream(self, url, params=None, priority=None):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.1)
+        self.active -= 1
+        if params['q'] == 'Nowhere':
+            raise httpx.ConnectError('connection refused')
+        noon = datetime.combine(timezone.localdate(), time(12))
+        return mock.Mock(status_code=200, json=lambda: {"list": [
+            {"dt": int((noon + timedelta(days=day)).timestamp()), "temp": {"day": 20}} for day in range(16)
+        ]})
+
+    @skipUnless(httpx is not None, "wymaga httpx")
+    async def test_cities_are_fetched_concurrently_in_event_loop(self):
+        with mock.patch('weather_api.openweather_client.async_upstream_get', self.fake_upstream):
+            response = await self.async_client.post(self.url, AUTHORIZATION=self.auth)
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body['inserted'], list(body['errors'])), (6, ['Nowhere']))
+        self.assertEqual(self.peak, 3)
+
+    async def test_requires_owner(self):
+        self.assertEqual((await self.async_client.post(self.url)).status_code, 401)
+        await sync_to_async(User.objects.create_user)(username='other', password='password')
+        other = 'Basic ' + base64.b64encode(b'other:password').decode()
+        self.assertEqual((await self.async_client.post(self.url, AUTHORIZATION=other)).status_code, 404)
+
+
+class RouteImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='traveller', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.cities = [City.objects.create(city_name=f'City {i}') for i in range(3)]
+
+    def route(self, name, city_ids):
+        return {
+            "name": name, "starts_at": "2025-05-01", "ends_at": "2025-05-10",
+            "route_cities": [
+                {"city": city_id, "position": position,
+                 "arrival_date": f"2025-05-0{position + 1}", "departure_date": f"2025-05-0{position + 2}"}
+                for position, city_id in enumerate(city_ids)
+            ],
+        }
+
+    def test_import_validates_cities_in_one_query_and_inserts_in_bulk(self):
+        routes = [self.route(f'Route {i}', [city.id for city in self.cities]) for i in range(20)]
+        # miasta + savepoint + INSERT tras + INSERT postojów + zwolnienie savepointu
+        with self.assertNumQueries(5):
+            response = self.client.post('/api/route/import/', routes, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 20)
+        self.assertEqual(Route.objects.filter(user=self.user).count(), 20)
+        self.assertEqual(RouteCity.objects.count(), 60)
+
+    def test_invalid_route_rejects_whole_import_with_errors_per_route(self):
+        routes = [
+            self.route('Valid', [self.cities[0].id]),
+            self.route('Unknown city', [self.cities[0].id, 999]),
+            {"name": "Missing dates"},
+        ]
+        response = self.client.post('/api/route/import/', {"routes": routes}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        errors = {error['index']: error['errors'] for error in response.json()['errors']}
+        self.assertEqual(set(errors), {1, 2})
+        self.assertEqual(errors[1]['route_cities'][0], {})
+        self.assertIn('city', errors[1]['route_cities'][1])
+        self.assertIn('starts_at', errors[2])
+        self.assertFalse(Route.objects.exists())
+
+    def test_ndjson_import_with_skip_invalid(self):
+        lines = [self.route('Valid', [self.cities[1].id]), self.route('Unknown city', [999])]
+        body = '\n'.join(json.dumps(line) for line in lines) + '\n'
+        response = self.client.post('/api/route/import/?skip_invalid=true', body,
+                                    content_type='application/x-ndjson')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 1)
+        self.assertEqual([error['index'] for error in response.json()['errors']], [1])
+        self.assertEqual(list(Route.objects.values_list('name', flat=True)), ['Valid'])
+
+
+class RouteForecastTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='traveller', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        krakow, gdansk = City.objects.create(city_name='Kraków'), City.objects.create(city_name='Gdańsk')
+        self.route = Route.objects.create(name='Route', user=self.user, starts_at=date(2025, 5, 1), ends_at=date(2025, 5, 9))
+        for position, (city, arrival, departure) in enumerate([(krakow, 1, 3), (gdansk, 4, 6), (krakow, 8, 9)]):
+            RouteCity.objects.create(route=self.route, city=city, position=position,
+                                     arrival_date=date(2025, 5, arrival), departure_date=date(2025, 5, departure))
+        create_forecasts([krakow, gdansk], range(1, 11))
+
+    def test_each_stop_gets_only_its_stay_window(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/route/{self.route.id}/forecast/')
+
+        self.assertEqual(response.status_code, 200)
+        stops = response.json()['route_cities']
+        self.assertEqual([stop['city_name'] for stop in stops], ['Kraków', 'Gdańsk', 'Kraków'])
+        self.assertEqual([[forecast['temp'] for forecast in stop['forecasts']] for stop in stops],
+                         [[1, 2, 3], [4, 5, 6], [8, 9]])
+
+    def test_other_users_route_is_not_found(self):
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user(username='other', password='password'))
+        self.assertEqual(other.get(f'/api/route/{self.route.id}/forecast/').status_code, 404)
+
+
+class ForecastDataPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='traveller', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.cities = [City.objects.create(city_name=f'City {i}') for i in range(2)]
+        route = Route.objects.create(name='Route', user=self.user, starts_at=date(2025, 5, 1), ends_at=date(2025, 5, 10))
+        for position, city in enumerate(self.cities):
+            RouteCity.objects.create(route=route, city=city, position=position,
+                                     arrival_date=date(2025, 5, 1), departure_date=date(2025, 5, 10))
+        create_forecasts(self.cities, range(1, 11))
+
+    def collect(self, url):
+        rows = []
+        while url:
+            body = self.client.get(url).json()
+            self.assertEqual(set(body), {'next', 'results'})
+            rows.extend((row['city'], row['date']) for row in body['results'])
+            url = body['next']
+        return rows
+
+    def test_keyset_pages_cover_all_rows_in_index_order(self):
+        rows = self.collect('/api/forecast_data/?page_size=7')
+        expected = [(city.id, f'2025-05-{day:02d}') for city in self.cities for day in range(10, 0, -1)]
+        self.assertEqual(rows, expected)
+
+    def test_filters_are_applied_before_paging(self):
+        rows = self.collect(f'/api/forecast_data/?page_size=2&city={self.cities[1].id}&date__gte=2025-05-08')
+        self.assertEqual(rows, [(self.cities[1].id, f'2025-05-{day:02d}') for day in (10, 9, 8)])
+        self.assertEqual(self.client.get('/api/forecast_data/?cursor=bm9wZQ==').status_code, 404)
+
+    def test_stream_uses_index_order_not_model_ordering(self):
+        self.assertEqual(ForecastData._meta.ordering, ['city', '-date'])
+        response = self.client.get('/api/forecast_data/?format=ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([(row['city'], row['date']) for row in rows], self.collect('/api/forecast_data/'))
+
+
+class ForecastQueryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='traveller', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.cities = [City.objects.create(city_name=f'City {i}') for i in range(3)]
+        route = Route.objects.create(name='Route', user=self.user, starts_at=date(2025, 5, 1), ends_at=date(2025, 5, 10))
+        for position, city in enumerate(self.cities[:2]):
+            RouteCity.objects.create(route=route, city=city, position=position,
+                                     arrival_date=date(2025, 5, 1), departure_date=date(2025, 5, 10))
+        create_forecasts(self.cities, range(1, 11))
+
+    def test_windows_are_answered_with_one_query_and_grouped_in_order(self):
+        first, second, foreign = self.cities
+        windows = [
+            {"city": first.id, "date_from": "2025-05-02", "date_to": "2025-05-04"},
+            [second.id, "2025-05-09", "2025-05-20"],
+            [first.id, "2025-05-03", "2025-05-05"],
+            [foreign.id, "2025-05-01", "2025-05-10"],
+        ]
+        with self.assertNumQueries(1):
+            response = self.client.post('/api/forecast_data/query/',
+                                        {"windows": windows, "fields": ["date", "temp"]}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([[f['temp'] for f in result['forecasts']] for result in results],
+                         [[2, 3, 4], [9, 10], [3, 4, 5], []])
+        self.assertEqual(results[1]['forecasts'][0], {"date": "2025-05-09", "temp": 9})
+        self.assertEqual((results[1]['city'], results[1]['date_from']), (second.id, "2025-05-09"))
+
+    def test_invalid_window_is_rejected(self):
+        response = self.client.post('/api/forecast_data/query/',
+                                    {"windows": [[self.cities[0].id, "2025-05-05", "2025-05-01"]]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ForecastExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='traveller', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.city = City.objects.create(city_name='City')
+        route = Route.objects.create(name='Route', user=self.user, starts_at=date(2025, 5, 1), ends_at=date(2025, 5, 10))
+        RouteCity.objects.create(route=route, city=self.city, position=0,
+                                 arrival_date=date(2025, 5, 1), departure_date=date(2025, 5, 10))
+        create_forecasts([self.city], [1], description=None)
+        create_forecasts([self.city], range(2, 6), description='bezchmurnie')
+
+    def download(self, output):
+        response = self.client.get(f'/api/forecast_data/export/?output={output}')
+        self.assertEqual(response.status_code, 200)
+        return io.BytesIO(b''.join(response.streaming_content))
+
+    def test_ndjson_chunks_are_columnar(self):
+        lines = self.download('ndjson').read().decode().splitlines()
+        chunk = json.loads(lines[0])
+        self.assertEqual(chunk['temp'], [1, 2, 3, 4, 5])
+        self.assertEqual(chunk['date'][0], '2025-05-01')
+
+    @skipUnless(export.pa is not None, "wymaga pyarrow")
+    def test_parquet_is_streamed_with_explicit_schema(self):
+        table = export.pq.read_table(self.download('parquet'))
+        self.assertEqual(table.column('temp').to_pylist(), [1, 2, 3, 4, 5])
+        self.assertEqual(str(table.schema.field('description').type), 'string')
+        self.assertEqual(table.column('date').to_pylist()[0], date(2025, 5, 1))
+
+    @skipUnless(export.np is not None, "wymaga numpy")
+    def test_npz_is_served_from_file(self):
+        response = self.client.get('/api/forecast_data/export/?output=npz')
+        self.assertIsInstance(response, FileResponse)
+        arrays = export.np.load(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(arrays['temp'].tolist(), [1, 2, 3, 4, 5])
+        self.assertEqual(arrays['description'].tolist()[0], '')
+
+    def test_unknown_or_unavailable_format_is_rejected(self):
+        self.assertEqual(self.client.get('/api/forecast_data/export/?output=xlsx').status_code, 400)
+        with mock.patch.object(export, 'pa', None):
+            self.assertEqual(self.client.get('/api/forecast_data/export/?output=parquet').status_code, 406)
+
+
+class OptimizeDatesTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='traveller', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.route = Route.objects.create(name='Route', user=self.user,
+                                          starts_at=date(2025, 5, 1), ends_at=date(2025, 5, 8))
+        self.stops = [
+            RouteCity.objects.create(route=self.route, city=City.objects.create(city_name=f'City {i}'), position=i,
+                                     arrival_date=date(2025, 5, 1), departure_date=date(2025, 5, 1))
+            for i in range(2)
+        ]
+
+    def optimize(self, body):
+        return self.client.post(f'/api/route/{self.route.id}/optimize_dates/', body, format='json')
+
+    @skipUnless(export.np is not None, "wymaga numpy")
+    def test_stop_override_keeps_route_wide_min_stay(self):
+        response = self.optimize({"min_stay": 3, "stops": [{"id": self.stops[1].id, "max_stay": 5}], "apply": True})
+
+        self.assertEqual(response.status_code, 200)
+        lengths = [(stop['departure_date'] - stop['arrival_date']).days + 1
+                   for stop in RouteCity.objects.filter(route=self.route).values('arrival_date', 'departure_date')]
+        self.assertEqual(sum(lengths), 8)
+        self.assertTrue(all(length >= 3 for length in lengths))
+        self.assertLessEqual(lengths[1], 5)
+
+    def test_stop_min_stay_above_route_max_stay_is_field_error(self):
+        response = self.optimize({"max_stay": 4, "stops": [{"id": self.stops[1].id, "min_stay": 6}]})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['stops'][0].keys(), {'max_stay'})
 
-# Create your tests here.
@@ -1,6 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import CityViewSet, RouteViewSet, RouteCityViewSet, ForecastDataViewSet, RecommendationViewSet
+from .views import (CityViewSet, RouteViewSet, RouteCityViewSet, ForecastDataViewSet, RecommendationViewSet,
+                    ForecastRefreshJobViewSet, UpstreamMetricsView, ProfilingStatsView, GeocodeView, update_forecast_async)
 
 app_name = 'api'
 
@@ -11,7 +12,12 @@ router.register(r'route_city', RouteCityViewSet)
 router.register(r'forecast_data', ForecastDataViewSet)
 router.register(r'recommendation', RecommendationViewSet)
 router.register(r'city', CityViewSet)
+router.register(r'refresh_job', ForecastRefreshJobViewSet)
 
 urlpatterns = [
 path('', include(router.urls)),
+path('upstream_metrics/', UpstreamMetricsView.as_view(), name='upstream_metrics'),
+path('profiling/', ProfilingStatsView.as_view(), name='profiling'),
+path('geocode/', GeocodeView.as_view(), name='geocode'),
+path('async/route/<int:pk>/update_forecast/', update_forecast_async, name='update_forecast_async'),
 ]
@@ -1,42 +1,203 @@
-from rest_framework.exceptions import PermissionDenied
-from database_manager.models import City, Route, RouteCity, ForecastData, Recommendation
-from .serializers import (CitySerializer, RouteSerializer, RouteCitySerializer, ForecastDataSerializer, RecommendationSerializer)
+from collections import defaultdict
+from asgiref.sync import sync_to_async
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
+from django.conf import settings
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework.exceptions import APIException, NotAuthenticated, PermissionDenied
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from database_manager.models import City, Route, RouteCity, ForecastData, Recommendation, ForecastRefreshJob, ForecastHistory
+from .serializers import (CitySerializer, RouteSerializer, RouteCitySerializer, ForecastDataSerializer, RecommendationSerializer,
+                          ForecastRefreshJobSerializer, RouteCityForecastSerializer, GeoNameSerializer,
+                          RouteDateOptimizationSerializer, ForecastHistorySerializer, ForecastQuerySerializer)
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated
-from rest_framework import viewsets
-from weather_api.utils import fetch_and_save_forecasts_for_route
+from rest_framework.parsers import JSONParser
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.views import APIView
+from rest_framework import serializers, viewsets
+from weather_api.utils import fetch_and_save_forecasts_for_route, afetch_and_save_forecasts_for_route
+from weather_api.jobs import enqueue_route_refresh
+from weather_api.http import upstream_metrics
+from weather_api.ratelimit import get_rate_limiter
+from PUS.profiling import request_stats
+from weather_api.geocoding import search_prefix
+from weather_api.scoring import generate_recommendations
+from weather_api.optimizer import InfeasibleSchedule, optimize_route_dates
+from .pagination import CityPagination, ForecastDataPagination
+from .streaming import StreamingListMixin, NDJSONParser
+from .importing import import_routes
+from .caching import ConditionalGetMixin, TouchOnDestroyMixin, FORECAST_SCOPE
+from .export import CONTENT_TYPES, resolve_format, iter_ndjson, iter_parquet, export_npz_file
 
-class CityViewSet(viewsets.ModelViewSet):
+class CityViewSet(StreamingListMixin, viewsets.ModelViewSet):
     queryset = City.objects.all()
     serializer_class = CitySerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = CityPagination
 
     def get_queryset(self):
         return City.objects.all()
 
 
-class RouteViewSet(viewsets.ModelViewSet):
+class RouteViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Route.objects.all()
     serializer_class = RouteSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Route.objects.filter(user=self.request.user)
+        queryset = Route.objects.filter(user=self.request.user)
+        if self.action in ('forecast', 'recommend', 'recommend_all', 'optimize_dates'):
+            return queryset
+        return queryset.select_related('user').prefetch_related('route_cities', 'recommendations')
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    #odpowiedź zawiera zagnieżdżone postoje i rekomendacje, więc one też wchodzą do ETag
+    def get_validator_querysets(self):
+        [routes] = super().get_validator_querysets()
+        routes = routes.select_related(None).prefetch_related(None)
+        return [
+            routes,
+            RouteCity.objects.filter(route__in=routes.values('id')),
+            Recommendation.objects.filter(route__in=routes.values('id')),
+        ]
+
+    #adres endpointu: http://127.0.0.1:8000/api/route/import/ - wiele tras w jednym żądaniu
+    #body: lista tras w formacie RouteImportSerializer (także {"routes": [...]}) albo NDJSON
+    #(Content-Type: application/x-ndjson, jedna trasa w linii); postoje podają id miasta
+    #?skip_invalid=true zapisuje poprawne trasy mimo błędów w pozostałych
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[JSONParser, NDJSONParser])
+    def bulk_import(self, request):
+        items = request.data.get('routes') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list):
+            return Response({"detail": "Oczekiwano listy tras."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > settings.ROUTE_IMPORT_MAX_ROUTES:
+            return Response({"detail": f"Jednorazowo można zaimportować najwyżej {settings.ROUTE_IMPORT_MAX_ROUTES} tras."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        skip_invalid = request.query_params.get('skip_invalid', '').lower() in ('1', 'true', 'yes')
+        created, errors = import_routes(request.user, items, skip_invalid=skip_invalid)
+        body = {
+            "created": len(created),
+            "route_ids": [route.id for route in created],
+            "errors": [{"index": index, "errors": detail} for index, detail in sorted(errors.items())],
+        }
+        if errors and not created:
+            return Response(body, status=status.HTTP_400_BAD_REQUEST)
+        return Response(body, status=status.HTTP_201_CREATED)
+
     #adres endpointu: http://127.0.0.1:8000/api/route/<route id>/update_forecast/ -u "<username>:<password>"
+    #tryb asynchroniczny: .../update_forecast/?async=true - status pod /api/refresh_job/<job id>/
+    #?force=true pobiera także miasta odświeżone przed chwilą
     @action(detail=True, methods=['post'], url_path='update_forecast')
     def update_forecasts(self, request, pk=None):
         route = self.get_object()
-        fetch_and_save_forecasts_for_route(route)
-        return Response({"detail": "Dane pogodowe zostały zaktualizowane."}, status=status.HTTP_200_OK)
+        if request.query_params.get('async', '').lower() in ('1', 'true', 'yes'):
+            job = enqueue_route_refresh(route)
+            return Response({"detail": "Odświeżanie danych pogodowych zostało zlecone.",
+                             "job": ForecastRefreshJobSerializer(job).data}, status=status.HTTP_202_ACCEPTED)
+        force = request.query_params.get('force', '').lower() in ('1', 'true', 'yes')
+        result = fetch_and_save_forecasts_for_route(route, force=force)
+        if result["errors"]:
+            return Response({"detail": "Nie udało się pobrać danych pogodowych dla części miast.",
+                             **result}, status=status.HTTP_200_OK)
+        return Response({"detail": "Dane pogodowe zostały zaktualizowane.", **result}, status=status.HTTP_200_OK)
+
+
+    #adres endpointu: http://127.0.0.1:8000/api/route/<route id>/forecast/
+    #zwraca postoje trasy wraz z prognozami tylko z okresu pobytu w danym mieście
+    @action(detail=True, methods=['get'], url_path='forecast')
+    def forecast(self, request, pk=None):
+        route = self.get_object()
+        route_cities = list(route.route_cities.select_related('city'))
+
+        forecasts = defaultdict(list)
+        windows = [(rc.city_id, rc.arrival_date, rc.departure_date) for rc in route_cities]
+        for forecast in ForecastData.objects.for_windows(windows).order_by('city', 'date'):
+            forecasts[forecast.city_id].append(forecast)
+
+        for route_city in route_cities:
+            route_city.window_forecasts = [
+                forecast for forecast in forecasts[route_city.city_id]
+                if route_city.arrival_date <= forecast.date <= route_city.departure_date
+            ]
+
+        serializer = RouteCityForecastSerializer(route_cities, many=True, context=self.get_serializer_context())
+        return Response({"id": route.id, "name": route.name, "route_cities": serializer.data})
+
+
+    #adres endpointu: http://127.0.0.1:8000/api/route/<route id>/recommend/
+    #wylicza ocenę pogody dla postojów i zastępuje automatyczne rekomendacje trasy
+    @action(detail=True, methods=['post'], url_path='recommend')
+    def recommend(self, request, pk=None):
+        route = self.get_object()
+        scores = generate_recommendations(Route.objects.filter(pk=route.pk))
+        return Response(self.recommendation_response(scores, [route.id]), status=status.HTTP_200_OK)
+
+    #adres endpointu: http://127.0.0.1:8000/api/route/recommend/ - wszystkie trasy użytkownika naraz
+    @action(detail=False, methods=['post'], url_path='recommend')
+    def recommend_all(self, request):
+        routes = Route.objects.filter(user=request.user)
+        scores = generate_recommendations(routes)
+        return Response(self.recommendation_response(scores, routes.values_list('id', flat=True)), status=status.HTTP_200_OK)
+
+    #adres endpointu: http://127.0.0.1:8000/api/route/<route id>/optimize_dates/
+    #body (opcjonalnie): {"min_stay": 1, "max_stay": 4, "stops": [{"id": <route city id>, "min_stay": 2}], "apply": false}
+    #proponuje daty pobytu w kolejności position w okresie starts_at..ends_at; "apply": true zapisuje je w trasie
+    @action(detail=True, methods=['post'], url_path='optimize_dates')
+    def optimize_dates(self, request, pk=None):
+        route = self.get_object()
+        params = RouteDateOptimizationSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        options = params.validated_data
+
+        route_cities = list(route.route_cities.order_by('position'))
+        stop_limits = {
+            stop['id']: (stop['min_stay'], stop['max_stay'])
+            for stop in options['stops']
+        }
+        unknown = stop_limits.keys() - {rc.id for rc in route_cities}
+        if unknown:
+            raise serializers.ValidationError({"stops": f"Postoje {sorted(unknown)} nie należą do tej trasy"})
+
+        try:
+            result = optimize_route_dates(route, route_cities, options['min_stay'], options.get('max_stay'), stop_limits)
+        except InfeasibleSchedule:
+            return Response({"detail": "Nie da się rozplanować postojów w okresie trasy przy podanych ograniczeniach."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        if options['apply']:
+            dates = {stop['id']: stop for stop in result['stops']}
+            for route_city in route_cities:
+                route_city.arrival_date = dates[route_city.id]['arrival_date']
+                route_city.departure_date = dates[route_city.id]['departure_date']
+                route_city.updated_at = timezone.now()
+            RouteCity.objects.bulk_update(route_cities, ['arrival_date', 'departure_date', 'updated_at'])
+        return Response({"id": route.id, "applied": options['apply'], **result}, status=status.HTTP_200_OK)
+
+    def recommendation_response(self, scores, route_ids):
+        recommendations = Recommendation.objects.filter(route_id__in=route_ids, generated=True).order_by('route_id', 'id')
+        return {
+            "scores": scores,
+            "recommendations": RecommendationSerializer(recommendations, many=True, context=self.get_serializer_context()).data,
+        }
+
+
+class ForecastRefreshJobViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = ForecastRefreshJob.objects.all()
+    serializer_class = ForecastRefreshJobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return ForecastRefreshJob.objects.filter(route__user=self.request.user)
 
 
-class RouteCityViewSet(viewsets.ModelViewSet):
+class RouteCityViewSet(TouchOnDestroyMixin, StreamingListMixin, viewsets.ModelViewSet):
     queryset = RouteCity.objects.all()
     serializer_class = RouteCitySerializer
     permission_classes = [IsAuthenticated]
@@ -45,16 +206,98 @@ class RouteCityViewSet(viewsets.ModelViewSet):
         return RouteCity.objects.filter(route__user=self.request.user)
 
 
-class ForecastDataViewSet(viewsets.ModelViewSet):
+class ForecastDataViewSet(ConditionalGetMixin, TouchOnDestroyMixin, StreamingListMixin, viewsets.ModelViewSet):
     queryset = ForecastData.objects.all()
     serializer_class = ForecastDataSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = ForecastDataPagination
 
+    #filtry: ?city=1,2&date__gte=2025-05-01&date__lte=2025-05-10&route=3&fields=city,date,temp
     def get_queryset(self):
-        return ForecastData.objects.filter(city__in=City.objects.filter(in_routes__route__user=self.request.user))
+        queryset = ForecastData.objects.filter(city__in=City.objects.filter(in_routes__route__user=self.request.user))
+        if self.action not in ('list', 'export'):
+            return queryset
 
+        # kolejność zgodna z indeksem forecast_city_date_desc_idx, bez złączenia z City z Meta.ordering
+        queryset = queryset.order_by(*ForecastDataPagination.ordering)
+        params = self.request.query_params
+        if params.get('city'):
+            city_ids = [serializers.IntegerField().run_validation(value) for value in params['city'].split(',')]
+            queryset = queryset.filter(city_id__in=city_ids)
+        if params.get('date__gte'):
+            queryset = queryset.filter(date__gte=serializers.DateField().run_validation(params['date__gte']))
+        if params.get('date__lte'):
+            queryset = queryset.filter(date__lte=serializers.DateField().run_validation(params['date__lte']))
+        if params.get('route'):
+            route_id = serializers.IntegerField().run_validation(params['route'])
+            queryset = queryset.filter(city__in=RouteCity.objects.filter(
+                route_id=route_id, route__user=self.request.user
+            ).values('city_id'))
 
-class RecommendationViewSet(viewsets.ModelViewSet):
+        requested = self.get_serializer().get_requested_fields()
+        if requested:
+            model_fields = {field.name for field in ForecastData._meta.concrete_fields}
+            queryset = queryset.only('id', 'city', 'date', *(requested & model_fields))
+        return queryset
+
+    def get_validator_scopes(self):
+        return [self.request.user.pk, FORECAST_SCOPE]
+
+    #adres endpointu: http://127.0.0.1:8000/api/forecast_data/history/?city=1&date__gte=2025-05-01&date__lte=2025-05-10
+    #kolejne wersje prognoz dni z zakresu; zakres dat jest wymagany, więc zapytanie czyta tylko partycje tych miesięcy
+    @action(detail=False, methods=['get'], url_path='history')
+    def history(self, request):
+        params = request.query_params
+        if not all(params.get(name) for name in ('city', 'date__gte', 'date__lte')):
+            raise serializers.ValidationError("Wymagane parametry: city, date__gte, date__lte")
+        city_id = serializers.IntegerField().run_validation(params.get('city'))
+        date_from = serializers.DateField().run_validation(params.get('date__gte'))
+        date_to = serializers.DateField().run_validation(params.get('date__lte'))
+        queryset = ForecastHistory.objects.filter(
+            city_id=city_id,
+            date__range=(date_from, date_to),
+            city__in=City.objects.filter(in_routes__route__user=request.user),
+        ).order_by('date', 'fetched_at')
+        return Response(ForecastHistorySerializer(queryset, many=True).data)
+
+    #adres endpointu: http://127.0.0.1:8000/api/forecast_data/query/ - prognozy dla wielu okien jednym zapytaniem SQL
+    #body: {"windows": [{"city": 1, "date_from": "2025-05-01", "date_to": "2025-05-03"}, [2, "2025-05-02", "2025-05-04"]],
+    #       "fields": ["date", "temp"]} (fields opcjonalnie); wyniki w kolejności okien, bez serializerów modelu
+    @action(detail=False, methods=['post'], url_path='query')
+    def query(self, request):
+        serializer = ForecastQuerySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        windows = serializer.validated_data['windows']
+        fields = serializer.validated_data.get('fields', ForecastDataSerializer.Meta.fields)
+
+        rows = ForecastData.objects.window_rows(
+            windows, fields, cities=City.objects.filter(in_routes__route__user=request.user)
+        )
+        results = [
+            {"city": city_id, "date_from": date_from, "date_to": date_to,
+             "forecasts": [dict(zip(fields, values)) for values in window_rows]}
+            for (city_id, date_from, date_to), window_rows in zip(windows, rows)
+        ]
+        return Response({"results": results})
+
+    #adres endpointu: http://127.0.0.1:8000/api/forecast_data/export/?output=npz|parquet|ndjson (+ filtry jak wyżej)
+    #dane w układzie kolumnowym prosto z values_list, bez serializerów
+    @action(detail=False, methods=['get'], url_path='export')
+    def export(self, request):
+        export_format = resolve_format(request.query_params.get('output'))
+        queryset = self.get_queryset()
+        filename = f'forecasts.{export_format}'
+        if export_format == 'npz':
+            #npz to archiwum zip, które trzeba zapisać w całości przed wysłaniem - plik tymczasowy zamiast pamięci
+            return FileResponse(export_npz_file(queryset), as_attachment=True, filename=filename,
+                                content_type=CONTENT_TYPES['npz'])
+        rows = iter_parquet(queryset) if export_format == 'parquet' else iter_ndjson(queryset)
+        response = StreamingHttpResponse(rows, content_type=CONTENT_TYPES[export_format])
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class RecommendationViewSet(TouchOnDestroyMixin, viewsets.ModelViewSet):
     queryset = Recommendation.objects.all()
     serializer_class = RecommendationSerializer
     permission_classes = [IsAuthenticated]
@@ -67,3 +310,65 @@ class RecommendationViewSet(viewsets.ModelViewSet):
         if route.user != self.request.user:
             raise PermissionDenied()
         serializer.save()
+
+
+#adres endpointu: http://127.0.0.1:8000/api/upstream_metrics/ - tylko dla administratorów
+class UpstreamMetricsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        limiter = get_rate_limiter()
+        # rate_limit: stan wspólnego kubełka tokenów, kolejka oczekujących i czasy oczekiwania według priorytetu
+        return Response({**upstream_metrics.snapshot(), "rate_limit": limiter.snapshot() if limiter else None})
+
+
+#adres endpointu: http://127.0.0.1:8000/api/profiling/ - tylko dla administratorów (wymaga API_PROFILING = True)
+class ProfilingStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({"enabled": settings.API_PROFILING, **request_stats.snapshot()})
+
+
+#adres endpointu: http://127.0.0.1:8000/api/geocode/?q=<początek nazwy miasta>
+class GeocodeView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        limit = serializers.IntegerField(min_value=1, max_value=50).run_validation(request.query_params.get('limit', 10))
+        results = search_prefix(request.query_params.get('q', ''), limit=limit)
+        return Response(GeoNameSerializer(results, many=True).data)
+
+
+def authenticate(request):
+    """Uwierzytelnienie jak w widokach DRF (sesja, Basic) dla zwykłych widoków Django."""
+    authenticators = [authenticator() for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    user = Request(request, authenticators=authenticators).user
+    if not user.is_authenticated:
+        raise NotAuthenticated()
+    return user
+
+
+#adres endpointu: http://127.0.0.1:8000/api/async/route/<route id>/update_forecast/ -u "<username>:<password>"
+#wersja dla ASGI (np. uvicorn PUS.asgi:application): miasta są pobierane współbieżnie w pętli zdarzeń,
+#więc jeden proces prowadzi wiele odświeżeń naraz bez zajmowania wątków; ?force=true jak w wersji synchronicznej
+@csrf_exempt
+@require_POST
+async def update_forecast_async(request, pk):
+    try:
+        user = await sync_to_async(authenticate)(request)
+    except APIException as e:
+        response = JsonResponse({"detail": e.detail}, status=e.status_code)
+        if isinstance(e, NotAuthenticated):
+            response['WWW-Authenticate'] = 'Basic realm="api"'
+        return response
+
+    route = await Route.objects.filter(pk=pk, user=user).afirst()
+    if route is None:
+        return JsonResponse({"detail": "Nie znaleziono."}, status=status.HTTP_404_NOT_FOUND)
+
+    force = request.GET.get('force', '').lower() in ('1', 'true', 'yes')
+    result = await afetch_and_save_forecasts_for_route(route, force=force)
+    if result["errors"]:
+        return JsonResponse({"detail": "Nie udało się pobrać danych pogodowych dla części miast.", **result})
+    return JsonResponse({"detail": "Dane pogodowe zostały zaktualizowane.", **result})
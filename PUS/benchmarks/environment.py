@@ -0,0 +1,64 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+
+def setup_django():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "PUS.settings")
+    import django
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    """
+    Osobna baza testowa (jak w manage.py test) usuwana po pomiarze. Dla SQLite jest to plik,
+    a nie baza w pamięci, żeby wątki serwera mogły równolegle zapisywać.
+    """
+    from django.db import connection, connections
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    directory = None
+    if connection.vendor == "sqlite" and not connection.settings_dict["TEST"].get("NAME"):
+        directory = tempfile.TemporaryDirectory()
+        connection.settings_dict["TEST"]["NAME"] = os.path.join(directory.name, "benchmark.sqlite3")
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        if directory is not None:
+            directory.cleanup()
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def summarize(name, latencies, elapsed, **extra):
+    """Wiersz raportu: przepustowość i percentyle opóźnień w ms."""
+    row = {
+        "scenario": name,
+        "requests": len(latencies),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+    }
+    for p in (50, 95, 99):
+        value = percentile(latencies, p)
+        row[f"p{p}_ms"] = round(value * 1000, 1) if value is not None else None
+    row.update(extra)
+    return row
+
+
+def print_report(rows):
+    columns = list(dict.fromkeys(column for row in rows for column in row))
+    widths = {column: max(len(column), *(len(str(row.get(column, ""))) for row in rows)) for column in columns}
+    print("  ".join(column.ljust(widths[column]) for column in columns))
+    for row in rows:
+        print("  ".join(str(row.get(column, "")).ljust(widths[column]) for column in columns))
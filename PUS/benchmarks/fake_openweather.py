@@ -0,0 +1,152 @@
+import json
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FORECAST_PATH = "/data/2.5/forecast/daily"
+
+
+def build_daily_forecast(location, days=16, start=None):
+    """Deterministyczna (zależna od lokalizacji) prognoza w formacie OpenWeather /forecast/daily."""
+    rng = random.Random(location)
+    start = start or datetime.now().replace(hour=12, minute=0, second=0, microsecond=0)
+    latitude, longitude = rng.uniform(-60, 60), rng.uniform(-180, 180)
+    forecasts = []
+    for day in range(days):
+        temp = rng.uniform(-5, 32)
+        forecasts.append({
+            "dt": int((start + timedelta(days=day)).timestamp()),
+            "temp": {"day": temp, "min": temp - rng.uniform(2, 8), "max": temp + rng.uniform(2, 8)},
+            "feels_like": {"day": temp - rng.uniform(0, 3)},
+            "pressure": rng.randint(990, 1035),
+            "humidity": rng.randint(30, 100),
+            "weather": [rng.choice([
+                {"main": "Clear", "description": "bezchmurnie"},
+                {"main": "Clouds", "description": "zachmurzenie umiarkowane"},
+                {"main": "Rain", "description": "lekki deszcz"},
+            ])],
+            "speed": rng.uniform(0, 15),
+            "clouds": rng.randint(0, 100),
+            "pop": rng.random(),
+            "rain": rng.uniform(0, 10),
+        })
+    return {"city": {"name": location, "coord": {"lat": latitude, "lon": longitude}},
+            "cnt": len(forecasts), "list": forecasts}
+
+
+class FakeOpenWeatherHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != FORECAST_PATH:
+            return self.send_json(404, {"cod": "404", "message": "Not found"})
+
+        params = {name: values[0] for name, values in parse_qs(url.query).items()}
+        status, delay = self.server.next_outcome()
+        time.sleep(delay)
+
+        if status == 429:
+            return self.send_json(429, {"cod": 429, "message": "Too many requests"},
+                                  {"Retry-After": str(self.server.retry_after)})
+        if status != 200:
+            return self.send_json(status, {"cod": str(status), "message": "Internal error"})
+        location = params.get("q") or f"{params.get('lat')},{params.get('lon')}"
+        days = min(int(params.get("cnt", 16)), 16)
+        self.send_json(200, build_daily_forecast(location, days))
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeOpenWeatherServer(ThreadingHTTPServer):
+    """
+    Lokalny zamiennik OpenWeather (każde zapytanie w osobnym wątku).
+    latency ± jitter - opóźnienie odpowiedzi w sekundach, error_rate - odsetek odpowiedzi 500,
+    rate_limit_rate - odsetek odpowiedzi 429 z nagłówkiem Retry-After; seed ustala losowanie.
+    Użycie: with FakeOpenWeatherServer(latency=0.2) as server: settings.OPENWEATHER_BASE_URL = server.url
+    """
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, latency=0.1, jitter=0.0, error_rate=0.0, rate_limit_rate=0.0, retry_after=0,
+                 seed=None, host="127.0.0.1", port=0):
+        super().__init__((host, port), FakeOpenWeatherHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.requests = 0
+        self.statuses = Counter()
+        self._random = random.Random(seed)
+        self._counter_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{FORECAST_PATH}"
+
+    def next_outcome(self):
+        """Losuje (status, opóźnienie) kolejnej odpowiedzi i zlicza statusy."""
+        with self._counter_lock:
+            draw = self._random.random()
+            if draw < self.rate_limit_rate:
+                status = 429
+            elif draw < self.rate_limit_rate + self.error_rate:
+                status = 500
+            else:
+                status = 200
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            self.requests += 1
+            self.statuses[status] += 1
+        return status, delay
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Lokalny serwer udający OpenWeather /data/2.5/forecast/daily")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--latency", type=float, default=0.1, help="Opóźnienie odpowiedzi w sekundach")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Losowe odchylenie opóźnienia w sekundach")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Odsetek odpowiedzi 500 (0-1)")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Odsetek odpowiedzi 429 (0-1)")
+    parser.add_argument("--retry-after", type=int, default=0, help="Wartość nagłówka Retry-After przy 429")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    server = FakeOpenWeatherServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                                   rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+                                   seed=args.seed, port=args.port)
+    print(f"OPENWEATHER_BASE_URL = \"{server.url}\"")
+    server.serve_forever()
@@ -0,0 +1,110 @@
+"""
+Przepustowość odświeżania prognoz tras: widok synchroniczny (WSGI, stała liczba wątków
+jak w serwerze wątkowym/gunicorn) kontra widok asynchroniczny (ASGI, jedna pętla zdarzeń),
+oba na lokalnym serwerze udającym OpenWeather.
+
+    cd PUS && python -m benchmarks.refresh_sync_vs_async --routes 40 --cities 5 --latency 0.2
+"""
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from .environment import setup_django, test_database, summarize, print_report
+
+setup_django()
+
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.test import AsyncClient, Client, override_settings
+from django.utils import timezone
+from database_manager.models import City, Route, RouteCity
+from weather_api.cache import get_forecast_cache
+from .fake_openweather import FakeOpenWeatherServer
+
+
+def seed_routes(user, routes, cities_per_route, prefix):
+    """Trasy z własnymi miastami (bez współrzędnych), żeby każde odświeżenie pytało upstream."""
+    today = timezone.localdate()
+    created = []
+    for i in range(routes):
+        route = Route.objects.create(name=f"{prefix} {i}", user=user, starts_at=today,
+                                     ends_at=today + timedelta(days=cities_per_route))
+        for position in range(cities_per_route):
+            city = City.objects.create(city_name=f"{prefix} {i}-{position}")
+            RouteCity.objects.create(route=route, city=city, position=position,
+                                     arrival_date=today + timedelta(days=position),
+                                     departure_date=today + timedelta(days=position + 1))
+        created.append(route)
+    return created
+
+
+def run_sync(user, routes, threads):
+    def refresh(route):
+        client = Client()
+        client.force_login(user)
+        started = time.perf_counter()
+        try:
+            response = client.post(f"/api/route/{route.id}/update_forecast/?force=true")
+            assert response.status_code == 200, response.content
+            return time.perf_counter() - started
+        finally:
+            # klient testowy nie zamyka połączeń z bazą po żądaniu
+            connections.close_all()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        latencies = list(executor.map(refresh, routes))
+    return latencies, time.perf_counter() - started
+
+
+async def run_async(user, routes, concurrency):
+    client = AsyncClient()
+    await client.aforce_login(user)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def refresh(route):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post(f"/api/async/route/{route.id}/update_forecast/?force=true")
+            assert response.status_code == 200, response.content
+            return time.perf_counter() - started
+
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(refresh(route) for route in routes))
+    return list(latencies), time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--routes", type=int, default=40, help="Liczba odświeżanych tras (żądań)")
+    parser.add_argument("--cities", type=int, default=5, help="Liczba miast na trasie")
+    parser.add_argument("--latency", type=float, default=0.2, help="Opóźnienie upstream w sekundach")
+    parser.add_argument("--threads", type=int, default=4, help="Wątki serwera WSGI")
+    parser.add_argument("--concurrency", type=int, default=40, help="Równoległe żądania do ASGI")
+    args = parser.parse_args()
+
+    with FakeOpenWeatherServer(latency=args.latency) as server, test_database(), \
+            override_settings(OPENWEATHER_BASE_URL=server.url, OPENWEATHER_RATE_LIMIT=0):
+        user = get_user_model().objects.create_user(username="benchmark", password="benchmark")
+        rows = []
+
+        get_forecast_cache().clear()
+        routes = seed_routes(user, args.routes, args.cities, "sync")
+        before = server.requests
+        latencies, elapsed = run_sync(user, routes, args.threads)
+        rows.append(summarize(f"WSGI ({args.threads} wątki)", latencies, elapsed,
+                              upstream_requests=server.requests - before))
+
+        get_forecast_cache().clear()
+        routes = seed_routes(user, args.routes, args.cities, "async")
+        before = server.requests
+        latencies, elapsed = asyncio.run(run_async(user, routes, args.concurrency))
+        rows.append(summarize(f"ASGI (współbieżność {args.concurrency})", latencies, elapsed,
+                              upstream_requests=server.requests - before))
+
+    print_report(rows)
+
+
+if __name__ == "__main__":
+    main()
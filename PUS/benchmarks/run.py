@@ -0,0 +1,119 @@
+"""
+Benchmark API na powtarzalnych danych i lokalnym serwerze udającym OpenWeather.
+Dla każdego scenariusza raportuje przepustowość, opóźnienia p50/p95/p99,
+liczbę zapytań SQL na żądanie i statusy odpowiedzi upstream.
+
+    cd PUS && python -m benchmarks.run --requests 100 --latency 0.05 --error-rate 0.05 --rate-limit-rate 0.05
+    cd PUS && python -m benchmarks.run --scenario route_list --scenario forecast_refresh --json wyniki.json
+"""
+import argparse
+import json
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from .environment import setup_django, test_database, summarize, print_report
+
+setup_django()
+
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from .fake_openweather import FakeOpenWeatherServer
+from .scenarios import SCENARIOS
+from .seed import DataGenerator
+
+
+def seed_data(options):
+    generator = DataGenerator(seed=options.seed)
+    users = generator.users(options.users)
+    cities = generator.cities(options.cities)
+    routes = generator.routes(users, cities, per_user=options.routes_per_user, stops=options.stops)
+    forecasts = generator.forecasts(cities)
+    print(f"Dane: {len(users)} użytkowników, {len(cities)} miast, {len(routes)} tras, {forecasts} prognoz")
+    return {"prefix": generator.prefix, "users": users, "cities": cities, "routes": routes}
+
+
+def run_scenario(scenario, requests, concurrency):
+    """Zwraca (próbki (czas, liczba zapytań, czy oczekiwany status), czas całkowity)."""
+    def worker(indices):
+        client = Client()
+        client.force_login(scenario.user)
+        samples = []
+        try:
+            for index in indices:
+                scenario.prepare(client, index)
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = scenario.request(client, index)
+                    elapsed = time.perf_counter() - started
+                samples.append((elapsed, len(queries), response.status_code in scenario.expected_status))
+        finally:
+            # klient testowy nie zamyka połączeń z bazą po żądaniu
+            connections.close_all()
+        return samples
+
+    batches = [range(start, requests, concurrency) for start in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = [sample for batch in executor.map(worker, batches) for sample in batch]
+    return samples, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="Scenariusz do uruchomienia (można powtarzać); domyślnie wszystkie")
+    parser.add_argument("--requests", type=int, default=50, help="Liczba żądań w scenariuszu")
+    parser.add_argument("--concurrency", type=int, default=1, help="Liczba równoległych klientów (wątków)")
+    parser.add_argument("--seed", type=int, default=0, help="Ziarno generatora danych i serwera upstream")
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--cities", type=int, default=200)
+    parser.add_argument("--routes-per-user", type=int, default=20)
+    parser.add_argument("--stops", type=int, default=5, help="Liczba postojów na trasie")
+    parser.add_argument("--latency", type=float, default=0.05, help="Opóźnienie upstream w sekundach")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Losowe odchylenie opóźnienia upstream")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Odsetek odpowiedzi 500 upstream (0-1)")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Odsetek odpowiedzi 429 upstream (0-1)")
+    parser.add_argument("--retry-after", type=int, default=0, help="Nagłówek Retry-After przy 429 (sekundy)")
+    parser.add_argument("--upstream-rate-limit", type=int, default=0,
+                        help="Wspólny limit zapytań do OpenWeather na minutę (OPENWEATHER_RATE_LIMIT); domyślnie wyłączony")
+    parser.add_argument("--json", dest="json_path", help="Zapisz wyniki również do pliku JSON")
+    parser.add_argument("--list", action="store_true", help="Wypisz dostępne scenariusze i zakończ")
+    options = parser.parse_args()
+
+    if options.list:
+        for name, scenario in SCENARIOS.items():
+            print(f"{name:18} {scenario.description}")
+        return
+
+    server = FakeOpenWeatherServer(latency=options.latency, jitter=options.jitter, error_rate=options.error_rate,
+                                   rate_limit_rate=options.rate_limit_rate, retry_after=options.retry_after,
+                                   seed=options.seed)
+    rows = []
+    with server, test_database(), override_settings(OPENWEATHER_BASE_URL=server.url,
+                                                    OPENWEATHER_RATE_LIMIT=options.upstream_rate_limit):
+        data = seed_data(options)
+        for name in options.scenario or SCENARIOS:
+            scenario = SCENARIOS[name]()
+            scenario.setup(data)
+            statuses_before = Counter(server.statuses)
+            samples, elapsed = run_scenario(scenario, options.requests, options.concurrency)
+
+            query_counts = [queries for _, queries, _ in samples]
+            upstream = server.statuses - statuses_before
+            rows.append(summarize(
+                name, [latency for latency, _, _ in samples], elapsed,
+                errors=sum(1 for _, _, ok in samples if not ok),
+                queries_avg=round(sum(query_counts) / len(query_counts), 1) if query_counts else None,
+                queries_max=max(query_counts, default=None),
+                upstream=" ".join(f"{status}:{count}" for status, count in sorted(upstream.items())) or "-",
+            ))
+
+    print_report(rows)
+    if options.json_path:
+        with open(options.json_path, "w", encoding="utf-8") as file:
+            json.dump(rows, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+from django.core.cache import cache
+from weather_api.cache import get_forecast_cache
+
+
+class Scenario:
+    """
+    Scenariusz obciążeniowy: setup() przygotowuje stan na wspólnym zbiorze danych,
+    prepare() działa przed każdym żądaniem poza pomiarem czasu, request() wysyła mierzone żądanie.
+    """
+    name = None
+    description = ""
+    expected_status = (200,)
+
+    def setup(self, data):
+        self.data = data
+        self.user = data["users"][0]
+
+    def prepare(self, client, index):
+        pass
+
+    def request(self, client, index):
+        raise NotImplementedError
+
+
+class RouteListScenario(Scenario):
+    name = "route_list"
+    description = "GET /api/route/ - lista tras z postojami i rekomendacjami (bez cache odpowiedzi)"
+
+    def prepare(self, client, index):
+        # bez tego kolejne żądania byłyby obsługiwane z cache wyrenderowanych odpowiedzi
+        cache.clear()
+
+    def request(self, client, index):
+        return client.get("/api/route/")
+
+
+class RouteListNotModifiedScenario(Scenario):
+    name = "route_list_304"
+    description = "GET /api/route/ z If-None-Match - tylko agregaty walidatorów"
+    expected_status = (304,)
+
+    def prepare(self, client, index):
+        if not hasattr(client, "etag"):
+            client.etag = client.get("/api/route/")["ETag"]
+
+    def request(self, client, index):
+        return client.get("/api/route/", HTTP_IF_NONE_MATCH=client.etag)
+
+
+class ForecastListScenario(Scenario):
+    name = "forecast_list"
+    description = "GET /api/forecast_data/ - pierwsza strona prognoz miast użytkownika"
+
+    def prepare(self, client, index):
+        cache.clear()
+
+    def request(self, client, index):
+        return client.get("/api/forecast_data/")
+
+
+class ForecastRefreshScenario(Scenario):
+    name = "forecast_refresh"
+    description = "POST /api/route/<id>/update_forecast/?force=true - pobranie z (lokalnego) OpenWeather i zapis"
+
+    def setup(self, data):
+        super().setup(data)
+        self.routes = [route for route in data["routes"] if route.user_id == self.user.id]
+
+    def prepare(self, client, index):
+        get_forecast_cache().clear()
+
+    def request(self, client, index):
+        route = self.routes[index % len(self.routes)]
+        return client.post(f"/api/route/{route.id}/update_forecast/?force=true")
+
+
+class CityCreateScenario(Scenario):
+    name = "city_create"
+    description = "POST /api/city/ - nowe miasto ze współrzędnymi z (lokalnego) OpenWeather"
+    expected_status = (201,)
+
+    def request(self, client, index):
+        return client.post("/api/city/", {"city_name": f"{self.data['prefix']}-new-city-{index}"})
+
+
+SCENARIOS = {
+    scenario.name: scenario
+    for scenario in (RouteListScenario, RouteListNotModifiedScenario, ForecastListScenario,
+                     ForecastRefreshScenario, CityCreateScenario)
+}
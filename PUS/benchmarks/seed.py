@@ -0,0 +1,77 @@
+import random
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from database_manager.geo import encode_geohash
+from database_manager.models import City, Route, RouteCity, ForecastData
+from weather_api.utils import FORECAST_DAYS, build_forecast_defaults, forecast_hash
+from .fake_openweather import build_daily_forecast
+
+
+class DataGenerator:
+    """
+    Powtarzalne (seed) dane do benchmarków: użytkownicy, miasta, trasy z postojami i prognozy.
+    Wiersze są tworzone przez bulk_create, więc nawet duże zbiory powstają w kilka sekund.
+    """
+
+    def __init__(self, seed=0, prefix="bench"):
+        self.random = random.Random(seed)
+        self.prefix = prefix
+        self.today = timezone.localdate()
+
+    def users(self, count):
+        User = get_user_model()
+        users = [User(username=f"{self.prefix}-user-{i}") for i in range(count)]
+        for user in users:
+            user.set_unusable_password()
+        User.objects.bulk_create(users)
+        return list(User.objects.filter(username__startswith=f"{self.prefix}-user-").order_by("id"))
+
+    def cities(self, count, with_coordinates=True):
+        cities = []
+        for i in range(count):
+            latitude = longitude = None
+            if with_coordinates:
+                latitude = round(self.random.uniform(35, 70), 6)
+                longitude = round(self.random.uniform(-10, 40), 6)
+            # bulk_create pomija City.save(), więc geohash jest liczony tutaj
+            cities.append(City(city_name=f"{self.prefix}-city-{i}", latitude=latitude, longitude=longitude,
+                               geohash=encode_geohash(latitude, longitude)))
+        City.objects.bulk_create(cities)
+        return list(City.objects.filter(city_name__startswith=f"{self.prefix}-city-").order_by("id"))
+
+    def routes(self, users, cities, per_user, stops):
+        """Trasy rozpoczynające się w ciągu 16 dni, każdy postój trwa 1-3 dni."""
+        routes = []
+        plans = []
+        for user in users:
+            for i in range(per_user):
+                starts_at = self.today + timedelta(days=self.random.randrange(FORECAST_DAYS // 2))
+                stays = [self.random.randint(1, 3) for _ in range(stops)]
+                routes.append(Route(name=f"{self.prefix}-route-{user.id}-{i}", user=user, starts_at=starts_at,
+                                    ends_at=starts_at + timedelta(days=sum(stays) - 1)))
+                plans.append(stays)
+        Route.objects.bulk_create(routes)
+        routes = list(Route.objects.filter(name__startswith=f"{self.prefix}-route-").order_by("id"))
+
+        route_cities = []
+        for route, stays in zip(routes, plans):
+            day = route.starts_at
+            for position, (city, stay) in enumerate(zip(self.random.sample(cities, len(stays)), stays)):
+                route_cities.append(RouteCity(route=route, city=city, position=position, arrival_date=day,
+                                              departure_date=day + timedelta(days=stay - 1)))
+                day += timedelta(days=stay)
+        RouteCity.objects.bulk_create(route_cities)
+        return routes
+
+    def forecasts(self, cities, days=FORECAST_DAYS):
+        """Prognozy na days dni od dziś dla każdego miasta (te same dane co z lokalnego serwera OpenWeather)."""
+        forecasts = []
+        for city in cities:
+            data = build_daily_forecast(city.city_name, days)
+            for day, forecast in enumerate(data["list"]):
+                defaults = build_forecast_defaults(forecast)
+                forecasts.append(ForecastData(city=city, date=self.today + timedelta(days=day),
+                                              content_hash=forecast_hash(defaults), **defaults))
+        ForecastData.objects.bulk_create(forecasts, batch_size=2000)
+        return len(forecasts)
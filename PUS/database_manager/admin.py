@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import City, Route, RouteCity, ForecastData, Recommendation
+from .models import City, Route, RouteCity, ForecastData, Recommendation, ForecastRefreshJob, GeoName, ForecastHistory
 
 # Register your models here.
 admin.site.register(City)
@@ -7,3 +7,6 @@ admin.site.register(Route)
 admin.site.register(RouteCity)
 admin.site.register(ForecastData)
 admin.site.register(Recommendation)
+admin.site.register(ForecastRefreshJob)
+admin.site.register(GeoName)
+admin.site.register(ForecastHistory)
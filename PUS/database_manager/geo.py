@@ -0,0 +1,95 @@
+import math
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Geohash punktu albo '' dla brakujących lub niepoprawnych współrzędnych."""
+    if latitude is None or longitude is None:
+        return ""
+    latitude, longitude = float(latitude), float(longitude)
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return ""
+
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    geohash, bits, bit_count, even = [], 0, 0, True
+    while len(geohash) < precision:
+        value, interval = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(GEOHASH_ALPHABET[bits])
+            bits, bit_count = 0, 0
+    return "".join(geohash)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, map(float, (lat1, lon1, lat2, lon2)))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class CityGrid:
+    """
+    Siatka o komórkach nie mniejszych niż radius_km. Miasto oddalone od innego o najwyżej
+    radius_km leży w tej samej albo w sąsiedniej komórce, więc wystarczy przejrzeć 3x3 komórki.
+    """
+
+    def __init__(self, radius_km):
+        self.radius_km = radius_km
+        self.lat_step = radius_km / KM_PER_DEGREE
+        self.cells = {}
+
+    def lon_step(self, row):
+        # szerokość liczona na brzegu wiersza bliższym biegunowi, gdzie stopień długości jest najkrótszy
+        latitude = min(max(abs(row * self.lat_step), abs((row + 1) * self.lat_step)), 89.9)
+        return min(self.radius_km / (KM_PER_DEGREE * math.cos(math.radians(latitude))), 360.0)
+
+    def cell(self, latitude, longitude, row=None):
+        if row is None:
+            row = math.floor(latitude / self.lat_step)
+        return row, math.floor(longitude / self.lon_step(row))
+
+    def neighbours(self, latitude, longitude):
+        row = math.floor(latitude / self.lat_step)
+        for neighbour_row in (row - 1, row, row + 1):
+            _, column = self.cell(latitude, longitude, neighbour_row)
+            for neighbour_column in (column - 1, column, column + 1):
+                yield from self.cells.get((neighbour_row, neighbour_column), [])
+
+    def add(self, latitude, longitude, item):
+        self.cells.setdefault(self.cell(latitude, longitude), []).append(item)
+
+
+def group_nearby_cities(cities, radius_km):
+    """
+    Dzieli miasta ze współrzędnymi na grupy miast oddalonych od pierwszego miasta grupy
+    o nie więcej niż radius_km. Zwraca listę list; radius_km <= 0 wyłącza grupowanie.
+    """
+    if radius_km <= 0:
+        return [[city] for city in cities]
+
+    grid = CityGrid(radius_km)
+    groups = []
+    for city in cities:
+        latitude, longitude = float(city.latitude), float(city.longitude)
+        for group in grid.neighbours(latitude, longitude):
+            leader = group[0]
+            if haversine_km(leader.latitude, leader.longitude, latitude, longitude) <= radius_km:
+                group.append(city)
+                break
+        else:
+            group = [city]
+            groups.append(group)
+            grid.add(latitude, longitude, group)
+    return groups
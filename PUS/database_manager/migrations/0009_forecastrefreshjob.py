@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database_manager', '0008_city_latitude_city_longitude'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ForecastRefreshJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=16)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('route', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='refresh_jobs', to='database_manager.route')),
+            ],
+            options={
+                'verbose_name': 'Forecast Refresh Job',
+                'verbose_name_plural': 'Forecast Refresh Jobs',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='refresh_job_status_idx')],
+            },
+        ),
+    ]
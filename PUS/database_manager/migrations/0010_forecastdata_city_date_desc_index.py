@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database_manager', '0009_forecastrefreshjob'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='forecastdata',
+            options={'ordering': ['city_id', '-date'], 'verbose_name': 'Forecast Data', 'verbose_name_plural': 'Forecast Data'},
+        ),
+        migrations.AddIndex(
+            model_name='forecastdata',
+            index=models.Index(fields=['city', '-date'], name='forecast_city_date_desc_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database_manager', '0010_forecastdata_city_date_desc_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='routecity',
+            options={'ordering': ['route_id', 'position'], 'verbose_name': 'Route City', 'verbose_name_plural': 'Route Cities'},
+        ),
+        migrations.AddIndex(
+            model_name='route',
+            index=models.Index(fields=['user', 'created_at'], name='route_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='routecity',
+            index=models.Index(fields=['route', 'city'], name='route_city_route_city_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='routecity',
+            index=models.Index(fields=['departure_date'], name='route_city_departure_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database_manager', '0011_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeoName',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('normalized_name', models.CharField(max_length=200)),
+                ('country_code', models.CharField(blank=True, max_length=2)),
+                ('latitude', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('longitude', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('population', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Geo Name',
+                'verbose_name_plural': 'Geo Names',
+                'ordering': ['normalized_name', '-population'],
+                'indexes': [models.Index(fields=['normalized_name'], name='geoname_normalized_name_idx', opclasses=['varchar_pattern_ops'])],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:25
+
+from django.db import migrations, models
+
+from database_manager.geo import encode_geohash
+
+
+def fill_geohash(apps, schema_editor):
+    City = apps.get_model('database_manager', 'City')
+    cities = list(City.objects.all())
+    for city in cities:
+        city.geohash = encode_geohash(city.latitude, city.longitude)
+    City.objects.bulk_update(cities, ['geohash'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database_manager', '0012_geoname'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='city',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=12),
+        ),
+        migrations.RunPython(fill_geohash, migrations.RunPython.noop),
+    ]
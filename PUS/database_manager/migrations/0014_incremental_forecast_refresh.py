@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database_manager', '0013_city_geohash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='city',
+            name='forecasts_fetched_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='forecastdata',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database_manager', '0014_incremental_forecast_refresh'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recommendation',
+            name='generated',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database_manager', '0015_recommendation_generated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='forecastdata',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='recommendation',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='routecity',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+HISTORY_TABLE = 'database_manager_forecasthistory'
+
+# na PostgreSQL tabela nadrzędna jest partycjonowana miesięcznie po dacie prognozy;
+# partycje tworzy database_manager.partitions.ensure_history_partitions przed zapisem.
+# Klucz główny partycjonowanej tabeli musi zawierać klucz partycjonowania, stąd (id, date).
+POSTGRES_CREATE = f'''
+CREATE TABLE "{HISTORY_TABLE}" (
+    "id" bigserial NOT NULL,
+    "city_id" bigint NOT NULL REFERENCES "database_manager_city" ("id") DEFERRABLE INITIALLY DEFERRED,
+    "date" date NOT NULL,
+    "fetched_at" timestamp with time zone NOT NULL,
+    "temp" double precision NOT NULL,
+    "feels_like" double precision NOT NULL,
+    "pressure" integer NOT NULL,
+    "humidity" integer NOT NULL,
+    "min_temp" double precision NOT NULL,
+    "max_temp" double precision NOT NULL,
+    "clouds" integer NOT NULL,
+    "wind_speed" double precision NOT NULL,
+    "rain" double precision NOT NULL,
+    "precipitation_probability" double precision NOT NULL,
+    "description" text NULL,
+    "main_weather" varchar(64) NOT NULL,
+    "content_hash" varchar(32) NOT NULL,
+    PRIMARY KEY ("id", "date")
+) PARTITION BY RANGE ("date");
+CREATE INDEX "forecast_history_city_date_idx" ON "{HISTORY_TABLE}" ("city_id", "date", "fetched_at");
+'''
+
+
+def create_history_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_CREATE)
+    else:
+        # SQLite i inne bazy: zwykła tabela, retencja usuwa wiersze
+        schema_editor.create_model(apps.get_model('database_manager', 'ForecastHistory'))
+
+
+def drop_history_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP TABLE "{HISTORY_TABLE}" CASCADE')
+    else:
+        schema_editor.delete_model(apps.get_model('database_manager', 'ForecastHistory'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database_manager', '0016_updated_at'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='ForecastHistory',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('date', models.DateField()),
+                        ('fetched_at', models.DateTimeField()),
+                        ('temp', models.FloatField()),
+                        ('feels_like', models.FloatField()),
+                        ('pressure', models.IntegerField()),
+                        ('humidity', models.IntegerField()),
+                        ('min_temp', models.FloatField()),
+                        ('max_temp', models.FloatField()),
+                        ('clouds', models.IntegerField()),
+                        ('wind_speed', models.FloatField()),
+                        ('rain', models.FloatField()),
+                        ('precipitation_probability', models.FloatField()),
+                        ('description', models.TextField(blank=True, null=True)),
+                        ('main_weather', models.CharField(max_length=64)),
+                        ('content_hash', models.CharField(blank=True, default='', max_length=32)),
+                        ('city', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='forecast_history', to='database_manager.city')),
+                    ],
+                    options={
+                        'verbose_name': 'Forecast History',
+                        'verbose_name_plural': 'Forecast History',
+                        'ordering': ['city_id', 'date', 'fetched_at'],
+                        'indexes': [models.Index(fields=['city', 'date', 'fetched_at'], name='forecast_history_city_date_idx')],
+                    },
+                ),
+            ],
+            # tabelę tworzy create_history_table - na PostgreSQL jako partycjonowaną
+            database_operations=[],
+        ),
+        migrations.RunPython(create_history_table, drop_history_table),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database_manager', '0017_forecasthistory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitBucket',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('tokens', models.FloatField()),
+                ('updated_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Rate Limit Bucket',
+                'verbose_name_plural': 'Rate Limit Buckets',
+            },
+        ),
+        migrations.CreateModel(
+            name='RateLimitWaiter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.CharField(max_length=64)),
+                ('priority', models.PositiveSmallIntegerField()),
+                ('enqueued_at', models.DateTimeField()),
+                ('seen_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Rate Limit Waiter',
+                'verbose_name_plural': 'Rate Limit Waiters',
+                'indexes': [models.Index(fields=['bucket', 'priority', 'enqueued_at'], name='ratelimit_waiter_queue_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database_manager', '0018_ratelimit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='forecastrefreshjob',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database_manager', '0019_forecastrefreshjob_attempts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScopeLastWrite',
+            fields=[
+                ('scope', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('written_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Scope Last Write',
+                'verbose_name_plural': 'Scope Last Writes',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database_manager', '0020_scopelastwrite'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='city',
+            name='geohash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=12),
+        ),
+    ]
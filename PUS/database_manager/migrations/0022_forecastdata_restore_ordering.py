@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:03
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database_manager', '0021_city_geohash_drop_index'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='forecastdata',
+            options={'ordering': ['city', '-date'], 'verbose_name': 'Forecast Data', 'verbose_name_plural': 'Forecast Data'},
+        ),
+    ]
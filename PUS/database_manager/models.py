@@ -1,10 +1,18 @@
-from django.db import models
+from collections import defaultdict
+from datetime import timedelta
+from django.db import connections, models
 from django.conf import settings
+from django.utils import timezone
+from .geo import encode_geohash
 
 class City(models.Model):
     city_name = models.CharField(max_length=64, unique=True)
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    # wyliczany ze współrzędnych; służy tylko do sortowania sąsiednich miast obok siebie,
+    # dlatego nie ma indeksu - wyszukiwanie po nim nie jest nigdzie używane
+    geohash = models.CharField(max_length=12, blank=True, default="", editable=False)
+    forecasts_fetched_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     class Meta:
         verbose_name = "City"
@@ -14,6 +22,17 @@ class City(models.Model):
     def __str__(self):
         return self.city_name
 
+    def save(self, *args, **kwargs):
+        self.geohash = encode_geohash(self.latitude, self.longitude)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"latitude", "longitude"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "geohash"}
+        super().save(*args, **kwargs)
+
+    @property
+    def has_coordinates(self):
+        return bool(self.geohash)
+
 
 class Route(models.Model):
     name = models.CharField(max_length=128)
@@ -21,8 +40,12 @@ class Route(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     starts_at = models.DateField(null=False, blank=False)
     ends_at = models.DateField(null=False, blank=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
+        indexes = [
+            models.Index(fields=["user", "created_at"], name="route_user_created_idx")
+        ]
         verbose_name = "Route"
         verbose_name_plural = "Routes"
         ordering = ["created_at"]
@@ -37,12 +60,17 @@ class RouteCity(models.Model):
     position = models.PositiveIntegerField()
     arrival_date = models.DateField(null=False, blank=False)
     departure_date = models.DateField(null=False, blank=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=["route", "position"], name="unique_route_position")
         ]
-        ordering = ["route", "position"]
+        indexes = [
+            models.Index(fields=["route", "city"], name="route_city_route_city_idx"),
+            models.Index(fields=["departure_date"], name="route_city_departure_idx"),
+        ]
+        ordering = ["route_id", "position"]
         verbose_name = "Route City"
         verbose_name_plural = "Route Cities"
 
@@ -50,6 +78,82 @@ class RouteCity(models.Model):
         return f"{self.route.name} : {self.city.city_name} (#{self.position})"
 
 
+def merge_windows(windows):
+    """
+    Łączy nakładające się i sąsiednie okna tego samego miasta, a miasta z identycznym zakresem dat
+    grupuje: {(date_from, date_to): [city_id, ...]} - mniej warunków OR przy setkach okien.
+    """
+    ranges = defaultdict(list)
+    for city_id, date_from, date_to in windows:
+        ranges[city_id].append((date_from, date_to))
+
+    merged = defaultdict(list)
+    for city_id, city_ranges in ranges.items():
+        city_ranges.sort()
+        current_from, current_to = city_ranges[0]
+        for date_from, date_to in city_ranges[1:]:
+            if date_from <= current_to + timedelta(days=1):
+                current_to = max(current_to, date_to)
+            else:
+                merged[(current_from, current_to)].append(city_id)
+                current_from, current_to = date_from, date_to
+        merged[(current_from, current_to)].append(city_id)
+    return merged
+
+
+class ForecastDataQuerySet(models.QuerySet):
+    def for_windows(self, windows):
+        """Prognozy z wielu okien (city_id, date_from, date_to) w jednym zapytaniu."""
+        condition = models.Q()
+        for (date_from, date_to), city_ids in merge_windows(windows).items():
+            cities = models.Q(city_id=city_ids[0]) if len(city_ids) == 1 else models.Q(city_id__in=city_ids)
+            condition |= cities & models.Q(date__range=(date_from, date_to))
+        if not condition:
+            return self.none()
+        return self.filter(condition)
+
+    def window_rows(self, windows, fields, cities=None):
+        """
+        Wartości pól prognoz dla każdego okna (city_id, date_from, date_to) jednym zapytaniem: okna są
+        tabelą VALUES złączoną z prognozami po (city_id, date), więc zapytanie korzysta z indeksu
+        (city, date) bez setek warunków OR. Zwraca listę (dla każdego okna, w kolejności) krotek wartości
+        pól posortowanych po dacie. cities - opcjonalny queryset miast, do których zawężany jest wynik.
+        """
+        results = [[] for _ in windows]
+        if not windows:
+            return results
+
+        connection = connections[self.db]
+        quote_name = connection.ops.quote_name
+        columns = ", ".join(f"f.{quote_name(self.model._meta.get_field(name).column)}" for name in fields)
+        # okna są wstawiane jako literały z int() i date.isoformat() - przy setkach okien tysiące parametrów
+        # kosztowały więcej niż samo zapytanie; bez jawnego typu PostgreSQL traktuje daty z VALUES jak tekst
+        date = "'{}'::date" if connection.vendor == "postgresql" else "'{}'"
+        values = ", ".join(
+            f"({index}, {int(city_id)}, {date.format(date_from.isoformat())}, {date.format(date_to.isoformat())})"
+            for index, (city_id, date_from, date_to) in enumerate(windows)
+        )
+        params = []
+
+        # kolumny VALUES nazywają się column1..columnN zarówno w PostgreSQL, jak i w SQLite
+        sql = (
+            f"SELECT w.column1, {columns} FROM (VALUES {values}) AS w "
+            f"JOIN {quote_name(self.model._meta.db_table)} f "
+            f"ON f.city_id = w.column2 AND f.date BETWEEN w.column3 AND w.column4"
+        )
+        if cities is not None:
+            cities_sql, cities_params = cities.order_by().values("id").query.sql_with_params()
+            sql += f" WHERE f.city_id IN ({cities_sql})"
+            params.extend(cities_params)
+        sql += " ORDER BY w.column1, f.date"
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            for index, *row in cursor.fetchall():
+                results[index].append(tuple(row))
+        return results
+
+
 class ForecastData(models.Model):
     city = models.ForeignKey(City, on_delete=models.CASCADE, related_name="forecasts")
     date = models.DateField()
@@ -65,11 +169,19 @@ class ForecastData(models.Model):
     precipitation_probability = models.FloatField()
     description = models.TextField(null=True, blank=True)
     main_weather = models.CharField(max_length=64)
+    # skrót wartości prognozy - niezmienione dni nie są ponownie zapisywane
+    content_hash = models.CharField(max_length=32, blank=True, default="", editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ForecastDataQuerySet.as_manager()
 
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=["city", "date"], name="unique_forecast_per_city")
         ]
+        indexes = [
+            models.Index(fields=["city", "-date"], name="forecast_city_date_desc_idx")
+        ]
         verbose_name = "Forecast Data"
         verbose_name_plural = "Forecast Data"
         ordering = ["city", "-date"]
@@ -78,9 +190,46 @@ class ForecastData(models.Model):
         return f"{self.city.city_name} — {self.date}"
 
 
+class ForecastHistory(models.Model):
+    """
+    Archiwum prognoz (tylko dopisywanie): każda nowa lub zmieniona wersja prognozy dnia z chwilą pobrania.
+    Na PostgreSQL tabela jest partycjonowana miesięcznie po dacie prognozy (database_manager.partitions).
+    """
+    city = models.ForeignKey(City, on_delete=models.CASCADE, related_name="forecast_history")
+    date = models.DateField()
+    fetched_at = models.DateTimeField()
+    temp = models.FloatField()
+    feels_like = models.FloatField()
+    pressure = models.IntegerField()
+    humidity = models.IntegerField()
+    min_temp = models.FloatField()
+    max_temp = models.FloatField()
+    clouds = models.IntegerField()
+    wind_speed = models.FloatField()
+    rain = models.FloatField()
+    precipitation_probability = models.FloatField()
+    description = models.TextField(null=True, blank=True)
+    main_weather = models.CharField(max_length=64)
+    content_hash = models.CharField(max_length=32, blank=True, default="")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["city", "date", "fetched_at"], name="forecast_history_city_date_idx")
+        ]
+        verbose_name = "Forecast History"
+        verbose_name_plural = "Forecast History"
+        ordering = ["city_id", "date", "fetched_at"]
+
+    def __str__(self):
+        return f"{self.city.city_name} — {self.date} ({self.fetched_at:%Y-%m-%d %H:%M})"
+
+
 class Recommendation(models.Model):
     route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name="recommendations")
     recommendation = models.TextField(null=True, blank=True)
+    # True - wygenerowana automatycznie na podstawie prognoz (zastępowana przy kolejnym generowaniu)
+    generated = models.BooleanField(default=False, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["route"]
@@ -88,4 +237,114 @@ class Recommendation(models.Model):
         verbose_name_plural = "Recommendations"
 
     def __str__(self):
-        return f"Recommendation for {self.route.name}"
\ No newline at end of file
+        return f"Recommendation for {self.route.name}"
+
+class ForecastRefreshJob(models.Model):
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pending"
+        RUNNING = "running", "Running"
+        DONE = "done", "Done"
+        FAILED = "failed", "Failed"
+
+    route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name="refresh_jobs")
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.PENDING)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+    # liczba podjęć zadania przez worker - zadania porzucone w trakcie są ponawiane ograniczoną liczbę razy
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "created_at"], name="refresh_job_status_idx")
+        ]
+        ordering = ["-created_at"]
+        verbose_name = "Forecast Refresh Job"
+        verbose_name_plural = "Forecast Refresh Jobs"
+
+    def __str__(self):
+        return f"Refresh of {self.route.name} ({self.status})"
+
+
+class GeoName(models.Model):
+    name = models.CharField(max_length=200)
+    normalized_name = models.CharField(max_length=200)
+    country_code = models.CharField(max_length=2, blank=True)
+    latitude = models.DecimalField(max_digits=9, decimal_places=6)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6)
+    population = models.BigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # varchar_pattern_ops pozwala PostgreSQL użyć indeksu także dla LIKE 'prefix%'
+            models.Index(fields=["normalized_name"], name="geoname_normalized_name_idx",
+                         opclasses=["varchar_pattern_ops"]),
+        ]
+        ordering = ["normalized_name", "-population"]
+        verbose_name = "Geo Name"
+        verbose_name_plural = "Geo Names"
+
+    def __str__(self):
+        return f"{self.name} ({self.country_code})"
+
+
+class RateLimitBucket(models.Model):
+    name = models.CharField(max_length=64, primary_key=True)
+    tokens = models.FloatField()
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Rate Limit Bucket"
+        verbose_name_plural = "Rate Limit Buckets"
+
+    def __str__(self):
+        return f"{self.name} ({self.tokens:.1f})"
+
+
+class RateLimitWaiter(models.Model):
+    bucket = models.CharField(max_length=64)
+    priority = models.PositiveSmallIntegerField()
+    enqueued_at = models.DateTimeField()
+    # odświeżane przy każdej próbie - oczekujący, którzy przestali pytać (np. zabity proces), są pomijani
+    seen_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["bucket", "priority", "enqueued_at"], name="ratelimit_waiter_queue_idx")
+        ]
+        verbose_name = "Rate Limit Waiter"
+        verbose_name_plural = "Rate Limit Waiters"
+
+    def __str__(self):
+        return f"{self.bucket} waiter (priority {self.priority})"
+
+
+class ScopeLastWriteQuerySet(models.QuerySet):
+    def touch(self, scopes):
+        """Ustawia czas ostatniego zapisu w podanych zakresach - jedno INSERT ... ON CONFLICT."""
+        now = timezone.now()
+        self.bulk_create(
+            [ScopeLastWrite(scope=str(scope), written_at=now) for scope in set(scopes)],
+            update_conflicts=True, unique_fields=["scope"], update_fields=["written_at"],
+        )
+
+
+class ScopeLastWrite(models.Model):
+    # prognozy są wspólne dla wszystkich użytkowników (przypisane do miast)
+    FORECAST_SCOPE = "forecast"
+
+    # zakres walidatorów HTTP: id użytkownika (jego trasy) albo "forecast" (prognozy wspólne dla wszystkich)
+    scope = models.CharField(max_length=64, primary_key=True)
+    # czas ostatniego zapisu lub usunięcia - w bazie, żeby ETag i Last-Modified były wspólne dla wszystkich procesów
+    written_at = models.DateTimeField()
+
+    objects = ScopeLastWriteQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Scope Last Write"
+        verbose_name_plural = "Scope Last Writes"
+
+    def __str__(self):
+        return f"{self.scope} ({self.written_at})"
@@ -0,0 +1,97 @@
+import re
+from datetime import date
+from django.db import connection
+from .models import ForecastHistory
+
+HISTORY_TABLE = ForecastHistory._meta.db_table
+PARTITION_NAME = re.compile(rf"^{HISTORY_TABLE}_p(\d{{4}})(\d{{2}})$")
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def months_before(day, months):
+    """Pierwszy dzień miesiąca o months miesięcy wcześniejszego niż miesiąc daty day."""
+    year, month = divmod(day.year * 12 + day.month - 1 - months, 12)
+    return date(year, month + 1, 1)
+
+
+def partition_name(month):
+    return f"{HISTORY_TABLE}_p{month:%Y%m}"
+
+
+def is_partitioned():
+    return connection.vendor == "postgresql"
+
+
+def ensure_history_partitions(dates):
+    """Tworzy (jeśli brakuje) miesięczne partycje archiwum dla podanych dat prognoz. Na SQLite nic nie robi."""
+    if not is_partitioned():
+        return
+    names = {partition_name(month): month for month in {month_start(day) for day in dates}}
+    if not names:
+        return
+
+    quote_name = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        # DDL tylko dla brakujących partycji - zwykle jedno szybkie zapytanie do katalogu
+        cursor.execute("SELECT relname FROM pg_class WHERE relname = ANY(%s)", [list(names)])
+        existing = {name for name, in cursor.fetchall()}
+        for name, month in sorted(names.items()):
+            if name in existing:
+                continue
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {quote_name(name)} "
+                f"PARTITION OF {quote_name(HISTORY_TABLE)} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month(month).isoformat()}')"
+            )
+
+
+def list_history_partitions():
+    """Miesiące, dla których istnieją partycje: {pierwszy dzień miesiąca: nazwa tabeli}."""
+    if not is_partitioned():
+        return {}
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = %s",
+            [HISTORY_TABLE],
+        )
+        names = [name for name, in cursor.fetchall()]
+
+    partitions = {}
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions[date(int(match[1]), int(match[2]), 1)] = name
+    return partitions
+
+
+def drop_history_before(cutoff, dry_run=False):
+    """
+    Usuwa archiwum prognoz na dni sprzed miesiąca daty cutoff. Na PostgreSQL całe partycje są
+    usuwane przez DROP TABLE (bez DELETE wiersz po wierszu i bez rozrostu tabeli),
+    na SQLite wiersze są usuwane jednym DELETE. Zwraca listę usuniętych partycji/miesięcy.
+    """
+    cutoff = month_start(cutoff)
+    if not is_partitioned():
+        queryset = ForecastHistory.objects.filter(date__lt=cutoff)
+        months = sorted({month_start(day) for day in queryset.order_by().values_list("date", flat=True).distinct()})
+        if not dry_run:
+            queryset._raw_delete(queryset.db)
+        return [f"{month:%Y-%m}" for month in months]
+
+    expired = {month: name for month, name in list_history_partitions().items() if month < cutoff}
+    if not dry_run:
+        quote_name = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            for _, name in sorted(expired.items()):
+                cursor.execute(f"DROP TABLE {quote_name(name)}")
+    return [name for _, name in sorted(expired.items())]
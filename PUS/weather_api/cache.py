@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(city_name, units):
+    return f"openweather:daily:{' '.join(city_name.split()).casefold()}:{units}"
+
+
+def make_coordinates_cache_key(latitude, longitude, units):
+    # 3 miejsca po przecinku to ok. 100 m - dokładniej prognoza i tak się nie różni
+    return f"openweather:daily:{float(latitude):.3f},{float(longitude):.3f}:{units}"
+
+
+class LocalCacheStore:
+    """Pamięć podręczna procesu z limitem rozmiaru (LRU)."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry, timeout):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DjangoCacheStore:
+    """Magazyn oparty o framework cache Django - współdzielony między procesami."""
+
+    def __init__(self, alias="default"):
+        self.alias = alias
+
+    @property
+    def _cache(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, entry, timeout):
+        self._cache.set(key, entry, timeout)
+
+    def clear(self):
+        self._cache.clear()
+
+
+class ForecastCache:
+    """
+    Cache odpowiedzi OpenWeather z TTL i trybem stale-while-revalidate.
+    Wpis młodszy niż ttl jest zwracany od razu. Wpis starszy, ale mieszczący się
+    w stale_ttl, też jest zwracany, a jedno odświeżenie trafia do wspólnej puli wątków.
+    Równoległe zapytania o ten sam klucz są łączone w jedno wywołanie upstream.
+    """
+
+    def __init__(self, ttl, stale_ttl=0, store=None, max_size=1024):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.store = store if store is not None else LocalCacheStore(max_size)
+        self._inflight = {}
+        self._async_inflight = {}
+        self._lock = threading.Lock()
+
+    def get_or_fetch(self, key, fetch):
+        entry = self.store.get(key)
+        if entry is not None:
+            fetched_at, data = entry
+            age = time.time() - fetched_at
+            if age < self.ttl:
+                return data
+            if age < self.ttl + self.stale_ttl:
+                self._refresh_in_background(key, fetch)
+                return data
+
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+
+        if owner:
+            self._run(key, fetch, future)
+        return future.result()
+
+    async def aget_or_fetch(self, key, fetch):
+        """Wersja dla asyncio - fetch zwraca korutynę; zapytania o ten sam klucz czekają na jedno zadanie."""
+        entry = self.store.get(key)
+        if entry is not None:
+            fetched_at, data = entry
+            age = time.time() - fetched_at
+            if age < self.ttl:
+                return data
+            if age < self.ttl + self.stale_ttl:
+                if self._async_key(key) not in self._async_inflight:
+                    self._start_async(key, fetch).add_done_callback(self._log_background_error)
+                return data
+
+        task = self._async_inflight.get(self._async_key(key)) or self._start_async(key, fetch)
+        # anulowanie jednego z oczekujących nie przerywa pobierania pozostałym
+        return await asyncio.shield(task)
+
+    def clear(self):
+        self.store.clear()
+
+    @staticmethod
+    def _async_key(key):
+        # zadania asyncio należą do pętli zdarzeń, w której powstały
+        return id(asyncio.get_running_loop()), key
+
+    def _start_async(self, key, fetch):
+        async_key = self._async_key(key)
+        task = asyncio.ensure_future(self._arun(async_key, key, fetch))
+        self._async_inflight[async_key] = task
+        return task
+
+    async def _arun(self, async_key, key, fetch):
+        try:
+            data = await fetch()
+            self.store.set(key, (time.time(), data), self.ttl + self.stale_ttl)
+            return data
+        finally:
+            self._async_inflight.pop(async_key, None)
+
+    def _refresh_in_background(self, key, fetch):
+        with self._lock:
+            if key in self._inflight:
+                return
+            future = Future()
+            self._inflight[key] = future
+
+        # wyjątek odświeżania w tle nie może zostać "niepobrany"
+        future.add_done_callback(self._log_background_error)
+        get_refresh_executor().submit(self._run_in_background, key, fetch, future)
+
+    def _run_in_background(self, key, fetch, future):
+        # wątek puli nie obsługuje żądania, więc Django nie zamknie za niego połączenia z bazą
+        # (pobieranie bierze żetony limitu zapytań z bazy)
+        close_old_connections()
+        try:
+            self._run(key, fetch, future)
+        finally:
+            connection.close()
+
+    def _run(self, key, fetch, future):
+        try:
+            data = fetch()
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            self.store.set(key, (time.time(), data), self.ttl + self.stale_ttl)
+            future.set_result(data)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    @staticmethod
+    def _log_background_error(future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning("Odświeżanie prognozy w tle nie powiodło się: %s", future.exception())
+
+
+_refresh_executor = None
+_forecast_cache = None
+_forecast_cache_lock = threading.Lock()
+
+
+def get_refresh_executor():
+    """Wspólna dla procesu, ograniczona pula wątków odświeżania w tle."""
+    global _refresh_executor
+    if _refresh_executor is None:
+        with _forecast_cache_lock:
+            if _refresh_executor is None:
+                _refresh_executor = ThreadPoolExecutor(
+                    max_workers=settings.OPENWEATHER_CACHE_REFRESH_WORKERS,
+                    thread_name_prefix="forecast-refresh",
+                )
+    return _refresh_executor
+
+
+def get_forecast_cache():
+    global _forecast_cache
+    if _forecast_cache is None:
+        with _forecast_cache_lock:
+            if _forecast_cache is None:
+                store = None
+                if settings.OPENWEATHER_CACHE_USE_DJANGO:
+                    store = DjangoCacheStore()
+                _forecast_cache = ForecastCache(
+                    ttl=settings.OPENWEATHER_CACHE_TTL,
+                    stale_ttl=settings.OPENWEATHER_CACHE_STALE_TTL,
+                    store=store,
+                    max_size=settings.OPENWEATHER_CACHE_MAX_SIZE,
+                )
+    return _forecast_cache
@@ -0,0 +1,36 @@
+import unicodedata
+from database_manager.models import GeoName
+
+
+def normalize_name(name):
+    """'  Kraków ' -> 'krakow' - bez znaków diakrytycznych, małe litery, pojedyncze spacje."""
+    decomposed = unicodedata.normalize("NFKD", name.replace("ł", "l").replace("Ł", "L"))
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(stripped.split()).casefold()
+
+
+def geocode(name):
+    """
+    Zwraca (lat, lon) najludniejszego miasta o podanej nazwie albo None.
+    Bez pamięci podręcznej procesu - to jedno zapytanie po indeksie, a wynik musi uwzględniać
+    import GeoNames wykonany w innym procesie.
+    """
+    row = (
+        GeoName.objects
+        .filter(normalized_name=normalize_name(name))
+        .order_by("-population")
+        .values_list("latitude", "longitude")
+        .first()
+    )
+    return tuple(row) if row else None
+
+
+def search_prefix(prefix, limit=10):
+    normalized = normalize_name(prefix)
+    if not normalized:
+        return GeoName.objects.none()
+    return (
+        GeoName.objects
+        .filter(normalized_name__startswith=normalized)
+        .order_by("-population")[:limit]
+    )
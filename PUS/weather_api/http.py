@@ -0,0 +1,206 @@
+import asyncio
+import threading
+import time
+import weakref
+from collections import deque
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from PUS import profiling
+from .ratelimit import Priority, get_rate_limiter, max_wait_for
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class UpstreamMetrics:
+    """Czasy odpowiedzi zapytań do OpenWeather - licznik, błędy i ostatnie próbki do percentyli."""
+
+    def __init__(self, max_samples=1000):
+        self._samples = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.errors = 0
+        self.total_time = 0.0
+
+    def record(self, elapsed, status_code=None, error=False):
+        # czas trafia też do profilu bieżącego żądania (nagłówek Server-Timing)
+        profiling.record("upstream", elapsed)
+        with self._lock:
+            self.count += 1
+            self.total_time += elapsed
+            if error:
+                self.errors += 1
+            self._samples.append((elapsed, status_code))
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(elapsed for elapsed, _ in self._samples)
+            count, errors, total_time = self.count, self.errors, self.total_time
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000, 2)
+
+        return {
+            "count": count,
+            "errors": errors,
+            "avg_ms": round(total_time / count * 1000, 2) if count else None,
+            "p50_ms": percentile(50),
+            "p95_ms": percentile(95),
+            "p99_ms": percentile(99),
+        }
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self.count = self.errors = 0
+            self.total_time = 0.0
+
+
+upstream_metrics = UpstreamMetrics()
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def build_session():
+    # ponowienia po 429/5xx i błędach połączenia obsługuje upstream_get - każda próba pobiera token
+    # ze wspólnego limitu, czego nie dałoby się zrobić w Retry z urllib3
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=settings.OPENWEATHER_POOL_SIZE,
+        max_retries=0,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session():
+    """Wspólna sesja HTTP (pula połączeń keep-alive) dla wszystkich zapytań do OpenWeather."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = build_session()
+    return _session
+
+
+def wait_for_token(priority):
+    """Pobiera token ze wspólnego limitu zapytań; zwraca czas oczekiwania w sekundach."""
+    limiter = get_rate_limiter()
+    if limiter is None:
+        return 0.0
+    return limiter.acquire(priority, max_wait=max_wait_for(priority))
+
+
+async def await_token(priority):
+    limiter = get_rate_limiter()
+    if limiter is None:
+        return 0.0
+    return await limiter.aacquire(priority, max_wait=max_wait_for(priority))
+
+
+def upstream_get(url, params=None, priority=Priority.INTERACTIVE):
+    """
+    GET do OpenWeather z ponowieniami po 429/5xx i błędach połączenia (z uwzględnieniem Retry-After).
+    Każda próba, także ponowienie, pobiera token ze wspólnego limitu zapytań; czas oczekiwania
+    na tokeny nie wlicza się do metryk.
+    """
+    session = get_session()
+    started = time.perf_counter()
+    waited = 0.0
+    attempt = 0
+    while True:
+        waited += wait_for_token(priority)
+        try:
+            response = session.get(url, params=params, timeout=settings.OPENWEATHER_TIMEOUT)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt >= settings.OPENWEATHER_RETRIES:
+                upstream_metrics.record(time.perf_counter() - started - waited, error=True)
+                raise
+            response = None
+        except requests.RequestException:
+            upstream_metrics.record(time.perf_counter() - started - waited, error=True)
+            raise
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt >= settings.OPENWEATHER_RETRIES:
+                break
+        time.sleep(retry_delay(response, attempt))
+        attempt += 1
+
+    upstream_metrics.record(time.perf_counter() - started - waited, response.status_code,
+                            error=response.status_code >= 400)
+    return response
+
+
+# klienci asynchroniczni są związani z pętlą zdarzeń - jedna pula połączeń na pętlę
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def build_async_client():
+    if httpx is None:
+        raise RuntimeError("Asynchroniczne zapytania do OpenWeather wymagają pakietu httpx")
+    connect_timeout, read_timeout = settings.OPENWEATHER_TIMEOUT
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=settings.OPENWEATHER_ASYNC_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.OPENWEATHER_POOL_SIZE,
+        ),
+        timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+    )
+
+
+def get_async_client():
+    """Wspólny klient httpx (pula keep-alive) dla bieżącej pętli zdarzeń."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = build_async_client()
+    return client
+
+
+def retry_delay(response, attempt):
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        delay = float(retry_after)
+    else:
+        delay = settings.OPENWEATHER_RETRY_BACKOFF * 2 ** attempt
+    # bardzo długi Retry-After zablokowałby wątek (albo żądanie użytkownika) na czas nieograniczony
+    return min(delay, settings.OPENWEATHER_MAX_RETRY_AFTER)
+
+
+async def async_upstream_get(url, params=None, priority=Priority.INTERACTIVE):
+    """
+    Odpowiednik upstream_get dla asyncio: te same ponowienia po 429/5xx i błędach połączenia
+    (z uwzględnieniem Retry-After) i token na każdą próbę, ale oczekiwanie nie blokuje wątku.
+    """
+    client = get_async_client()
+    started = time.perf_counter()
+    waited = 0.0
+    attempt = 0
+    while True:
+        waited += await await_token(priority)
+        try:
+            response = await client.get(url, params=params)
+        except httpx.TransportError:
+            if attempt >= settings.OPENWEATHER_RETRIES:
+                upstream_metrics.record(time.perf_counter() - started - waited, error=True)
+                raise
+            response = None
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt >= settings.OPENWEATHER_RETRIES:
+                break
+        await asyncio.sleep(retry_delay(response, attempt))
+        attempt += 1
+
+    upstream_metrics.record(time.perf_counter() - started - waited, response.status_code,
+                            error=response.status_code >= 400)
+    return response
@@ -0,0 +1,104 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from database_manager.models import ForecastRefreshJob
+from .ratelimit import Priority
+from .utils import fetch_and_save_forecasts_for_route
+
+Status = ForecastRefreshJob.Status
+
+CLAIM_SCAN_FACTOR = 4
+
+
+def enqueue_route_refresh(route):
+    """Dodaje zadanie odświeżenia trasy; oczekujące zadanie dla tej samej trasy jest używane ponownie."""
+    with transaction.atomic():
+        job = (
+            ForecastRefreshJob.objects
+            .select_for_update()
+            .filter(route=route, status=Status.PENDING)
+            .order_by("created_at")
+            .first()
+        )
+        if job is None:
+            job = ForecastRefreshJob.objects.create(route=route)
+    return job
+
+
+def requeue_stale_jobs(now=None):
+    """
+    Zadania RUNNING rozpoczęte ponad FORECAST_REFRESH_JOB_TIMEOUT sekund temu wracają do kolejki,
+    a te podjęte już FORECAST_REFRESH_JOB_MAX_ATTEMPTS razy są oznaczane jako nieudane.
+    Zwraca (liczba ponowionych, liczba nieudanych).
+    """
+    if now is None:
+        now = timezone.now()
+    stale = ForecastRefreshJob.objects.filter(
+        status=Status.RUNNING, started_at__lt=now - timedelta(seconds=settings.FORECAST_REFRESH_JOB_TIMEOUT)
+    )
+    failed = stale.filter(attempts__gte=settings.FORECAST_REFRESH_JOB_MAX_ATTEMPTS).update(
+        status=Status.FAILED, finished_at=now, error="Przekroczono czas przetwarzania zadania"
+    )
+    requeued = stale.update(status=Status.PENDING, started_at=None)
+    return requeued, failed
+
+
+def claim_jobs(limit):
+    """
+    Oznacza do `limit` tras z oczekującymi zadaniami jako przetwarzane.
+    Zwraca słownik {route_id: [job_id, ...]} - duplikaty dla jednej trasy są scalane.
+    """
+    with transaction.atomic():
+        # blokowane są tylko najstarsze zadania - zapas na duplikaty tras, a nie cała kolejka
+        pending = list(
+            ForecastRefreshJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=Status.PENDING)
+            .order_by("created_at")
+            .values_list("id", "route_id")[:limit * CLAIM_SCAN_FACTOR]
+        )
+        claimed = {}
+        for job_id, route_id in pending:
+            if route_id in claimed:
+                claimed[route_id].append(job_id)
+            elif len(claimed) < limit:
+                claimed[route_id] = [job_id]
+
+        job_ids = [job_id for ids in claimed.values() for job_id in ids]
+        ForecastRefreshJob.objects.filter(id__in=job_ids).update(
+            status=Status.RUNNING, started_at=timezone.now(), attempts=F("attempts") + 1
+        )
+    return claimed
+
+
+def run_route_jobs(job_ids):
+    jobs = ForecastRefreshJob.objects.filter(id__in=job_ids)
+    try:
+        job = jobs.select_related("route").first()
+        result = fetch_and_save_forecasts_for_route(job.route, priority=Priority.BACKGROUND)
+    except Exception as e:
+        jobs.update(status=Status.FAILED, error=str(e), finished_at=timezone.now())
+    else:
+        jobs.update(status=Status.DONE, result=result, finished_at=timezone.now())
+    finally:
+        # wątek puli ma własne połączenie z bazą - trzeba je zamknąć
+        connection.close()
+
+
+def run_pending_jobs(max_workers=None):
+    """Przetwarza jedną porcję oczekujących zadań w puli wątków. Zwraca liczbę tras."""
+    if max_workers is None:
+        max_workers = settings.FORECAST_REFRESH_WORKERS
+
+    requeue_stale_jobs()
+    claimed = claim_jobs(limit=max_workers)
+    if not claimed:
+        return 0
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for job_ids in claimed.values():
+            executor.submit(run_route_jobs, job_ids)
+    return len(claimed)
@@ -0,0 +1,56 @@
+import csv
+import sys
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from database_manager.models import GeoName
+from weather_api.geocoding import normalize_name
+
+# kolumny pliku GeoNames (np. cities15000.txt z https://download.geonames.org/export/dump/)
+NAME, ASCII_NAME, ALTERNATE_NAMES, LATITUDE, LONGITUDE, COUNTRY_CODE, POPULATION = 1, 2, 3, 4, 5, 8, 14
+
+
+class Command(BaseCommand):
+    help = "Importuje miasta z pliku GeoNames (format TSV) do lokalnego indeksu geokodowania."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Ścieżka do pliku GeoNames, np. cities15000.txt.")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--alternate-names", action="store_true",
+                            help="Indeksuj także nazwy alternatywne (np. 'Warsaw' dla 'Warszawa').")
+        parser.add_argument("--replace", action="store_true",
+                            help="Usuń istniejące wpisy przed importem.")
+
+    def handle(self, *args, **options):
+        csv.field_size_limit(sys.maxsize)
+        imported = 0
+        with open(options["path"], encoding="utf-8", newline="") as file, transaction.atomic():
+            if options["replace"]:
+                GeoName.objects.all().delete()
+
+            batch = []
+            for row in csv.reader(file, delimiter="\t", quoting=csv.QUOTE_NONE):
+                batch.extend(self.build_geonames(row, options["alternate_names"]))
+                if len(batch) >= options["batch_size"]:
+                    imported += len(GeoName.objects.bulk_create(batch))
+                    batch = []
+            imported += len(GeoName.objects.bulk_create(batch))
+
+        self.stdout.write(f"Zaimportowano wpisów: {imported}")
+
+    @staticmethod
+    def build_geonames(row, alternate_names=False):
+        # nazwa i jej wersja ASCII (jeśli się różnią) - obie trafiają do indeksu
+        names = {normalize_name(row[NAME]), normalize_name(row[ASCII_NAME])}
+        if alternate_names and row[ALTERNATE_NAMES]:
+            names.update(normalize_name(name) for name in row[ALTERNATE_NAMES].split(","))
+        return [
+            GeoName(
+                name=row[NAME],
+                normalized_name=normalized,
+                country_code=row[COUNTRY_CODE],
+                latitude=row[LATITUDE],
+                longitude=row[LONGITUDE],
+                population=int(row[POPULATION] or 0),
+            )
+            for normalized in names if normalized
+        ]
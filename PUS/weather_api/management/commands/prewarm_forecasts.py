@@ -0,0 +1,30 @@
+import time
+from django.core.management.base import BaseCommand
+from weather_api.prewarm import prewarm_forecasts
+
+
+class Command(BaseCommand):
+    help = "Pobiera z wyprzedzeniem prognozy dla wszystkich miast z nadchodzących tras."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None,
+                            help="Liczba miast pobieranych w jednej porcji (domyślnie FORECAST_PREWARM_BATCH_SIZE).")
+        parser.add_argument("--rate-limit", type=int, default=None,
+                            help="Maksymalna liczba zapytań na minutę (domyślnie FORECAST_PREWARM_RATE_LIMIT).")
+        parser.add_argument("--interval", type=float, default=0,
+                            help="Odstęp w sekundach między cyklami; 0 - wykonaj jeden cykl i zakończ.")
+
+    def handle(self, *args, **options):
+        while True:
+            summary = prewarm_forecasts(batch_size=options["batch_size"], rate_limit=options["rate_limit"])
+            self.stdout.write(
+                f"Miasta: {summary['cities']} (pominięte jako świeże: {summary['skipped_cities']}), "
+                f"wstawiono: {summary['inserted']}, zaktualizowano: {summary['updated']}, "
+                f"bez zmian: {summary['unchanged']}, błędy: {len(summary['errors'])}"
+            )
+            for city_name, error in summary["errors"].items():
+                self.stderr.write(f"{city_name}: {error}")
+
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
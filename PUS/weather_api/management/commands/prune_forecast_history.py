@@ -0,0 +1,40 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from database_manager.models import ForecastData, ScopeLastWrite
+from database_manager.partitions import drop_history_before, months_before
+
+
+class Command(BaseCommand):
+    help = ("Usuwa stare archiwum prognoz całymi partycjami miesięcznymi "
+            "oraz przeszłe dni z tabeli bieżących prognoz.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--months", type=int, default=None,
+                            help="Liczba zachowywanych miesięcy archiwum (domyślnie FORECAST_HISTORY_RETENTION_MONTHS).")
+        parser.add_argument("--live-days", type=int, default=None,
+                            help="Przeszłe dni starsze niż tyle dni są usuwane z ForecastData "
+                                 "(domyślnie FORECAST_LIVE_RETENTION_DAYS).")
+        parser.add_argument("--dry-run", action="store_true", help="Tylko wypisz, co zostałoby usunięte.")
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        months = options["months"] if options["months"] is not None else settings.FORECAST_HISTORY_RETENTION_MONTHS
+        live_days = options["live_days"] if options["live_days"] is not None else settings.FORECAST_LIVE_RETENTION_DAYS
+
+        cutoff = months_before(today, months)
+        dropped = drop_history_before(cutoff, dry_run=options["dry_run"])
+        action = "do usunięcia" if options["dry_run"] else "usunięto"
+        self.stdout.write(f"Archiwum sprzed {cutoff}: {action} {len(dropped)} partycji/miesięcy "
+                          f"({', '.join(dropped) or '-'})")
+
+        live = ForecastData.objects.filter(date__lt=today - timedelta(days=live_days))
+        if options["dry_run"]:
+            self.stdout.write(f"Bieżące prognozy do usunięcia: {live.count()}")
+        else:
+            # jedno DELETE bez ładowania wierszy - ForecastData nie ma zależnych tabel ani odbiorników sygnałów
+            deleted = live._raw_delete(live.db)
+            if deleted:
+                ScopeLastWrite.objects.touch([ScopeLastWrite.FORECAST_SCOPE])
+            self.stdout.write(f"Usunięto bieżących prognoz: {deleted}")
@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand
+from weather_api.jobs import run_pending_jobs
+
+
+class Command(BaseCommand):
+    help = "Przetwarza kolejkę zadań odświeżania prognoz dla tras."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=None,
+                            help="Liczba tras odświeżanych równolegle (domyślnie FORECAST_REFRESH_WORKERS).")
+        parser.add_argument("--poll-interval", type=float, default=2.0,
+                            help="Odstęp w sekundach między sprawdzeniami pustej kolejki.")
+        parser.add_argument("--once", action="store_true",
+                            help="Przetwórz oczekujące zadania i zakończ.")
+
+    def handle(self, *args, **options):
+        while True:
+            processed = run_pending_jobs(max_workers=options["workers"])
+            if processed:
+                self.stdout.write(f"Odświeżono trasy: {processed}")
+            elif options["once"]:
+                break
+            else:
+                time.sleep(options["poll_interval"])
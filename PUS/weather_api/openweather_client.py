@@ -1,27 +1,122 @@
-import requests
 from datetime import datetime
+from django.conf import settings
+from .cache import get_forecast_cache, make_cache_key, make_coordinates_cache_key
+from .http import upstream_get, async_upstream_get
+from .ratelimit import Priority
 
 class OpenWeatherClient:
-    BASE_URL = "https://api.openweathermap.org/data/2.5/forecast/daily"
-
-    def __init__(self, api_key):
+    def __init__(self, api_key, cache=None, use_cache=True, priority=Priority.INTERACTIVE):
         self.api_key = api_key
+        # klasa priorytetu we wspólnym limicie zapytań do OpenWeather
+        self.priority = priority
+        if cache is None and use_cache:
+            cache = get_forecast_cache()
+        self.cache = cache
+        self.base_url = settings.OPENWEATHER_BASE_URL
+        # odpowiedzi pobrane z OpenWeather (a nie z cache) przez tego klienta: {klucz cache: dane}
+        self.fetched = {}
+
+    def get_daily_forecast_by_city(self, city_name, units="metric"):
+        params = {"q": city_name}
+        return self._get_cached(make_cache_key(city_name, units), params, units)
+
+    def get_daily_forecast_by_coordinates(self, latitude, longitude, units="metric"):
+        params = {"lat": float(latitude), "lon": float(longitude)}
+        return self._get_cached(make_coordinates_cache_key(latitude, longitude, units), params, units)
+
+    def _get_cached(self, key, params, units):
+        if self.cache is None:
+            return self._fetch_upstream(key, params, units)
+        return self.cache.get_or_fetch(key, lambda: self._fetch_upstream(key, params, units))
 
-    def get_daily_forecast_by_city(self, city_name):
+    def _fetch_upstream(self, key, params, units):
+        data = self.fetched[key] = self._fetch_daily_forecast(params, units)
+        return data
+
+    def is_from_upstream(self, key, data):
+        """Czy dane zostały właśnie pobrane z OpenWeather (nieaktualny wpis z cache nie jest nimi nawet w trakcie odświeżania)."""
+        return self.fetched.get(key) is data
+
+    def _fetch_daily_forecast(self, location_params, units):
         params = {
-            "q": city_name,
+            **location_params,
             "cnt": 16,
-            "units": "metric",
+            "units": units,
             "appid": self.api_key
         }
-        response = requests.get(self.BASE_URL, params=params)
+        response = upstream_get(self.base_url, params=params, priority=self.priority)
         response.raise_for_status()
         return response.json()
 
-    def filter_forecasts_by_dates(self, data, arrival_date, departure_date):
+    def get_city_coordinates(self, city_name):
+        """Zwraca (lat, lon) miasta albo None, jeśli OpenWeather go nie zna."""
+        #lepiej wykorzystać Geocoding Api, ale wymagana jest tam subskrypcja i podanie karty
+        params = {
+            "q": city_name,
+            "cnt": 1,
+            "appid": self.api_key
+        }
+        response = upstream_get(self.base_url, params=params, priority=self.priority)
+        if response.status_code in (400, 404):
+            return None
+        response.raise_for_status()
+        data = response.json()
+        if "city" not in data:
+            return None
+        return data["city"]["coord"]["lat"], data["city"]["coord"]["lon"]
+
+    @staticmethod
+    def filter_forecasts_by_dates(data, arrival_date, departure_date):
         filtered = {}
         for day in data.get("list", []):
             forecast_date = datetime.fromtimestamp(day["dt"]).date()
             if arrival_date <= forecast_date <= departure_date:
                 filtered[forecast_date] = day
         return filtered
+
+
+class AsyncOpenWeatherClient(OpenWeatherClient):
+    """Wersja klienta dla asyncio (httpx) - pobierania nie zajmują wątków, tylko połączenia z puli."""
+
+    async def get_daily_forecast_by_city(self, city_name, units="metric"):
+        params = {"q": city_name}
+        return await self._get_cached(make_cache_key(city_name, units), params, units)
+
+    async def get_daily_forecast_by_coordinates(self, latitude, longitude, units="metric"):
+        params = {"lat": float(latitude), "lon": float(longitude)}
+        return await self._get_cached(make_coordinates_cache_key(latitude, longitude, units), params, units)
+
+    async def _get_cached(self, key, params, units):
+        if self.cache is None:
+            return await self._fetch_upstream(key, params, units)
+        return await self.cache.aget_or_fetch(key, lambda: self._fetch_upstream(key, params, units))
+
+    async def _fetch_upstream(self, key, params, units):
+        data = self.fetched[key] = await self._fetch_daily_forecast(params, units)
+        return data
+
+    async def _fetch_daily_forecast(self, location_params, units):
+        params = {
+            **location_params,
+            "cnt": 16,
+            "units": units,
+            "appid": self.api_key
+        }
+        response = await async_upstream_get(self.base_url, params=params, priority=self.priority)
+        response.raise_for_status()
+        return response.json()
+
+    async def get_city_coordinates(self, city_name):
+        params = {
+            "q": city_name,
+            "cnt": 1,
+            "appid": self.api_key
+        }
+        response = await async_upstream_get(self.base_url, params=params, priority=self.priority)
+        if response.status_code in (400, 404):
+            return None
+        response.raise_for_status()
+        data = response.json()
+        if "city" not in data:
+            return None
+        return data["city"]["coord"]["lat"], data["city"]["coord"]["lon"]
@@ -0,0 +1,110 @@
+from datetime import timedelta
+from database_manager.models import ForecastData
+from .scoring import SCORE_FIELDS, require_numpy, score_days
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# ocena dnia bez prognozy (poza 16-dniowym horyzontem) - nie premiuje ani nie karze
+UNKNOWN_DAY_SCORE = 50.0
+
+
+class InfeasibleSchedule(Exception):
+    pass
+
+
+def load_day_scores(city_ids, start, days):
+    """Macierz komfortu [miasto, dzień] dla dni start..start+days-1 - jedno zapytanie."""
+    require_numpy()
+    index = {city_id: i for i, city_id in enumerate(dict.fromkeys(city_ids))}
+    matrix = np.full((len(index), days), UNKNOWN_DAY_SCORE)
+
+    rows = list(
+        ForecastData.objects
+        .filter(city_id__in=index, date__range=(start, start + timedelta(days=days - 1)))
+        .values_list("city_id", "date", *SCORE_FIELDS)
+    )
+    if rows:
+        columns = list(zip(*rows))
+        comfort, _ = score_days(*(np.array(values, dtype=np.float64) for values in columns[2:]))
+        city_rows = np.array([index[city_id] for city_id in columns[0]])
+        day_columns = np.array([(forecast_date - start).days for forecast_date in columns[1]])
+        matrix[city_rows, day_columns] = comfort
+    return matrix, index
+
+
+def optimize_stays(day_scores, min_stays, max_stays):
+    """
+    Programowanie dynamiczne: dzieli dni 0..T-1 na kolejne, ciągłe pobyty (w ustalonej kolejności)
+    o długościach z [min_stays[i], max_stays[i]], maksymalizując sumę ocen dni.
+    day_scores - macierz [postój, dzień]. Zwraca (suma, lista (pierwszy dzień, ostatni dzień)).
+    Złożoność O(n * T * (max - min)) zamiast wykładniczego przeglądu wszystkich podziałów.
+    """
+    require_numpy()
+    stops, days = day_scores.shape
+    prefix = np.zeros((stops, days + 1))
+    np.cumsum(day_scores, axis=1, out=prefix[:, 1:])
+
+    # best[i, e] - najlepsza suma, gdy pierwszych i postojów kończy się dokładnie przed dniem e
+    best = np.full((stops + 1, days + 1), -np.inf)
+    best[0, 0] = 0.0
+    choice = np.zeros((stops + 1, days + 1), dtype=np.int64)
+    ends = np.arange(days + 1)
+
+    for i in range(stops):
+        for length in range(min_stays[i], max_stays[i] + 1):
+            starts = ends[length:] - length
+            candidate = best[i, starts] + prefix[i, ends[length:]] - prefix[i, starts]
+            improved = candidate > best[i + 1, length:]
+            best[i + 1, length:][improved] = candidate[improved]
+            choice[i + 1, length:][improved] = length
+
+    if not np.isfinite(best[stops, days]):
+        raise InfeasibleSchedule()
+
+    stays = []
+    end = days
+    for i in range(stops, 0, -1):
+        length = int(choice[i, end])
+        stays.append((end - length, end - 1))
+        end -= length
+    stays.reverse()
+    return float(best[stops, days]), stays
+
+
+def optimize_route_dates(route, route_cities, min_stay=1, max_stay=None, stop_limits=None):
+    """
+    Proponuje daty pobytu dla postojów trasy (w kolejności position) tak, by wypełniały
+    okres Route.starts_at..ends_at i maksymalizowały komfort pogodowy.
+    stop_limits - {route_city_id: (min_stay, max_stay)} nadpisujące wartości domyślne
+    (max_stay = None oznacza brak górnego limitu).
+    """
+    stop_limits = stop_limits or {}
+    days = (route.ends_at - route.starts_at).days + 1
+    if not route_cities or days <= 0:
+        raise InfeasibleSchedule()
+
+    limits = [stop_limits.get(rc.id, (min_stay, max_stay)) for rc in route_cities]
+    min_stays = [low for low, _ in limits]
+    max_stays = [min(high or days, days) for _, high in limits]
+
+    matrix, index = load_day_scores([rc.city_id for rc in route_cities], route.starts_at, days)
+    day_scores = matrix[[index[rc.city_id] for rc in route_cities]]
+    total, stays = optimize_stays(day_scores, min_stays, max_stays)
+
+    return {
+        "score": round(total / days, 1),
+        "stops": [
+            {
+                "id": route_city.id,
+                "city": route_city.city_id,
+                "position": route_city.position,
+                "arrival_date": route.starts_at + timedelta(days=first),
+                "departure_date": route.starts_at + timedelta(days=last),
+                "score": round(float(day_scores[i, first:last + 1].mean()), 1),
+            }
+            for i, (route_city, (first, last)) in enumerate(zip(route_cities, stays))
+        ],
+    }
@@ -0,0 +1,60 @@
+import time
+from collections import defaultdict
+from django.conf import settings
+from django.utils import timezone
+from database_manager.models import RouteCity
+from .ratelimit import Priority
+from .utils import fetch_and_save_forecasts_for_route_cities
+
+
+def upcoming_route_cities_by_city(today=None):
+    """Grupuje po miastach wszystkie postoje tras, które jeszcze się nie zakończyły."""
+    if today is None:
+        today = timezone.localdate()
+    route_cities = (
+        RouteCity.objects
+        .filter(departure_date__gte=today)
+        .select_related("city")
+        # sąsiednie miasta trafiają do tej samej porcji i mogą dzielić zapytanie
+        .order_by("city__geohash", "city__city_name")
+    )
+    grouped = defaultdict(list)
+    for route_city in route_cities:
+        grouped[route_city.city].append(route_city)
+    return grouped
+
+
+def prewarm_forecasts(batch_size=None, rate_limit=None, today=None):
+    """
+    Odświeża prognozy dla każdego miasta z nadchodzących tras - jedno zapytanie
+    na miasto w cyklu, porcjami po batch_size, nie więcej niż rate_limit zapytań na minutę.
+    """
+    if batch_size is None:
+        batch_size = settings.FORECAST_PREWARM_BATCH_SIZE
+    if rate_limit is None:
+        rate_limit = settings.FORECAST_PREWARM_RATE_LIMIT
+
+    grouped = upcoming_route_cities_by_city(today)
+    cities = list(grouped)
+    summary = {"cities": len(cities), "inserted": 0, "updated": 0, "unchanged": 0, "skipped_cities": 0, "errors": {}}
+
+    for start in range(0, len(cities), batch_size):
+        batch = cities[start:start + batch_size]
+        started = time.monotonic()
+
+        result = fetch_and_save_forecasts_for_route_cities(
+            [route_city for city in batch for route_city in grouped[city]],
+            max_workers=batch_size, use_cache=False, priority=Priority.PREWARM
+        )
+        for key in ("inserted", "updated", "unchanged", "skipped_cities"):
+            summary[key] += result[key]
+        summary["errors"].update(result["errors"])
+
+        is_last_batch = start + batch_size >= len(cities)
+        if rate_limit and not is_last_batch:
+            requested = len(batch) - result["skipped_cities"]
+            remaining = requested * 60 / rate_limit - (time.monotonic() - started)
+            if remaining > 0:
+                time.sleep(remaining)
+
+    return summary
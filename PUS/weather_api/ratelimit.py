@@ -0,0 +1,237 @@
+import asyncio
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from datetime import timedelta
+from enum import IntEnum
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from database_manager.models import RateLimitBucket, RateLimitWaiter
+
+OPENWEATHER_BUCKET = "openweather"
+
+
+class Priority(IntEnum):
+    """Klasy priorytetu zapytań do OpenWeather - mniejsza wartość dostaje token wcześniej."""
+    INTERACTIVE = 0
+    BACKGROUND = 1
+    PREWARM = 2
+
+
+class RateLimitTimeout(requests.RequestException):
+    """Token nie został przydzielony w maksymalnym czasie oczekiwania dla danej klasy priorytetu."""
+
+
+class RateLimitMetrics:
+    """Czasy oczekiwania na tokeny w tym procesie, osobno dla każdej klasy priorytetu."""
+
+    def __init__(self, max_samples=1000):
+        self._samples = defaultdict(lambda: deque(maxlen=max_samples))
+        self._lock = threading.Lock()
+        self.granted = Counter()
+        self.timeouts = Counter()
+        self.waiting = Counter()
+
+    def start_waiting(self, priority):
+        with self._lock:
+            self.waiting[priority] += 1
+
+    def stop_waiting(self, priority):
+        with self._lock:
+            self.waiting[priority] -= 1
+
+    def record(self, priority, waited, timeout=False):
+        with self._lock:
+            if timeout:
+                self.timeouts[priority] += 1
+            else:
+                self.granted[priority] += 1
+            self._samples[priority].append(waited)
+
+    def snapshot(self):
+        with self._lock:
+            samples = {priority: sorted(waits) for priority, waits in self._samples.items()}
+            granted, timeouts, waiting = Counter(self.granted), Counter(self.timeouts), Counter(self.waiting)
+
+        def percentile(waits, p):
+            if not waits:
+                return None
+            return round(waits[min(len(waits) - 1, int(p / 100 * len(waits)))] * 1000, 2)
+
+        snapshot = {}
+        for priority in Priority:
+            waits = samples.get(priority, [])
+            snapshot[priority.name.lower()] = {
+                "granted": granted[priority],
+                "timeouts": timeouts[priority],
+                "waiting": waiting[priority],
+                "wait_p50_ms": percentile(waits, 50),
+                "wait_p95_ms": percentile(waits, 95),
+                "wait_max_ms": round(waits[-1] * 1000, 2) if waits else None,
+            }
+        return snapshot
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self.granted.clear()
+            self.timeouts.clear()
+            self.waiting.clear()
+
+
+rate_limit_metrics = RateLimitMetrics()
+
+
+class TokenBucket:
+    """
+    Kubełek tokenów wspólny dla wszystkich procesów i wątków: stan jest trzymany w bazie
+    (RateLimitBucket) i zmieniany w krótkiej transakcji z blokadą wiersza, a tokeny są dolewane
+    leniwie na podstawie czasu od ostatniej zmiany. Gdy tokenów brakuje, oczekujący zapisuje się
+    w RateLimitWaiter - token dostaje najpierw najwyższy priorytet, a w nim najdłużej czekający.
+    """
+
+    def __init__(self, name, rate, burst, metrics=None, poll_interval=0.05, stale_after=5.0):
+        self.name = name
+        # tokenów na sekundę
+        self.rate = rate
+        self.burst = burst
+        self.metrics = metrics if metrics is not None else RateLimitMetrics()
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+
+    def _lock_bucket(self, now):
+        queryset = RateLimitBucket.objects.filter(name=self.name)
+        if connection.features.has_select_for_update:
+            bucket = queryset.select_for_update().first()
+        else:
+            # SQLite nie ma SELECT ... FOR UPDATE - zapis na początku transakcji od razu zajmuje blokadę bazy
+            # (odczyt, a potem zapis kończy się przy równoległych próbach błędem "database is locked")
+            bucket = queryset.first() if queryset.update(name=F("name")) else None
+        if bucket is None:
+            RateLimitBucket.objects.get_or_create(name=self.name, defaults={"tokens": self.burst, "updated_at": now})
+            bucket = queryset.select_for_update().get()
+        return bucket
+
+    def _refilled(self, bucket, now):
+        elapsed = max(0.0, (now - bucket.updated_at).total_seconds())
+        return min(self.burst, bucket.tokens + elapsed * self.rate)
+
+    def _active_waiters(self, now):
+        return RateLimitWaiter.objects.filter(bucket=self.name, seen_at__gte=now - timedelta(seconds=self.stale_after))
+
+    def try_acquire(self, priority, waiter=None, now=None):
+        """
+        Jedna próba pobrania tokenu. Zwraca (czy przydzielono, po ilu sekundach spróbować ponownie,
+        wpis w kolejce oczekujących); wpis trzeba przekazać do kolejnej próby.
+        """
+        if now is None:
+            now = timezone.now()
+        with transaction.atomic():
+            bucket = self._lock_bucket(now)
+            tokens = self._refilled(bucket, now)
+
+            ahead = self._active_waiters(now)
+            if waiter is None:
+                ahead = ahead.filter(priority__lte=priority)
+            else:
+                ahead = ahead.filter(Q(priority__lt=priority) | Q(priority=priority, id__lt=waiter.id))
+
+            if tokens >= 1 and not ahead.exists():
+                RateLimitBucket.objects.filter(name=self.name).update(tokens=tokens - 1, updated_at=now)
+                if waiter is not None:
+                    RateLimitWaiter.objects.filter(id=waiter.id).delete()
+                return True, 0.0, None
+
+            if waiter is None:
+                RateLimitWaiter.objects.filter(bucket=self.name, seen_at__lt=now - timedelta(seconds=self.stale_after)).delete()
+                waiter = RateLimitWaiter.objects.create(bucket=self.name, priority=priority, enqueued_at=now, seen_at=now)
+            else:
+                RateLimitWaiter.objects.filter(id=waiter.id).update(seen_at=now)
+
+        # oczekujący musi pytać częściej niż stale_after, inaczej zostałby uznany za porzuconego
+        retry_in = (1 - tokens) / self.rate if tokens < 1 else self.poll_interval
+        return False, min(max(retry_in, self.poll_interval), self.stale_after / 2), waiter
+
+    def _give_up(self, waiter):
+        if waiter is not None:
+            RateLimitWaiter.objects.filter(id=waiter.id).delete()
+
+    def acquire(self, priority=Priority.INTERACTIVE, max_wait=None):
+        """Czeka na token (blokując wątek). Zwraca czas oczekiwania w sekundach albo rzuca RateLimitTimeout."""
+        # wątki pul (np. w fetch_forecasts) nie zamykają połączeń z bazą - zamykamy to, które sami otworzyliśmy
+        opened_connection = connection.connection is None
+        started = time.monotonic()
+        waiter = None
+        try:
+            while True:
+                granted, retry_in, waiter = self.try_acquire(priority, waiter)
+                waited = time.monotonic() - started
+                if granted:
+                    self.metrics.record(priority, waited)
+                    return waited
+                if max_wait is not None and waited + retry_in > max_wait:
+                    self._give_up(waiter)
+                    self.metrics.record(priority, waited, timeout=True)
+                    raise RateLimitTimeout(f"Przekroczono limit zapytań do OpenWeather (oczekiwano {waited:.1f} s)")
+                self.metrics.start_waiting(priority)
+                try:
+                    time.sleep(retry_in)
+                finally:
+                    self.metrics.stop_waiting(priority)
+        finally:
+            if opened_connection:
+                connection.close()
+
+    async def aacquire(self, priority=Priority.INTERACTIVE, max_wait=None):
+        """Odpowiednik acquire dla asyncio - między próbami nie blokuje wątku."""
+        started = time.monotonic()
+        waiter = None
+        while True:
+            granted, retry_in, waiter = await sync_to_async(self.try_acquire)(priority, waiter)
+            waited = time.monotonic() - started
+            if granted:
+                self.metrics.record(priority, waited)
+                return waited
+            if max_wait is not None and waited + retry_in > max_wait:
+                await sync_to_async(self._give_up)(waiter)
+                self.metrics.record(priority, waited, timeout=True)
+                raise RateLimitTimeout(f"Przekroczono limit zapytań do OpenWeather (oczekiwano {waited:.1f} s)")
+            self.metrics.start_waiting(priority)
+            try:
+                await asyncio.sleep(retry_in)
+            finally:
+                self.metrics.stop_waiting(priority)
+
+    def queue_depth(self, now=None):
+        """Liczba oczekujących na token we wszystkich procesach, według klas priorytetu."""
+        if now is None:
+            now = timezone.now()
+        counts = dict(self._active_waiters(now).values_list("priority").annotate(count=Count("id")))
+        return {priority.name.lower(): counts.get(priority, 0) for priority in Priority}
+
+    def snapshot(self):
+        now = timezone.now()
+        bucket = RateLimitBucket.objects.filter(name=self.name).first()
+        return {
+            "rate_per_minute": round(self.rate * 60, 2),
+            "burst": self.burst,
+            "tokens": round(self._refilled(bucket, now), 2) if bucket is not None else self.burst,
+            "queue_depth": self.queue_depth(now),
+            "priorities": self.metrics.snapshot(),
+        }
+
+
+def get_rate_limiter():
+    """Kubełek dla zapytań do OpenWeather według bieżących ustawień albo None, jeśli limit jest wyłączony."""
+    if not settings.OPENWEATHER_RATE_LIMIT:
+        return None
+    return TokenBucket(OPENWEATHER_BUCKET, settings.OPENWEATHER_RATE_LIMIT / 60,
+                       settings.OPENWEATHER_RATE_LIMIT_BURST, metrics=rate_limit_metrics)
+
+
+def max_wait_for(priority):
+    return settings.OPENWEATHER_RATE_LIMIT_MAX_WAIT.get(Priority(priority).name.lower())
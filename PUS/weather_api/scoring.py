@@ -0,0 +1,156 @@
+from django.db import transaction
+from django.db.models import F
+from database_manager.models import ForecastData, Recommendation, ScopeLastWrite
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# przedział temperatur (°C) uznawany za w pełni komfortowy i spadek oceny na każdy stopień poza nim
+COMFORT_TEMP_RANGE = (18.0, 26.0)
+COMFORT_TEMP_FALLOFF = 10.0
+# wartości, od których opad (mm) i wiatr (m/s) dają maksymalną karę; wiatr do WIND_CALM nie jest karany
+RAIN_MAX = 10.0
+WIND_CALM = 5.0
+WIND_MAX = 15.0
+# wagi składowych oceny komfortu: temperatura, szansa opadu, opad, wiatr, zachmurzenie
+COMFORT_WEIGHTS = (0.35, 0.25, 0.15, 0.15, 0.10)
+RISK_THRESHOLD = 60.0
+
+SCORE_FIELDS = ("temp", "precipitation_probability", "rain", "wind_speed", "clouds")
+
+
+def require_numpy():
+    if np is None:
+        raise RuntimeError("Ocena pogody tras wymaga pakietu numpy")
+
+
+def load_stop_forecasts(routes):
+    """
+    Jedno zapytanie: prognozy z okien pobytu wszystkich postojów tras z querysetu
+    (ForecastData JOIN RouteCity po mieście i zakresie dat). Zwraca słownik kolumn jako tablice.
+    """
+    require_numpy()
+    rows = list(
+        ForecastData.objects
+        .filter(
+            city__in_routes__route__in=routes,
+            date__gte=F("city__in_routes__arrival_date"),
+            date__lte=F("city__in_routes__departure_date"),
+        )
+        .order_by("city__in_routes__route_id", "city__in_routes__position", "date")
+        .values_list("city__in_routes__route_id", "city__in_routes__id", "city__city_name", "date", *SCORE_FIELDS)
+    )
+    columns = list(zip(*rows)) or [()] * (4 + len(SCORE_FIELDS))
+    data = {
+        "route_id": np.array(columns[0], dtype=np.int64),
+        "route_city_id": np.array(columns[1], dtype=np.int64),
+        "city_name": np.array(columns[2], dtype=object),
+        "date": np.array(columns[3], dtype="datetime64[D]"),
+    }
+    for name, values in zip(SCORE_FIELDS, columns[4:]):
+        data[name] = np.array(values, dtype=np.float64)
+    return data
+
+
+def score_days(temp, precipitation_probability, rain, wind_speed, clouds):
+    """Wektorowo liczy komfort i ryzyko (0-100) dla każdego dnia."""
+    require_numpy()
+    low, high = COMFORT_TEMP_RANGE
+    temp_distance = np.maximum(low - temp, 0) + np.maximum(temp - high, 0)
+    temp_score = np.clip(1 - temp_distance / COMFORT_TEMP_FALLOFF, 0, 1)
+    pop = np.clip(precipitation_probability, 0, 1)
+    rain_level = np.clip(rain / RAIN_MAX, 0, 1)
+    wind_level = np.clip((wind_speed - WIND_CALM) / (WIND_MAX - WIND_CALM), 0, 1)
+    cloud_level = np.clip(clouds / 100, 0, 1)
+
+    components = np.stack([temp_score, 1 - pop, 1 - rain_level, 1 - wind_level, 1 - cloud_level])
+    comfort = 100 * np.array(COMFORT_WEIGHTS) @ components
+    risk = 100 * np.maximum.reduce([pop * np.maximum(rain_level, 0.5), rain_level, wind_level])
+    return comfort, risk
+
+
+def group_mean(values, inverse, size):
+    return np.bincount(inverse, weights=values, minlength=size) / np.bincount(inverse, minlength=size)
+
+
+def score_routes(routes):
+    """
+    Ocena tras (queryset) w jednym przebiegu po tablicach. Zwraca
+    {route_id: {"comfort", "risk", "stops": {route_city_id: {...}}}}.
+    """
+    data = load_stop_forecasts(routes)
+    if not len(data["date"]):
+        return {}
+
+    comfort, risk = score_days(*(data[name] for name in SCORE_FIELDS))
+
+    stop_ids, stop_index = np.unique(data["route_city_id"], return_inverse=True)
+    stop_comfort = group_mean(comfort, stop_index, len(stop_ids))
+    stop_risk = np.zeros(len(stop_ids))
+    np.maximum.at(stop_risk, stop_index, risk)
+    # najlepszy dzień postoju: pierwszy wiersz grupy po sortowaniu (postój rosnąco, komfort malejąco)
+    order = np.lexsort((-comfort, stop_index))
+    best_rows = order[np.searchsorted(stop_index[order], np.arange(len(stop_ids)))]
+
+    route_ids, route_index = np.unique(data["route_id"], return_inverse=True)
+    route_comfort = group_mean(comfort, route_index, len(route_ids))
+    route_risk = np.zeros(len(route_ids))
+    np.maximum.at(route_risk, route_index, risk)
+
+    result = {
+        int(route_id): {"comfort": round(float(c), 1), "risk": round(float(r), 1), "stops": {}}
+        for route_id, c, r in zip(route_ids, route_comfort, route_risk)
+    }
+    stop_rows = np.split(np.argsort(stop_index, kind="stable"), np.cumsum(np.bincount(stop_index))[:-1])
+    for i, stop_id in enumerate(stop_ids):
+        best = best_rows[i]
+        rows = stop_rows[i]
+        result[int(data["route_id"][best])]["stops"][int(stop_id)] = {
+            "city_name": data["city_name"][best],
+            "comfort": round(float(stop_comfort[i]), 1),
+            "risk": round(float(stop_risk[i]), 1),
+            "best_date": str(data["date"][best]),
+            "best_comfort": round(float(comfort[best]), 1),
+            "days": [
+                {"date": str(data["date"][row]), "comfort": round(float(comfort[row]), 1),
+                 "risk": round(float(risk[row]), 1)}
+                for row in rows
+            ],
+        }
+    return result
+
+
+def build_recommendations(route_score):
+    texts = [
+        f"Średni komfort pogodowy trasy: {route_score['comfort']:.0f}/100, "
+        f"najwyższe ryzyko złej pogody: {route_score['risk']:.0f}/100."
+    ]
+    for stop in route_score["stops"].values():
+        texts.append(
+            f"{stop['city_name']}: najlepszy dzień na zwiedzanie to {stop['best_date']} "
+            f"(komfort {stop['best_comfort']:.0f}/100)."
+        )
+        risky_days = [day["date"] for day in stop["days"] if day["risk"] >= RISK_THRESHOLD]
+        if risky_days:
+            texts.append(
+                f"{stop['city_name']}: ryzyko opadów lub silnego wiatru w dniach {', '.join(risky_days)} "
+                f"- zaplanuj atrakcje pod dachem."
+            )
+    return texts
+
+
+def generate_recommendations(routes):
+    """Przelicza oceny tras (queryset) i zastępuje ich automatyczne rekomendacje. Zwraca oceny."""
+    scores = score_routes(routes)
+    with transaction.atomic():
+        Recommendation.objects.filter(route__in=routes, generated=True).delete()
+        # szybkie kasowanie nie wysyła sygnałów - zmiana rekomendacji odnotowana raz dla właścicieli tras
+        ScopeLastWrite.objects.touch(routes.values_list("user_id", flat=True))
+        Recommendation.objects.bulk_create([
+            Recommendation(route_id=route_id, recommendation=text, generated=True)
+            for route_id, route_score in scores.items()
+            for text in build_recommendations(route_score)
+        ])
+    return scores
@@ -1,3 +1,571 @@
+import io
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from unittest import mock, skipUnless
+import requests
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from django.utils import timezone as django_timezone
+from benchmarks.fake_openweather import FakeOpenWeatherServer
+from benchmarks.seed import DataGenerator
+from database_manager.models import (City, ForecastData, ForecastHistory, ForecastRefreshJob, GeoName, Recommendation,
+                                     Route, RouteCity, ScopeLastWrite)
+from database_manager.partitions import drop_history_before, list_history_partitions, partition_name
+from .cache import ForecastCache, get_forecast_cache
+from .geocoding import geocode, normalize_name, search_prefix
+from .http import retry_delay, upstream_get
+from .jobs import claim_jobs, enqueue_route_refresh, requeue_stale_jobs
+from .openweather_client import OpenWeatherClient
+from .optimizer import InfeasibleSchedule, optimize_stays
+from .prewarm import prewarm_forecasts
+from .ratelimit import Priority, TokenBucket, rate_limit_metrics
+from .scoring import generate_recommendations, score_days
+from .utils import bulk_save_forecasts, fetch_and_save_forecasts_for_route
 
-# Create your tests here.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def forecast_defaults(temp):
+    return {
+        "temp": temp, "feels_like": temp, "pressure": 1000, "humidity": 50, "min_temp": temp - 5,
+        "max_temp": temp + 5, "clouds": 20, "wind_speed": 3, "rain": 0, "precipitation_probability": 0.1,
+        "description": "bezchmurnie", "main_weather": "Clear",
+    }
+
+
+class BulkSaveForecastsTests(TestCase):
+    def setUp(self):
+        self.city = City.objects.create(city_name='Gdańsk')
+
+    def forecasts(self, temps):
+        return {(self.city.id, date(2025, 5, day)): forecast_defaults(temp) for day, temp in enumerate(temps, 1)}
+
+    def test_only_new_and_changed_days_are_written(self):
+        self.assertEqual(bulk_save_forecasts(self.forecasts([20, 21, 22])), (3, 0, 0))
+        self.assertEqual(bulk_save_forecasts(self.forecasts([20, 25, 22, 23])), (1, 1, 2))
+        self.assertEqual(list(ForecastData.objects.order_by('date').values_list('temp', flat=True)), [20, 25, 22, 23])
+
+    def test_query_count_does_not_depend_on_number_of_days(self):
+        bulk_save_forecasts(self.forecasts([10] * 3))
+        with CaptureQueriesContext(connection) as few:
+            bulk_save_forecasts(self.forecasts([20] * 3))
+        with CaptureQueriesContext(connection) as many:
+            bulk_save_forecasts(self.forecasts([30] * 28))
+        self.assertEqual(len(few), len(many))
+
+
+class ForecastHistoryTests(TestCase):
+    def setUp(self):
+        self.city = City.objects.create(city_name='Gdańsk')
+
+    def save(self, temps):
+        return bulk_save_forecasts({(self.city.id, day): forecast_defaults(temp) for day, temp in temps.items()})
+
+    def test_history_keeps_every_changed_version(self):
+        self.save({date(2025, 5, 1): 20, date(2025, 6, 1): 15})
+        self.save({date(2025, 5, 1): 20, date(2025, 6, 1): 15})
+        self.save({date(2025, 5, 1): 22, date(2025, 6, 1): 15})
+
+        temps = list(ForecastHistory.objects.filter(city=self.city, date=date(2025, 5, 1)).values_list('temp', flat=True))
+        self.assertEqual(temps, [20, 22])
+        self.assertEqual(ForecastHistory.objects.filter(date=date(2025, 6, 1)).count(), 1)
+
+    def test_retention_drops_whole_months(self):
+        self.save({date(2025, 3, 31): 10, date(2025, 4, 1): 12, date(2025, 5, 15): 18})
+        # odroczone sprawdzenia kluczy obcych z transakcji testu blokują DROP TABLE partycji
+        connection.check_constraints()
+
+        dropped = drop_history_before(date(2025, 4, 20))
+
+        self.assertEqual(len(dropped), 1)
+        self.assertEqual(sorted(ForecastHistory.objects.values_list('date', flat=True)),
+                         [date(2025, 4, 1), date(2025, 5, 15)])
+
+    @skipUnless(connection.vendor == 'postgresql', 'partycjonowanie tylko na PostgreSQL')
+    def test_history_query_reads_only_needed_partitions(self):
+        self.save({date(2025, 3, 10): 10, date(2025, 4, 10): 12, date(2025, 5, 10): 18})
+        self.assertEqual(len(list_history_partitions()), 3)
+
+        plan = ForecastHistory.objects.filter(
+            city=self.city, date__range=(date(2025, 4, 1), date(2025, 4, 30))
+        ).explain()
+        self.assertIn(partition_name(date(2025, 4, 1)), plan)
+        self.assertNotIn(partition_name(date(2025, 3, 1)), plan)
+        self.assertNotIn(partition_name(date(2025, 5, 1)), plan)
+
+
+class PruneForecastHistoryTests(TestCase):
+    def setUp(self):
+        self.city = City.objects.create(city_name='Gdańsk')
+        self.today = django_timezone.localdate()
+
+    def save_days_ago(self, days):
+        bulk_save_forecasts({(self.city.id, self.today - timedelta(days=day)): forecast_defaults(20) for day in days})
+
+    def prune(self, *args):
+        with CaptureQueriesContext(connection) as queries:
+            call_command("prune_forecast_history", *args, stdout=io.StringIO())
+        return [query["sql"] for query in queries]
+
+    @override_settings(FORECAST_LIVE_RETENTION_DAYS=30)
+    def test_expired_live_rows_are_deleted_with_one_statement(self):
+        self.save_days_ago(range(31, 34))
+        few = self.prune()
+        self.save_days_ago(range(31, 61))
+        many = self.prune()
+
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(len([sql for sql in many if sql.startswith("DELETE") and "forecastdata" in sql]), 1)
+        self.assertFalse(ForecastData.objects.exists())
+        self.assertTrue(ScopeLastWrite.objects.filter(scope=ScopeLastWrite.FORECAST_SCOPE).exists())
+
+    @override_settings(FORECAST_LIVE_RETENTION_DAYS=30, FORECAST_HISTORY_RETENTION_MONTHS=12)
+    def test_dry_run_changes_nothing_then_prune_keeps_current_rows(self):
+        self.save_days_ago([400, 40, 5, -3])
+        # odroczone sprawdzenia kluczy obcych z transakcji testu blokują DROP TABLE partycji
+        connection.check_constraints()
+        kept = [self.today - timedelta(days=day) for day in (5, -3)]
+
+        queries = self.prune("--dry-run")
+        self.assertFalse([sql for sql in queries if sql.startswith(("DELETE", "DROP", "INSERT"))])
+        self.assertEqual((ForecastData.objects.count(), ForecastHistory.objects.count()), (4, 4))
+
+        queries = self.prune()
+        # archiwum (lista partycji albo miesięcy + DROP TABLE albo DELETE), DELETE bieżących, znacznik zapisu
+        self.assertEqual(len(queries), 4)
+        self.assertEqual(sorted(ForecastData.objects.values_list("date", flat=True)), kept)
+        self.assertEqual(sorted(ForecastHistory.objects.values_list("date", flat=True)),
+                         [self.today - timedelta(days=40)] + kept)
+
+
+class TokenBucketTests(TestCase):
+    def setUp(self):
+        self.start = datetime(2025, 5, 1, 12, tzinfo=timezone.utc)
+        self.bucket = TokenBucket("test", rate=1, burst=2)
+
+    def at(self, seconds):
+        return self.start + timedelta(seconds=seconds)
+
+    def test_burst_then_refill_at_rate(self):
+        self.assertTrue(self.bucket.try_acquire(Priority.INTERACTIVE, now=self.at(0))[0])
+        self.assertTrue(self.bucket.try_acquire(Priority.INTERACTIVE, now=self.at(0))[0])
+
+        granted, retry_in, waiter = self.bucket.try_acquire(Priority.INTERACTIVE, now=self.at(0.5))
+        self.assertFalse(granted)
+        self.assertAlmostEqual(retry_in, 0.5)
+        self.assertTrue(self.bucket.try_acquire(Priority.INTERACTIVE, waiter, now=self.at(1))[0])
+
+    def test_interactive_goes_before_waiting_prewarm(self):
+        self.bucket.try_acquire(Priority.INTERACTIVE, now=self.at(0))
+        self.bucket.try_acquire(Priority.INTERACTIVE, now=self.at(0))
+        _, _, prewarm = self.bucket.try_acquire(Priority.PREWARM, now=self.at(0.1))
+        _, _, interactive = self.bucket.try_acquire(Priority.INTERACTIVE, now=self.at(0.2))
+        self.assertEqual(self.bucket.queue_depth(now=self.at(0.2)), {"interactive": 1, "background": 0, "prewarm": 1})
+
+        self.assertFalse(self.bucket.try_acquire(Priority.PREWARM, prewarm, now=self.at(1.1))[0])
+        self.assertTrue(self.bucket.try_acquire(Priority.INTERACTIVE, interactive, now=self.at(1.1))[0])
+        self.assertTrue(self.bucket.try_acquire(Priority.PREWARM, prewarm, now=self.at(2.1))[0])
+        self.assertEqual(self.bucket.queue_depth(now=self.at(2.1)), {"interactive": 0, "background": 0, "prewarm": 0})
+
+    def test_abandoned_waiter_does_not_block_queue(self):
+        self.bucket.try_acquire(Priority.INTERACTIVE, now=self.at(0))
+        self.bucket.try_acquire(Priority.INTERACTIVE, now=self.at(0))
+        self.bucket.try_acquire(Priority.INTERACTIVE, now=self.at(0.1))
+
+        self.assertTrue(self.bucket.try_acquire(Priority.PREWARM, now=self.at(10))[0])
+
+
+@override_settings(OPENWEATHER_RATE_LIMIT=60, OPENWEATHER_RATE_LIMIT_BURST=10, OPENWEATHER_RETRIES=3,
+                   OPENWEATHER_RETRY_BACKOFF=0)
+class UpstreamRetryTests(TestCase):
+    def test_every_retry_takes_a_token(self):
+        session = mock.Mock()
+        session.get.return_value = mock.Mock(status_code=429, headers={"Retry-After": "0"})
+        granted = rate_limit_metrics.granted[Priority.BACKGROUND]
+        with mock.patch("weather_api.http.get_session", return_value=session):
+            response = upstream_get("http://openweather.test/", priority=Priority.BACKGROUND)
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(session.get.call_count, 4)
+        self.assertEqual(rate_limit_metrics.granted[Priority.BACKGROUND] - granted, 4)
+
+    @override_settings(OPENWEATHER_MAX_RETRY_AFTER=30, OPENWEATHER_RETRY_BACKOFF=0.5)
+    def test_retry_after_is_clamped(self):
+        self.assertEqual(retry_delay(mock.Mock(headers={"Retry-After": "5"}), 0), 5)
+        self.assertEqual(retry_delay(mock.Mock(headers={"Retry-After": "86400"}), 0), 30)
+        self.assertEqual(retry_delay(None, 10), 30)
+
+
+class ForecastCacheTests(TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        clock = mock.patch("weather_api.cache.time")
+        clock.start().time.side_effect = lambda: self.now
+        self.addCleanup(clock.stop)
+        self.cache = ForecastCache(ttl=60, stale_ttl=300)
+        self.versions = iter(range(1, 100))
+
+    def fetch(self):
+        return next(self.versions)
+
+    def test_fresh_then_stale_while_revalidate_then_expired(self):
+        self.assertEqual(self.cache.get_or_fetch("key", self.fetch), 1)
+        self.assertEqual(self.cache.get_or_fetch("key", self.fetch), 1)
+
+        # po TTL stare dane wracają od razu, a odświeżenie idzie w tle
+        self.now += 61
+        self.assertEqual(self.cache.get_or_fetch("key", self.fetch), 1)
+        for _ in range(100):
+            if self.cache.store.get("key")[1] == 2:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.cache.get_or_fetch("key", self.fetch), 2)
+
+        # po TTL + STALE_TTL wpis jest pobierany od nowa przed odpowiedzią
+        self.now += 400
+        self.assertEqual(self.cache.get_or_fetch("key", self.fetch), 3)
+
+    def test_stale_keys_are_refreshed_by_bounded_pool(self):
+        for key in range(6):
+            self.cache.get_or_fetch(key, lambda: 0)
+        self.now += 61
+        release = threading.Event()
+        calls = []
+
+        def blocking_fetch():
+            calls.append(1)
+            release.wait(5)
+            return 1
+
+        pool = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(pool.shutdown)
+        with mock.patch("weather_api.cache._refresh_executor", pool):
+            for _ in range(2):
+                for key in range(6):
+                    self.assertEqual(self.cache.get_or_fetch(key, blocking_fetch), 0)
+            time.sleep(0.1)
+            # dwa wątki puli zajęte, reszta czeka w kolejce; każdy klucz odświeżany tylko raz
+            self.assertEqual(len(calls), 2)
+            release.set()
+            pool.shutdown(wait=True)
+
+        self.assertEqual(len(calls), 6)
+        self.assertEqual([self.cache.get_or_fetch(key, blocking_fetch) for key in range(6)], [1] * 6)
+
+    def test_concurrent_misses_share_one_fetch(self):
+        calls = []
+
+        def slow_fetch():
+            calls.append(1)
+            time.sleep(0.2)
+            return "data"
+
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            results = list(executor.map(lambda _: self.cache.get_or_fetch("key", slow_fetch), range(5)))
+        self.assertEqual(results, ["data"] * 5)
+        self.assertEqual(len(calls), 1)
+
+
+@skipUnless(np is not None, "wymaga numpy")
+class ScoringTests(TestCase):
+    def test_score_days_rewards_mild_dry_days(self):
+        comfort, risk = score_days(
+            temp=np.array([22.0, 22.0, 5.0]), precipitation_probability=np.array([0.0, 0.9, 0.0]),
+            rain=np.array([0.0, 12.0, 0.0]), wind_speed=np.array([2.0, 2.0, 2.0]), clouds=np.array([0.0, 100.0, 0.0]),
+        )
+        self.assertAlmostEqual(comfort[0], 100)
+        self.assertLess(comfort[1], 60)
+        self.assertLess(comfort[2], comfort[0])
+        self.assertEqual(risk.tolist(), [0, 100, 0])
+
+    def test_generated_recommendations_are_replaced_and_manual_kept(self):
+        user = get_user_model().objects.create_user(username='traveller', password='password')
+        city = City.objects.create(city_name='Kraków')
+        route = Route.objects.create(name='Route', user=user, starts_at=date(2025, 5, 1), ends_at=date(2025, 5, 2))
+        RouteCity.objects.create(route=route, city=city, position=0,
+                                 arrival_date=date(2025, 5, 1), departure_date=date(2025, 5, 2))
+        bulk_save_forecasts({(city.id, date(2025, 5, 1)): forecast_defaults(22),
+                             (city.id, date(2025, 5, 2)): {**forecast_defaults(22), "rain": 15, "precipitation_probability": 1}})
+        Recommendation.objects.create(route=route, recommendation='Weź parasol')
+
+        routes = Route.objects.filter(pk=route.pk)
+        generate_recommendations(routes)
+        scores = generate_recommendations(routes)
+
+        stop = scores[route.id]["stops"][RouteCity.objects.get().id]
+        self.assertEqual(stop["best_date"], "2025-05-01")
+        self.assertGreaterEqual(stop["risk"], 60)
+        texts = list(route.recommendations.filter(generated=True).values_list("recommendation", flat=True))
+        self.assertEqual(len(texts), 3)
+        self.assertTrue(any("2025-05-02" in text and "pod dachem" in text for text in texts))
+        self.assertTrue(route.recommendations.filter(generated=False, recommendation='Weź parasol').exists())
+
+
+@skipUnless(np is not None, "wymaga numpy")
+class OptimizeStaysTests(TestCase):
+    def test_stays_follow_best_weather_within_limits(self):
+        scores = np.array([
+            [90, 90, 10, 10, 10],
+            [10, 10, 80, 80, 80],
+        ], dtype=float)
+        total, stays = optimize_stays(scores, [1, 1], [5, 5])
+        self.assertEqual(stays, [(0, 1), (2, 4)])
+        self.assertEqual(total, 420)
+
+        # minimalny pobyt drugiego postoju wymusza krótszy pierwszy
+        _, stays = optimize_stays(scores, [1, 4], [5, 5])
+        self.assertEqual(stays, [(0, 0), (1, 4)])
+
+    def test_infeasible_limits(self):
+        with self.assertRaises(InfeasibleSchedule):
+            optimize_stays(np.zeros((2, 5)), [3, 3], [5, 5])
+
+
+class WithoutNumpyTests(TestCase):
+    def test_scoring_and_optimizer_require_numpy(self):
+        with mock.patch("weather_api.scoring.np", None), mock.patch("weather_api.optimizer.np", None):
+            with self.assertRaisesMessage(RuntimeError, "numpy"):
+                generate_recommendations(Route.objects.all())
+            with self.assertRaisesMessage(RuntimeError, "numpy"):
+                optimize_stays([[1.0]], [1], [1])
+
+    def test_api_imports_without_numpy(self):
+        # numpy jest opcjonalny - bez niego nie działają tylko ocena i optymalizacja tras
+        script = (
+            "import sys; sys.modules['numpy'] = None\n"
+            "import django; django.setup()\n"
+            "import api.urls\n"
+            "from weather_api.optimizer import optimize_stays\n"
+            "try:\n    optimize_stays(None, [1], [1])\nexcept RuntimeError:\n    print('numpy required')\n"
+        )
+        result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True,
+                                env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)})
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), "numpy required")
+
+
+@override_settings(FORECAST_REFRESH_JOB_TIMEOUT=600, FORECAST_REFRESH_JOB_MAX_ATTEMPTS=2)
+class RefreshJobQueueTests(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user(username='traveller', password='password')
+        self.routes = [Route.objects.create(name=f'Route {i}', user=user, starts_at=date(2025, 5, 1),
+                                            ends_at=date(2025, 5, 3)) for i in range(3)]
+
+    def test_pending_job_is_reused_and_claims_are_limited_per_route(self):
+        first = enqueue_route_refresh(self.routes[0])
+        self.assertEqual(enqueue_route_refresh(self.routes[0]), first)
+        for route in self.routes[1:]:
+            enqueue_route_refresh(route)
+
+        claimed = claim_jobs(limit=2)
+
+        self.assertEqual(list(claimed), [self.routes[0].id, self.routes[1].id])
+        self.assertEqual(ForecastRefreshJob.objects.filter(status=ForecastRefreshJob.Status.RUNNING).count(), 2)
+        self.assertEqual(ForecastRefreshJob.objects.get(id=first.id).attempts, 1)
+
+    def test_abandoned_running_jobs_are_requeued_then_failed(self):
+        job = enqueue_route_refresh(self.routes[0])
+        claim_jobs(limit=1)
+        later = django_timezone.now() + timedelta(seconds=601)
+
+        self.assertEqual(requeue_stale_jobs(django_timezone.now()), (0, 0))
+        self.assertEqual(requeue_stale_jobs(later), (1, 0))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.started_at), (ForecastRefreshJob.Status.PENDING, None))
+
+        claim_jobs(limit=1)
+        self.assertEqual(requeue_stale_jobs(later), (0, 1))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (ForecastRefreshJob.Status.FAILED, 2))
+
+
+def daily_forecast(start, days=16, temp=20):
+    """Minimalna odpowiedź OpenWeather /forecast/daily od dnia start."""
+    noon = datetime(start.year, start.month, start.day, 12)
+    return {"list": [{"dt": int((noon + timedelta(days=day)).timestamp()), "temp": {"day": temp}}
+                     for day in range(days)]}
+
+
+class FakeUpstream:
+    """
+    Zamiennik upstream_get: zlicza zapytania (i największą liczbę równoczesnych)
+    i zwraca prognozę po delay sekundach albo błąd dla miast z failing.
+    """
+
+    def __init__(self, temp=20, failing=(), delay=0):
+        self.temp = temp
+        self.failing = set(failing)
+        self.delay = delay
+        self.calls = []
+        self.active = self.peak = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, url, params=None, priority=None):
+        with self._lock:
+            self.calls.append(params.get("q") or (params["lat"], params["lon"]))
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        if params.get("q") in self.failing:
+            raise requests.ConnectionError(f"{params['q']}: connection refused")
+        return mock.Mock(status_code=200, json=lambda: daily_forecast(django_timezone.localdate(), temp=self.temp))
+
+
+class RouteRefreshTests(TestCase):
+    def setUp(self):
+        get_forecast_cache().clear()
+        self.addCleanup(get_forecast_cache().clear)
+        user = get_user_model().objects.create_user(username='traveller', password='password')
+        today = django_timezone.localdate()
+        self.route = Route.objects.create(name='Route', user=user, starts_at=today, ends_at=today + timedelta(days=5))
+        self.cities = [City.objects.create(city_name=f'City {i}') for i in range(3)]
+        for position, city in enumerate(self.cities):
+            RouteCity.objects.create(route=self.route, city=city, position=position,
+                                     arrival_date=today + timedelta(days=2 * position),
+                                     departure_date=today + timedelta(days=2 * position + 1))
+
+    def refresh(self, upstream, **kwargs):
+        with mock.patch("weather_api.openweather_client.upstream_get", upstream):
+            return fetch_and_save_forecasts_for_route(self.route, **kwargs)
+
+    def test_cities_are_fetched_concurrently_and_errors_are_collected(self):
+        upstream = FakeUpstream(failing={"City 1"}, delay=0.2)
+        result = self.refresh(upstream, max_workers=3)
+
+        self.assertEqual(sorted(upstream.calls), ["City 0", "City 1", "City 2"])
+        self.assertEqual(upstream.peak, 3)
+        self.assertEqual(list(result["errors"]), ["City 1"])
+        self.assertEqual(result["inserted"], 4)
+        self.assertFalse(ForecastData.objects.filter(city=self.cities[1]).exists())
+
+    def test_fresh_cities_are_skipped_and_unchanged_days_are_not_written(self):
+        upstream = FakeUpstream()
+        self.assertEqual(self.refresh(upstream)["inserted"], 6)
+
+        upstream.calls.clear()
+        result = self.refresh(upstream)
+        self.assertEqual((upstream.calls, result["skipped_cities"]), ([], 3))
+
+        result = self.refresh(upstream, force=True)
+        self.assertEqual((result["inserted"], result["updated"], result["unchanged"]), (0, 0, 6))
+        self.assertEqual(ForecastHistory.objects.count(), 6)
+
+        result = self.refresh(FakeUpstream(temp=25), force=True)
+        self.assertEqual((result["updated"], result["unchanged"]), (6, 0))
+        self.assertEqual(ForecastHistory.objects.count(), 12)
+
+    @override_settings(FORECAST_SHARING_RADIUS_KM=10)
+    def test_nearby_cities_share_one_coordinate_request(self):
+        for city, coordinates in zip(self.cities, [(50.0614, 19.9366), (50.0833, 19.9500)]):
+            city.latitude, city.longitude = coordinates
+            city.save(update_fields=["latitude", "longitude"])
+
+        upstream = FakeUpstream()
+        result = self.refresh(upstream)
+
+        self.assertEqual(sorted(upstream.calls, key=str), [(50.0614, 19.9366), "City 2"])
+        self.assertEqual(result["inserted"], 6)
+        self.assertTrue(ForecastData.objects.filter(city=self.cities[1]).exists())
+
+    def test_cached_responses_do_not_mark_cities_fresh_and_force_skips_cache(self):
+        upstream = FakeUpstream()
+        with mock.patch("weather_api.openweather_client.upstream_get", upstream):
+            OpenWeatherClient(api_key="key").get_daily_forecast_by_city("City 0")
+
+        result = self.refresh(upstream)
+        self.assertEqual(upstream.calls, ["City 0", "City 1", "City 2"])
+        self.assertEqual(result["inserted"], 6)
+        fetched_at = dict(City.objects.values_list("city_name", "forecasts_fetched_at"))
+        self.assertIsNone(fetched_at["City 0"])
+        self.assertIsNotNone(fetched_at["City 1"])
+
+        upstream.calls.clear()
+        self.refresh(upstream, force=True)
+        self.assertEqual(sorted(upstream.calls), ["City 0", "City 1", "City 2"])
+        self.assertFalse(City.objects.filter(forecasts_fetched_at__isnull=True).exists())
+
+
+class PrewarmTests(TestCase):
+    def setUp(self):
+        get_forecast_cache().clear()
+        self.addCleanup(get_forecast_cache().clear)
+        user = get_user_model().objects.create_user(username='traveller', password='password')
+        today = django_timezone.localdate()
+        stops = [("Upcoming", ["Kraków", "Gdańsk"], 1), ("Also upcoming", ["Kraków"], 3), ("Past", ["Opole"], -10)]
+        for name, city_names, offset in stops:
+            route = Route.objects.create(name=name, user=user, starts_at=today + timedelta(days=offset),
+                                         ends_at=today + timedelta(days=offset + 2))
+            for position, city_name in enumerate(city_names):
+                city, _ = City.objects.get_or_create(city_name=city_name)
+                RouteCity.objects.create(route=route, city=city, position=position,
+                                         arrival_date=route.starts_at, departure_date=route.ends_at)
+
+    def test_each_upcoming_city_is_fetched_once_bypassing_cache(self):
+        upstream = FakeUpstream()
+        with mock.patch("weather_api.openweather_client.upstream_get", upstream):
+            OpenWeatherClient(api_key="key").get_daily_forecast_by_city("Kraków")
+            upstream.calls.clear()
+            summary = prewarm_forecasts(batch_size=1, rate_limit=0)
+
+        self.assertEqual(sorted(upstream.calls), ["Gdańsk", "Kraków"])
+        self.assertEqual((summary["cities"], summary["errors"]), (2, {}))
+        # Kraków: okna obu tras (dni 1-5), Gdańsk: dni 1-3
+        self.assertEqual(summary["inserted"], 8)
+        self.assertFalse(ForecastData.objects.filter(city__city_name="Opole").exists())
+
+
+class FakeOpenWeatherServerTests(TestCase):
+    def setUp(self):
+        get_forecast_cache().clear()
+        self.addCleanup(get_forecast_cache().clear)
+        generator = DataGenerator(seed=1)
+        self.route = generator.routes(generator.users(1), generator.cities(3, with_coordinates=False),
+                                      per_user=1, stops=3)[0]
+
+    def test_route_refresh_over_http_retries_rate_limited_requests(self):
+        with FakeOpenWeatherServer(latency=0, rate_limit_rate=0.5, seed=3) as server, \
+                override_settings(OPENWEATHER_BASE_URL=server.url, OPENWEATHER_RATE_LIMIT=0,
+                                  OPENWEATHER_RETRIES=10, OPENWEATHER_RETRY_BACKOFF=0):
+            result = fetch_and_save_forecasts_for_route(self.route)
+
+        self.assertEqual(result["errors"], {})
+        self.assertEqual(server.statuses[200], 3)
+        self.assertGreater(server.statuses[429], 0)
+        days = sum((rc.departure_date - rc.arrival_date).days + 1 for rc in self.route.route_cities.all())
+        self.assertEqual(result["inserted"], days)
+        self.assertEqual(ForecastData.objects.count(), days)
+
+
+class GeocodingTests(TestCase):
+    def setUp(self):
+        for name, population, latitude in [("Kraków", 800000, 50.06), ("Krakow", 300, 41.9), ("Krasnystaw", 19000, 50.98)]:
+            GeoName.objects.create(name=name, normalized_name=normalize_name(name), latitude=latitude,
+                                   longitude=19.94, population=population)
+
+    def test_geocode_picks_most_populous_match_and_sees_new_imports(self):
+        self.assertEqual(normalize_name("  Kraków "), "krakow")
+        self.assertEqual(geocode("KRAKÓW"), (Decimal("50.060000"), Decimal("19.940000")))
+        self.assertIsNone(geocode("Łódź"))
+
+        GeoName.objects.create(name="Łódź", normalized_name="lodz", latitude=51.76, longitude=19.46, population=670000)
+        self.assertEqual(geocode("Lodz"), (Decimal("51.760000"), Decimal("19.460000")))
+
+    def test_search_prefix_orders_by_population(self):
+        self.assertEqual([geoname.name for geoname in search_prefix("kra")], ["Kraków", "Krasnystaw", "Krakow"])
+        self.assertEqual([geoname.name for geoname in search_prefix("Kra", limit=1)], ["Kraków"])
+        self.assertFalse(search_prefix("   ").exists())
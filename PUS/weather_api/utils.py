@@ -1,48 +1,329 @@
 from django.conf import settings
-from datetime import datetime
+from django.db import transaction
+from django.utils import timezone
+from asgiref.sync import sync_to_async
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import asyncio
+import contextvars
+import hashlib
+import json
 import requests
-from database_manager.models import ForecastData
-from .openweather_client import OpenWeatherClient
+from database_manager.geo import group_nearby_cities
+from database_manager.models import City, ForecastData, ForecastHistory
+from database_manager.partitions import ensure_history_partitions
+from .cache import make_cache_key, make_coordinates_cache_key
+from .openweather_client import OpenWeatherClient, AsyncOpenWeatherClient
+from .http import httpx
+from .ratelimit import Priority, RateLimitTimeout
+
+
+# dzienna prognoza OpenWeather obejmuje 16 dni
+FORECAST_DAYS = 16
+
+FORECAST_FIELDS = [
+    "temp", "feels_like", "pressure", "humidity", "min_temp", "max_temp", "clouds",
+    "wind_speed", "rain", "precipitation_probability", "description", "main_weather",
+]
+
+# klucze cache dla rodzajów zapytań z plan_upstream_requests (prognozy pobieramy w jednostkach metrycznych)
+PLAN_CACHE_KEYS = {
+    "coordinates": lambda latitude, longitude: make_coordinates_cache_key(latitude, longitude, "metric"),
+    "name": lambda city_name: make_cache_key(city_name, "metric"),
+}
+
+
+def build_forecast_defaults(forecast):
+    return {
+        "temp": forecast.get("temp", {}).get("day", 0),
+        "feels_like": forecast.get("feels_like", {}).get("day", 0),
+        "pressure": forecast.get("pressure", 0),
+        "humidity": forecast.get("humidity", 0),
+        "min_temp": forecast.get("temp", {}).get("min", 0),
+        "max_temp": forecast.get("temp", {}).get("max", 0),
+        "clouds": forecast.get("clouds", 0),
+        "wind_speed": forecast.get("speed", 0),
+        "rain": forecast.get("rain", 0),
+        "precipitation_probability": forecast.get("pop", 0),
+        "description": forecast.get("weather", [{}])[0].get("description", ""),
+        "main_weather": forecast.get("weather", [{}])[0].get("main", ""),
+    }
+
+
+def plan_upstream_requests(cities, radius_km=None):
+    """
+    Dzieli miasta na zapytania do OpenWeather: pobliskie miasta ze współrzędnymi
+    (ta sama komórka siatki, w promieniu radius_km) dzielą jedno zapytanie po współrzędnych,
+    miasta bez współrzędnych są pobierane po nazwie. Zwraca listę (kind, args, cities).
+    """
+    if radius_km is None:
+        radius_km = settings.FORECAST_SHARING_RADIUS_KM
+
+    cities = list({city.id: city for city in cities}.values())
+    located = [city for city in cities if city.has_coordinates]
+    plan = []
+    for group in group_nearby_cities(located, radius_km):
+        leader = group[0]
+        plan.append(("coordinates", (leader.latitude, leader.longitude), group))
+    for city in cities:
+        if not city.has_coordinates and city.city_name:
+            plan.append(("name", (city.city_name,), [city]))
+    return plan
+
+
+def fetch_forecasts(cities, max_workers=None, use_cache=True, radius_km=None, priority=Priority.INTERACTIVE,
+                    fetched=None):
+    """
+    Pobiera prognozy dla wielu miast równolegle (pula wątków).
+    Zwraca krotkę (results, errors): results indeksowane id miasta, errors - nazwą miasta.
+    Każde miasto jest pobierane tylko raz, a pobliskie miasta dzielą jedno zapytanie.
+    Do zbioru fetched (jeśli podany) trafiają id miast, których prognozy przyszły z OpenWeather, a nie z cache.
+    """
+    plan = plan_upstream_requests(cities, radius_km)
+    results = {}
+    errors = {}
+    if not plan:
+        return results, errors
+
+    if max_workers is None:
+        max_workers = settings.OPENWEATHER_MAX_WORKERS
+    max_workers = max(1, min(max_workers, len(plan)))
+
+    weather_client = OpenWeatherClient(api_key=settings.OPENWEATHER_API_KEY, use_cache=use_cache, priority=priority)
+    fetchers = {
+        "coordinates": weather_client.get_daily_forecast_by_coordinates,
+        "name": weather_client.get_daily_forecast_by_city,
+    }
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # zadania dziedziczą kontekst żądania (m.in. profil liczący czas zapytań do OpenWeather)
+        futures = [(executor.submit(contextvars.copy_context().run, fetchers[kind], *args), group)
+                   for kind, args, group in plan]
+        for future, group in futures:
+            try:
+                data = future.result()
+            except requests.RequestException as e:
+                errors.update({city.city_name: str(e) for city in group})
+            else:
+                results.update({city.id: data for city in group})
+
+    if fetched is not None:
+        fetched.update(upstream_city_ids(weather_client, plan, results))
+    return results, errors
+
+
+def upstream_city_ids(weather_client, plan, results):
+    return {
+        city.id
+        for kind, args, group in plan
+        for city in group
+        if city.id in results and weather_client.is_from_upstream(PLAN_CACHE_KEYS[kind](*args), results[city.id])
+    }
+
+
+def collect_forecasts(route_city, data, forecasts=None):
+    """Dodaje do słownika {(city_id, date): defaults} dni z okna pobytu w mieście."""
+    if forecasts is None:
+        forecasts = {}
+    days = OpenWeatherClient.filter_forecasts_by_dates(
+        data, route_city.arrival_date, route_city.departure_date
+    )
+    for forecast_date, forecast in days.items():
+        forecasts[(route_city.city_id, forecast_date)] = build_forecast_defaults(forecast)
+    return forecasts
+
+
+def forecast_hash(defaults):
+    payload = json.dumps(defaults, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+def load_forecast_hashes(route_cities):
+    """Skróty zapisanych prognoz z okien pobytu: {(city_id, date): content_hash} - jedno zapytanie."""
+    windows = [(rc.city_id, rc.arrival_date, rc.departure_date) for rc in route_cities]
+    rows = ForecastData.objects.for_windows(windows).values_list("city_id", "date", "content_hash")
+    return {(city_id, forecast_date): content_hash for city_id, forecast_date, content_hash in rows}
+
+
+def needs_refresh(route_city, hashes, fresh_after, today):
+    """Postój wymaga pobrania, jeśli miasto jest nieświeże albo brakuje dnia z okna (w horyzoncie prognozy)."""
+    fetched_at = route_city.city.forecasts_fetched_at
+    if fetched_at is None or fetched_at < fresh_after:
+        return True
+
+    day = max(route_city.arrival_date, today)
+    last_day = min(route_city.departure_date, today + timedelta(days=FORECAST_DAYS - 1))
+    while day <= last_day:
+        if (route_city.city_id, day) not in hashes:
+            return True
+        day += timedelta(days=1)
+    return False
+
+
+def bulk_save_forecasts(forecasts, hashes=None):
+    """
+    Zapisuje tylko nowe i zmienione prognozy jednym poleceniem
+    INSERT ... ON CONFLICT (city, date) DO UPDATE w jednej transakcji,
+    a ich nowe wersje dopisuje do archiwum ForecastHistory.
+    Zwraca krotkę (inserted, updated, unchanged).
+    """
+    if not forecasts:
+        return 0, 0, 0
+
+    fetched_at = timezone.now()
+    ensure_history_partitions({forecast_date for _, forecast_date in forecasts})
+    with transaction.atomic():
+        if hashes is None:
+            hashes = dict(
+                ((city_id, forecast_date), content_hash)
+                for city_id, forecast_date, content_hash in ForecastData.objects
+                .filter(city_id__in={city_id for city_id, _ in forecasts},
+                        date__in={forecast_date for _, forecast_date in forecasts})
+                .values_list("city_id", "date", "content_hash")
+            )
+
+        changed = []
+        inserted = updated = 0
+        for (city_id, forecast_date), defaults in forecasts.items():
+            content_hash = forecast_hash(defaults)
+            previous = hashes.get((city_id, forecast_date))
+            if previous == content_hash:
+                continue
+            if previous is None:
+                inserted += 1
+            else:
+                updated += 1
+            changed.append(ForecastData(city_id=city_id, date=forecast_date, content_hash=content_hash, **defaults))
+
+        if changed:
+            ForecastData.objects.bulk_create(
+                changed,
+                update_conflicts=True,
+                unique_fields=["city", "date"],
+                update_fields=FORECAST_FIELDS + ["content_hash", "updated_at"],
+            )
+            ForecastHistory.objects.bulk_create([
+                ForecastHistory(city_id=forecast.city_id, date=forecast.date, fetched_at=fetched_at,
+                                content_hash=forecast.content_hash,
+                                **{field: getattr(forecast, field) for field in FORECAST_FIELDS})
+                for forecast in changed
+            ])
+
+    return inserted, updated, len(forecasts) - inserted - updated
+
 
 def fetch_and_save_forecast(route_city):
-    city = route_city.city
-    arrival_date = route_city.arrival_date
-    departure_date = route_city.departure_date
-
-    if not city.city_name:
-        return
-
-    weather_client = OpenWeatherClient(api_key=settings.OPENWEATHER_API_KEY)
-
-    try:
-        data = weather_client.get_daily_forecast_by_city(city.city_name)
-    except requests.RequestException as e:
-        print(f"Błąd dla miasta: {city.city_name}: {e}")
-        return
-
-    forecasts = weather_client.filter_forecasts_by_dates(data, arrival_date, departure_date)
-
-    for forecast_date, forecast in forecasts.items():
-        defaults = {
-            "temp": forecast.get("temp", {}).get("day", 0),
-            "feels_like": forecast.get("feels_like", {}).get("day", 0),
-            "pressure": forecast.get("pressure", 0),
-            "humidity": forecast.get("humidity", 0),
-            "min_temp": forecast.get("temp", {}).get("min", 0),
-            "max_temp": forecast.get("temp", {}).get("max", 0),
-            "clouds": forecast.get("clouds", 0),
-            "wind_speed": forecast.get("speed", 0),
-            "rain": forecast.get("rain", 0),
-            "precipitation_probability": forecast.get("pop", 0),
-            "description": forecast.get("weather", [{}])[0].get("description", ""),
-            "main_weather": forecast.get("weather", [{}])[0].get("main", ""),
-        }
-        ForecastData.objects.update_or_create(
-            city=city,
-            date=forecast_date,
-            defaults=defaults
-        )
-
-def fetch_and_save_forecasts_for_route(route):
-    for route_city in route.route_cities.all():
-        fetch_and_save_forecast(route_city)
\ No newline at end of file
+    return fetch_and_save_forecasts_for_route_cities([route_city])
+
+
+def prepare_refresh(route_cities, now, force=False):
+    """
+    Część odświeżania przed pobieraniem: skróty zapisanych prognoz z okien pobytu
+    i odrzucenie świeżych postojów. Zwraca (postoje do pobrania, hashes, liczba pominiętych miast).
+    """
+    route_cities = list(route_cities)
+    hashes = load_forecast_hashes(route_cities)
+    requested_city_ids = {rc.city_id for rc in route_cities}
+
+    if not force:
+        fresh_after = now - timedelta(seconds=settings.FORECAST_FRESHNESS_SECONDS)
+        today = timezone.localdate()
+        route_cities = [rc for rc in route_cities if needs_refresh(rc, hashes, fresh_after, today)]
+
+    skipped_cities = len(requested_city_ids - {rc.city_id for rc in route_cities})
+    return route_cities, hashes, skipped_cities
+
+
+def save_refresh(route_cities, hashes, results, errors, skipped_cities, now, fetched):
+    """
+    Część odświeżania po pobraniu: zapis zmienionych dni i czasu pobrania miast - tylko tych,
+    których prognozy przyszły z OpenWeather (dane z cache mogą być starsze niż FORECAST_FRESHNESS_SECONDS).
+    """
+    forecasts = {}
+    for route_city in route_cities:
+        data = results.get(route_city.city_id)
+        if data is not None:
+            collect_forecasts(route_city, data, forecasts)
+
+    inserted, updated, unchanged = bulk_save_forecasts(forecasts, hashes)
+    if fetched:
+        City.objects.filter(id__in=fetched).update(forecasts_fetched_at=now)
+
+    return {
+        "inserted": inserted,
+        "updated": updated,
+        "unchanged": unchanged,
+        "skipped_cities": skipped_cities,
+        "errors": errors,
+    }
+
+
+def fetch_and_save_forecasts_for_route_cities(route_cities, max_workers=None, use_cache=True, force=False,
+                                              priority=Priority.INTERACTIVE):
+    """
+    Odświeża prognozy postojów. Pomija miasta pobrane w ciągu FORECAST_FRESHNESS_SECONDS,
+    jeśli mają już wszystkie dni z okna (chyba że force=True), i zapisuje tylko zmienione dni.
+    Zwraca słownik z licznikami wierszy, liczbą pominiętych miast i błędami pobierania.
+    """
+    now = timezone.now()
+    route_cities, hashes, skipped_cities = prepare_refresh(route_cities, now, force)
+    cities = {rc.city_id: rc.city for rc in route_cities}
+    fetched = set()
+    results, errors = fetch_forecasts(cities.values(), max_workers=max_workers, use_cache=use_cache, priority=priority,
+                                      fetched=fetched)
+    return save_refresh(route_cities, hashes, results, errors, skipped_cities, now, fetched)
+
+
+def fetch_and_save_forecasts_for_route(route, max_workers=None, force=False, priority=Priority.INTERACTIVE):
+    # wymuszone odświeżenie musi sięgnąć do OpenWeather, a nie do cache
+    return fetch_and_save_forecasts_for_route_cities(
+        route.route_cities.select_related("city"), max_workers=max_workers, use_cache=not force, force=force,
+        priority=priority
+    )
+
+
+async def afetch_forecasts(cities, use_cache=True, radius_km=None, fetched=None):
+    """
+    Asynchroniczna wersja fetch_forecasts: wszystkie zapytania są wysyłane naraz w pętli zdarzeń
+    (bez puli wątków), a ich równoległość ogranicza OPENWEATHER_ASYNC_MAX_CONNECTIONS.
+    """
+    plan = plan_upstream_requests(cities, radius_km)
+    results = {}
+    errors = {}
+    if not plan:
+        return results, errors
+
+    weather_client = AsyncOpenWeatherClient(api_key=settings.OPENWEATHER_API_KEY, use_cache=use_cache)
+    fetchers = {
+        "coordinates": weather_client.get_daily_forecast_by_coordinates,
+        "name": weather_client.get_daily_forecast_by_city,
+    }
+
+    outcomes = await asyncio.gather(*(fetchers[kind](*args) for kind, args, _ in plan), return_exceptions=True)
+    for outcome, (_, _, group) in zip(outcomes, plan):
+        if not isinstance(outcome, BaseException):
+            results.update({city.id: outcome for city in group})
+        elif isinstance(outcome, RateLimitTimeout) or (httpx is not None and isinstance(outcome, httpx.HTTPError)):
+            errors.update({city.city_name: str(outcome) for city in group})
+        else:
+            raise outcome
+
+    if fetched is not None:
+        fetched.update(upstream_city_ids(weather_client, plan, results))
+    return results, errors
+
+
+async def afetch_and_save_forecasts_for_route_cities(route_cities, use_cache=True, force=False):
+    """Asynchroniczna wersja fetch_and_save_forecasts_for_route_cities - praca na bazie odbywa się w wątku Django."""
+    now = timezone.now()
+    route_cities, hashes, skipped_cities = await sync_to_async(prepare_refresh)(route_cities, now, force)
+    cities = {rc.city_id: rc.city for rc in route_cities}
+    fetched = set()
+    results, errors = await afetch_forecasts(cities.values(), use_cache=use_cache, fetched=fetched)
+    return await sync_to_async(save_refresh)(route_cities, hashes, results, errors, skipped_cities, now, fetched)
+
+
+async def afetch_and_save_forecasts_for_route(route, force=False):
+    return await afetch_and_save_forecasts_for_route_cities(
+        route.route_cities.select_related("city"), use_cache=not force, force=force
+    )